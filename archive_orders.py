@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+订单归档：把已结束的年份（或季度）从主库移到分片库 shards/orders_<周期>.db
+
+用法：python archive_orders.py [数据库路径] [--before YYYY-MM-DD] [--period year|quarter] [--dry-run]
+
+- 默认归档当前周期之前、已经结束的全部周期；--before 指定截止日期（只归档在此之前结束的周期）
+- 服务可以照常运行：每个周期一个事务（复制到分片 + 从主库删除 + 登记），提交后各连接在下一次
+  工具调用时挂载新分片；周期越短，单个事务持有写锁的时间越短
+- 同一周期重复执行时把之后补录的订单并入已有分片
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date
+
+parser = argparse.ArgumentParser(description="把已结束周期的订单移到只读分片")
+parser.add_argument("db_path", nargs="?", help="数据库路径（默认 DB_PATH）")
+parser.add_argument("--before", type=date.fromisoformat, help="只归档在此日期之前结束的周期")
+parser.add_argument("--period", choices=("year", "quarter"), help="分片粒度（默认 SHARD_PERIOD）")
+parser.add_argument("--dry-run", action="store_true", help="只列出将要归档的周期")
+args = parser.parse_args()
+if args.db_path:
+    os.environ["DB_PATH"] = args.db_path
+
+from orders_mcp import db, shards  # noqa: E402
+from orders_mcp.config import DB_PATH, SHARD_DIR  # noqa: E402
+
+
+def main():
+    if not os.path.exists(DB_PATH):
+        raise SystemExit(f"数据库不存在: {DB_PATH}")
+    db.ensure_schema()
+    granularity = args.period or shards.SHARD_PERIOD
+    before = args.before or shards.bounds(shards.period_of(date.today(), granularity))[0]
+
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, timeout=30)
+    periods = shards.closed_periods(conn, before, granularity)
+    if not periods:
+        print(f"没有 {before} 之前结束的周期需要归档")
+        return
+    print(f"📦 归档到 {SHARD_DIR}: {', '.join(periods)}")
+    if args.dry_run:
+        return
+
+    for period in periods:
+        started = time.perf_counter()
+        moved = shards.archive(conn, period)
+        size = os.path.getsize(shards.registered_path(conn, period))
+        print(f"   {period}: {moved} 条订单, {size / 1024:.1f} KB, {time.perf_counter() - started:.2f}s")
+    conn.close()
+    print(f"✅ 归档完成，主库剩余大小 {os.path.getsize(DB_PATH) / 1024:.1f} KB（VACUUM 后回收空闲页）")
+
+
+if __name__ == "__main__":
+    main()
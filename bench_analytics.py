@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+基准测试：重型报表对交互调用的影响（报表读主库 vs 读分析快照）
+
+用法：python bench_analytics.py [数据库路径] [合成订单数] [每轮秒数] [报表并发数]
+
+在源数据库同目录下复制一份（同一文件系统）并补入合成订单，经 tools.call_tool 跑三轮
+（准入、查询预算、单写线程与服务一致）。每轮 INTERACTIVE 个任务随机调用 get_order_detail
+和 update_order_status，同时：
+- idle:     不跑报表（基线）
+- live:     N 个任务循环调用重型报表，带 max_staleness_seconds=0 在主库上执行
+- snapshot: 先建好分析快照，同样的报表按默认滞后上限读快照
+重型报表：带条件的 get_order_summary、get_orders_by_customer、exact 模式的 get_order_percentiles。
+输出交互调用各自的 p50 / p99 延迟与每秒完成的报表数。
+"""
+
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+SOURCE = sys.argv[1] if len(sys.argv) > 1 else "orders.db"
+ORDERS = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+SECONDS = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+REPORTERS = int(sys.argv[4]) if len(sys.argv) > 4 else 2
+INTERACTIVE = 4
+STATUSES = ("待付款", "已付款", "已发货", "已完成", "已取消")
+REPORTS = [
+    ("get_order_summary", {"aggregate": "sum", "field": "total_amount", "condition": "status = '已完成'"}),
+    ("get_order_summary", {"aggregate": "avg", "field": "quantity", "condition": "order_date >= '2024-06-01'"}),
+    ("get_orders_by_customer", {"group_by": "region_id"}),
+    ("get_order_percentiles", {"metric": "total_amount", "mode": "exact"}),
+]
+
+workdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(SOURCE)), prefix=".bench_analytics_")
+os.environ["DB_PATH"] = os.path.join(workdir, "orders.db")
+os.environ.setdefault("LOG_DIR", os.path.join(workdir, "logs"))
+os.environ.setdefault("CLIENT_RATE_LIMIT", "100000")  # 压测不受每客户端限速影响
+os.environ.setdefault("CLIENT_RATE_BURST", "100000")
+
+from orders_mcp import analytics, db, tools  # noqa: E402
+from orders_mcp.config import DB_PATH  # noqa: E402
+
+
+def _add_orders():
+    """按源库的客户、产品补入合成订单（固定种子），之后由 ensure_schema 建派生表"""
+    conn = sqlite3.connect(DB_PATH)
+    rng = random.Random(42)
+    customers = [row[0] for row in conn.execute("SELECT customer_id FROM customers")]
+    products = conn.execute("SELECT product_id, unit_price FROM products").fetchall()
+    start = date(2024, 1, 1)
+    rows = []
+    for i in range(ORDERS):
+        product_id, unit_price = rng.choice(products)
+        quantity = rng.randint(1, 50)
+        rows.append((
+            f"BA{i:08d}", rng.choice(customers), product_id, quantity, unit_price,
+            round(quantity * unit_price * rng.uniform(0.8, 1.0), 2),
+            (start + timedelta(days=rng.randrange(730))).isoformat(), rng.choice(STATUSES),
+            f"测试地址{i % 500}号", f"订单备注{i}",
+        ))
+    with conn:
+        conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    order_ids = [row[0] for row in conn.execute("SELECT order_id FROM orders")]
+    conn.close()
+    return order_ids
+
+
+async def _interactive(order_ids, stop, latencies):
+    rng = random.Random()
+    while not stop.is_set():
+        order_id = rng.choice(order_ids)
+        if rng.random() < 0.5:
+            name, args = "get_order_detail", {"order_id": order_id}
+        else:
+            name, args = "update_order_status", {"order_id": order_id, "new_status": rng.choice(STATUSES)}
+        started = time.perf_counter()
+        await tools.call_tool(name, args, client="interactive")
+        latencies[name].append(time.perf_counter() - started)
+
+
+async def _reporter(stop, extra, done):
+    rng = random.Random()
+    while not stop.is_set():
+        name, args = rng.choice(REPORTS)
+        # limit 各不相同，避免并发的相同调用被合并成一次
+        await tools.call_tool(name, {**args, "limit": rng.randint(5, 50), **extra}, client="report")
+        done.append(1)
+
+
+async def _round(order_ids, reporters, extra):
+    stop = asyncio.Event()
+    latencies = {"get_order_detail": [], "update_order_status": []}
+    done = []
+    tasks = [asyncio.create_task(_interactive(order_ids, stop, latencies)) for _ in range(INTERACTIVE)]
+    tasks += [asyncio.create_task(_reporter(stop, extra, done)) for _ in range(reporters)]
+    await asyncio.sleep(SECONDS)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return latencies, len(done) / SECONDS
+
+
+def _pick(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else float("nan")
+
+
+async def _main():
+    order_ids = _add_orders()
+    db.init_database()
+    print(f"{len(order_ids)} 条订单，每轮 {SECONDS:g}s，{INTERACTIVE} 个交互任务，{REPORTERS} 个报表任务")
+    print(f"\n{'mode':>8} {'detail p50':>11} {'detail p99':>11} {'update p50':>11} {'update p99':>11} {'reports/s':>10}")
+    for mode in ("idle", "live", "snapshot"):
+        if mode == "snapshot":
+            await asyncio.to_thread(analytics.build)
+        latencies, rate = await _round(
+            order_ids, 0 if mode == "idle" else REPORTERS,
+            {"max_staleness_seconds": 0} if mode == "live" else {},
+        )
+        detail, update = latencies["get_order_detail"], latencies["update_order_status"]
+        print(f"{mode:>8} {_pick(detail, 0.5):>11.2f} {_pick(detail, 0.99):>11.2f} "
+              f"{_pick(update, 0.5):>11.2f} {_pick(update, 0.99):>11.2f} {rate:>10.1f}")
+
+
+def main():
+    try:
+        shutil.copy(SOURCE, DB_PATH)
+        asyncio.run(_main())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
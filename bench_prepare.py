@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+基准测试：语句 prepare 开销（新连接 + 拼接 SQL vs 持久连接 + 固定模板）
+
+用法：python bench_prepare.py [数据库路径] [迭代次数]
+
+- before: 旧写法，每次调用新建连接，LIMIT / ORDER 直接拼进 SQL 文本
+- after:  当前写法，线程内持久连接 + queries.py 中的固定模板（语句缓存命中）
+- after (cache off): 同样的模板但 cached_statements=0，用来单独衡量 prepare 本身的开销
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import time
+
+os.environ.setdefault("DB_PATH", sys.argv[1] if len(sys.argv) > 1 else "orders.db")
+
+from orders_mcp import queries  # noqa: E402
+from orders_mcp.config import DB_PATH  # noqa: E402
+from orders_mcp.db import CACHED_STATEMENTS  # noqa: E402
+
+ITERATIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+
+def _workload():
+    """模拟一组典型工具调用：(分组字段, 排序, limit, 状态, 客户)"""
+    rng = random.Random(42)
+    return [
+        (
+            rng.choice(["customer_id", "region_id"]),
+            rng.choice(queries.SORT_ORDERS),
+            rng.randint(1, 20),
+            rng.choice([None, "已完成", "已发货"]),
+            rng.choice([None, "C001", "C002"]),
+        )
+        for _ in range(ITERATIONS)
+    ]
+
+
+def run_before(workload):
+    for group_by, order, limit, status, customer_id in workload:
+        field = "c.customer_name" if group_by == "customer_id" else "c.region_id"
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute(f"""
+            SELECT {field} as grp, SUM(o.total_amount) as total,
+                   AVG(o.total_amount) as avgAmt, COUNT(*) as cnt
+            FROM orders o JOIN customers c ON o.customer_id = c.customer_id
+            GROUP BY {field}
+            ORDER BY total {order}
+            LIMIT {limit}
+        """).fetchall()
+        conn.close()
+
+        conn = sqlite3.connect(DB_PATH)
+        sql = "SELECT o.order_id FROM orders o WHERE 1=1"
+        params = []
+        if status:
+            sql += " AND o.status = ?"
+            params.append(status)
+        if customer_id:
+            sql += " AND o.customer_id = ?"
+            params.append(customer_id)
+        sql += f" ORDER BY o.order_date DESC LIMIT {limit} OFFSET 0"
+        conn.execute(sql, params).fetchall()
+        conn.close()
+
+
+def run_after(workload, cached_statements):
+    conn = sqlite3.connect(DB_PATH, cached_statements=cached_statements)
+    for group_by, order, limit, status, customer_id in workload:
+        conn.execute(queries.ORDERS_BY_GROUP[(group_by, order)], [limit]).fetchall()
+
+        params = [p for p in (status, customer_id) if p] + [limit, 0]
+        conn.execute(queries.LIST_ORDERS[(bool(status), bool(customer_id))], params).fetchall()
+    conn.close()
+
+
+def bench(label, fn, *args):
+    workload = _workload()
+    start = time.perf_counter()
+    fn(workload, *args)
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / (len(workload) * 2) * 1e6
+    print(f"{label:<32} {elapsed:8.3f}s  {per_call:8.1f} µs/query")
+    return per_call
+
+
+if __name__ == "__main__":
+    print(f"📁 数据库: {DB_PATH}, {ITERATIONS} 轮 × 2 条查询")
+    before = bench("before (new conn, f-string)", run_before)
+    no_cache = bench("after (cache off)", run_after, 0)
+    after = bench(f"after (cached_statements={CACHED_STATEMENTS})", run_after, CACHED_STATEMENTS)
+    print(f"\nprepare 开销约 {no_cache - after:.1f} µs/query；整体提速 {before / after:.1f}x")
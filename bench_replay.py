@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+负载回放：把 commands.csv 中用户的真实问题映射为 agent 实际发出的工具调用序列，按设定速率与并发回放
+
+用法：
+    python bench_replay.py                               # 启动临时服务（数据库复制到临时目录），POST / 回放 60 秒
+    python bench_replay.py --transport rest --rate 5 --concurrency 20 --duration 120
+    python bench_replay.py --url http://localhost:8000 --read-only
+    python bench_replay.py --save-baseline baseline.json  # 保存本次结果作为基线
+    python bench_replay.py --baseline baseline.json       # 与基线对比，p95 退化超过 --max-regression 时退出码为 1
+
+- 每个“会话”对应 commands.csv 中随机抽取的一条问题，按 COMMAND_SEQUENCES 依次调用工具，
+  调用之间插入对数正态分布的思考时间（LLM 生成下一步的耗时，中位数 --think-ms）
+- 会话按泊松过程到达（--rate 每秒），同时进行的会话不超过 --concurrency
+- --traffic 读取 uvicorn 访问日志（mcp_http.log），按其中的比例混入 GET /health、GET /、/openapi.json 等请求
+- 传输方式：root-post（POST /，Copilot Studio）、rest（POST /tools/{name}）、sse（GET /sse + POST /messages）
+- 按类别输出会话吞吐与单次调用延迟的 p50 / p95 / p99（不含思考时间）
+
+“Update Order”类会修改订单状态；对线上服务回放时加 --read-only 跳过。
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import httpx
+
+BASE_DIR = Path(__file__).resolve().parent
+INIT_PARAMS = {
+    "protocolVersion": "2025-06-18",
+    "capabilities": {},
+    "clientInfo": {"name": "bench-replay", "version": "1.0"},
+}
+WRITE_CATEGORIES = {"Update Order"}
+BACKGROUND_CATEGORY = "Background"
+
+# commands.csv 中的问题 → agent 实际发出的工具调用序列（先查再改、先找客户再列订单等）
+COMMAND_SEQUENCES = {
+    "What is the total order amount for this month?": [
+        ("get_order_summary", {"aggregate": "sum", "field": "total_amount", "condition": "order_date >= '2026-02-01'"}),
+    ],
+    "How many completed orders are there?": [
+        ("get_order_summary", {"aggregate": "count", "field": "total_amount", "condition": "status = '已完成'"}),
+    ],
+    "What is the average order amount?": [
+        ("get_order_summary", {"aggregate": "avg", "field": "total_amount"}),
+    ],
+    "What is the max order amount?": [
+        ("get_order_summary", {"aggregate": "max", "field": "total_amount"}),
+    ],
+    "Show top 10 customers by total order amount": [
+        ("get_orders_by_customer", {"group_by": "customer_id", "order": "DESC", "limit": 10}),
+    ],
+    "Show total and average order amounts by region": [
+        ("get_orders_by_customer", {"group_by": "region_id", "order": "DESC", "limit": 10}),
+    ],
+    "Show me the latest 5 orders": [
+        ("list_orders", {"limit": 5}),
+    ],
+    "Show all shipped orders": [
+        ("list_orders", {"status": "已发货", "limit": 50}),
+    ],
+    "Show all orders from Alibaba": [
+        ("get_customers", {}),
+        ("list_orders", {"customer_id": "C001", "limit": 50}),
+    ],
+    "Show all orders in February 2026": [
+        ("get_orders_by_date_range", {"start_date": "2026-02-01", "end_date": "2026-02-28"}),
+    ],
+    "Show orders between 2026-01-01 and 2026-02-15": [
+        ("get_orders_by_date_range", {"start_date": "2026-01-01", "end_date": "2026-02-15"}),
+    ],
+    "Show completed orders in February": [
+        ("get_orders_by_date_range", {"start_date": "2026-02-01", "end_date": "2026-02-28", "status": "已完成"}),
+    ],
+    "Show details for order OR20250001": [
+        ("get_order_detail", {"order_id": "OR20250001"}),
+    ],
+    "Change order OR20250001 status to shipped": [
+        ("get_order_detail", {"order_id": "OR20250001"}),
+        ("update_order_status", {"order_id": "OR20250001", "new_status": "已发货"}),
+    ],
+    "Change order OR20250001 status to completed": [
+        ("get_order_detail", {"order_id": "OR20250001"}),
+        ("update_order_status", {"order_id": "OR20250001", "new_status": "已完成"}),
+    ],
+    "Change order OR20250001 status to cancelled": [
+        ("get_order_detail", {"order_id": "OR20250001"}),
+        ("update_order_status", {"order_id": "OR20250001", "new_status": "已取消"}),
+    ],
+    "Show customer list": [
+        ("get_customers", {}),
+    ],
+    "Show customers in East China region": [
+        ("get_customers", {"region_id": "R001"}),
+    ],
+    "Show product list": [
+        ("get_products", {}),
+    ],
+    "Show hardware products": [
+        ("get_products", {"category": "硬件"}),
+    ],
+}
+
+_ACCESS_LINE = re.compile(r'"(GET|POST) (\S+) HTTP/[\d.]+" (\d{3})')
+
+
+def load_commands(path, read_only):
+    """[(类别, 调用序列)]，commands.csv 中每行一条"""
+    commands = []
+    with open(path, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            category, text = row["Category"], row["Example Command"]
+            if read_only and category in WRITE_CATEGORIES:
+                continue
+            sequence = COMMAND_SEQUENCES.get(text)
+            if sequence is None:
+                print(f"⚠️ 没有对应的调用序列，跳过: {text}", file=sys.stderr)
+                continue
+            commands.append((category, sequence))
+    return commands
+
+
+def load_traffic(path):
+    """访问日志中的非工具请求及其比例：(相对工具会话的次数比, [(方法, 路径)])"""
+    requests = []
+    tool_calls = 0
+    for line in Path(path).read_text(encoding="utf-8", errors="replace").splitlines():
+        match = _ACCESS_LINE.search(line)
+        if not match:
+            continue
+        method, path, _status = match.groups()
+        if method == "POST" or path.startswith(("/mcp", "/messages", "/sse")):
+            tool_calls += 1  # 工具调用与会话由 commands.csv 驱动
+        elif path in ("/", "/health", "/openapi.json", "/metrics"):
+            requests.append((method, path))
+    if not requests:
+        return 0.0, []
+    # 日志里没有工具调用时，按每个会话一条后台请求计
+    return len(requests) / max(tool_calls, len(requests)), requests
+
+
+def think_time(median_ms, sigma):
+    return random.lognormvariate(0, sigma) * median_ms / 1000 if median_ms > 0 else 0
+
+
+def _rpc(id_, method, params=None):
+    message = {"jsonrpc": "2.0", "method": method}
+    if id_ is not None:
+        message["id"] = id_
+    if params is not None:
+        message["params"] = params
+    return message
+
+
+def _check(response, body):
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    if isinstance(body, dict) and ("error" in body or body.get("success") is False):
+        raise RuntimeError(str(body.get("error"))[:200])
+
+
+class RootPostSession:
+    def __init__(self, client):
+        self.client = client
+        self.next_id = 0
+
+    async def open(self):
+        await self.client.post("/", json=_rpc(0, "initialize", INIT_PARAMS))
+        await self.client.post("/", json=_rpc(None, "notifications/initialized"))
+
+    async def call(self, name, arguments):
+        self.next_id += 1
+        response = await self.client.post("/", json=_rpc(self.next_id, "tools/call", {"name": name, "arguments": arguments}))
+        _check(response, response.json())
+
+    async def close(self):
+        pass
+
+
+class RestSession(RootPostSession):
+    async def open(self):
+        pass
+
+    async def call(self, name, arguments):
+        response = await self.client.post(f"/tools/{name}", json=arguments)
+        _check(response, response.json())
+
+
+class SseSession(RootPostSession):
+    """旧版 SSE：每个会话一条 /sse 长连接，结果从事件流返回"""
+
+    async def open(self):
+        self.stream = await self.client.send(self.client.build_request("GET", "/sse"), stream=True)
+        self.lines = self.stream.aiter_lines()
+        self.endpoint = (await self._next_event())["data"]
+        await self._request(0, "initialize", INIT_PARAMS)
+        await self._request(None, "notifications/initialized")
+
+    async def _next_event(self):
+        event = {}
+        async for line in self.lines:
+            if not line:
+                return event
+            key, _, value = line.partition(":")
+            event[key] = value.strip()
+        raise RuntimeError("SSE stream closed")
+
+    async def _request(self, id_, method, params=None):
+        response = await self.client.post(self.endpoint, json=_rpc(id_, method, params))
+        if response.status_code >= 300:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        if id_ is None:
+            return None
+        while True:
+            event = await self._next_event()
+            if "data" in event:
+                message = json.loads(event["data"])
+                if message.get("id") == id_:
+                    return message
+
+    async def call(self, name, arguments):
+        self.next_id += 1
+        message = await self._request(self.next_id, "tools/call", {"name": name, "arguments": arguments})
+        if "error" in message or message.get("result", {}).get("isError"):
+            raise RuntimeError(str(message.get("error") or message["result"]["content"])[:200])
+
+    async def close(self):
+        if getattr(self, "stream", None) is not None:
+            await self.stream.aclose()
+
+
+TRANSPORTS = {"root-post": RootPostSession, "rest": RestSession, "sse": SseSession}
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # 类别 → 单次调用延迟（秒）
+        self.sessions = Counter()
+        self.errors = Counter()
+        self.rejected = Counter()
+
+    def report(self, elapsed):
+        result = {}
+        for category in sorted(set(self.latencies) | set(self.sessions) | set(self.errors)):
+            latencies = sorted(self.latencies[category])
+            result[category] = {
+                "sessions": self.sessions[category],
+                "calls": len(latencies),
+                "errors": self.errors[category],
+                "rejected": self.rejected[category],
+                "throughput": round(self.sessions[category] / elapsed, 3),
+                "p50_ms": _percentile(latencies, 50),
+                "p95_ms": _percentile(latencies, 95),
+                "p99_ms": _percentile(latencies, 99),
+            }
+        # 汇总只统计工具调用会话，不含后台请求
+        tools = [c for c in result if c != BACKGROUND_CATEGORY]
+        everything = sorted(x for c in tools for x in self.latencies[c])
+        sessions = sum(self.sessions[c] for c in tools)
+        result["ALL"] = {
+            "sessions": sessions,
+            "calls": len(everything),
+            "errors": sum(self.errors[c] for c in tools),
+            "rejected": sum(self.rejected[c] for c in tools),
+            "throughput": round(sessions / elapsed, 3),
+            "p50_ms": _percentile(everything, 50),
+            "p95_ms": _percentile(everything, 95),
+            "p99_ms": _percentile(everything, 99),
+        }
+        return result
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000, 1)
+
+
+async def run_session(client, transport, category, sequence, stats, args):
+    session = TRANSPORTS[transport](client)
+    try:
+        await session.open()
+        for index, (name, arguments) in enumerate(sequence):
+            if index:
+                await asyncio.sleep(think_time(args.think_ms, args.think_sigma))
+            start = time.perf_counter()
+            try:
+                await session.call(name, arguments)
+            except (RuntimeError, httpx.HTTPError) as e:
+                stats.errors[category] += 1
+                if "429" in str(e) or "retry_after" in str(e):
+                    stats.rejected[category] += 1
+                return
+            finally:
+                stats.latencies[category].append(time.perf_counter() - start)
+        stats.sessions[category] += 1
+    except (RuntimeError, httpx.HTTPError):
+        stats.errors[category] += 1
+    finally:
+        await session.close()
+
+
+async def run_background(client, method, path, stats):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, path)
+        if response.status_code >= 400:
+            stats.errors[BACKGROUND_CATEGORY] += 1
+    except httpx.HTTPError:
+        stats.errors[BACKGROUND_CATEGORY] += 1
+    stats.latencies[BACKGROUND_CATEGORY].append(time.perf_counter() - start)
+    stats.sessions[BACKGROUND_CATEGORY] += 1
+
+
+async def replay(base_url, args):
+    commands = load_commands(args.commands, args.read_only)
+    background_ratio, background = load_traffic(args.traffic) if args.traffic else (0.0, [])
+    stats = Stats()
+    limit = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+
+    async def guarded(coro):
+        async with limit:
+            await coro
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits,
+                                 headers={"X-Client-Id": "bench-replay"}) as client:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        while time.perf_counter() < deadline:
+            category, sequence = random.choice(commands)
+            task = asyncio.create_task(guarded(run_session(client, args.transport, category, sequence, stats, args)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if background and random.random() < background_ratio:
+                task = asyncio.create_task(run_background(client, *random.choice(background), stats))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.sleep(random.expovariate(args.rate))
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return stats.report(elapsed), elapsed
+
+
+def print_report(report, baseline=None):
+    print(f"{'category':<14} {'sessions':>8} {'calls':>6} {'errors':>6} {'sess/s':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}" + ("   p95 vs baseline" if baseline else ""))
+    for category, row in report.items():
+        line = (f"{category:<14} {row['sessions']:>8} {row['calls']:>6} {row['errors']:>6} {row['throughput']:>7.2f} "
+                f"{_fmt(row['p50_ms'])} {_fmt(row['p95_ms'])} {_fmt(row['p99_ms'])}")
+        change = _change(row, baseline.get(category)) if baseline else None
+        if change is not None:
+            line += f"   {change:+.1%}"
+        print(line)
+
+
+def _fmt(value):
+    return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+
+
+def _change(row, base):
+    if not base or not base.get("p95_ms") or row["p95_ms"] is None:
+        return None
+    return row["p95_ms"] / base["p95_ms"] - 1
+
+
+def regressions(report, baseline, threshold):
+    """p95 延迟比基线差超过 threshold、或吞吐低于基线超过 threshold 的类别"""
+    worse = []
+    for category, row in report.items():
+        base = baseline.get(category)
+        if not base:
+            continue
+        change = _change(row, base)
+        if change is not None and change > threshold:
+            worse.append(f"{category}: p95 {base['p95_ms']} → {row['p95_ms']} ms")
+        if base.get("throughput") and row["throughput"] < base["throughput"] * (1 - threshold):
+            worse.append(f"{category}: throughput {base['throughput']} → {row['throughput']} sess/s")
+    return worse
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_healthy(base_url):
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(100):
+            try:
+                await client.get("/health")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="按 commands.csv 回放真实工作负载")
+    parser.add_argument("--url", help="目标服务地址；不指定时启动临时服务")
+    parser.add_argument("--transport", choices=sorted(TRANSPORTS), default="root-post")
+    parser.add_argument("--rate", type=float, default=2.0, help="每秒新会话数（泊松到达）")
+    parser.add_argument("--concurrency", type=int, default=10, help="同时进行的会话上限")
+    parser.add_argument("--duration", type=float, default=60, help="回放秒数")
+    parser.add_argument("--think-ms", type=float, default=800, help="调用之间思考时间的中位数（毫秒），0 表示不等待")
+    parser.add_argument("--think-sigma", type=float, default=0.6, help="思考时间对数正态分布的 sigma")
+    parser.add_argument("--commands", default=str(BASE_DIR / "commands.csv"))
+    parser.add_argument("--traffic", help="uvicorn 访问日志（如 mcp_http.log），按比例混入非工具请求")
+    parser.add_argument("--read-only", action="store_true", help="跳过修改订单的类别")
+    parser.add_argument("--baseline", help="与保存的基线 JSON 对比")
+    parser.add_argument("--save-baseline", help="把本次结果保存为基线 JSON")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的 p95 / 吞吐退化比例")
+    parser.add_argument("--seed", type=int, help="随机种子（便于重复同一负载）")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    server = workdir = None
+    base_url = args.url
+    if base_url is None:
+        workdir = Path(tempfile.mkdtemp())
+        shutil.copy(BASE_DIR / "orders.db", workdir / "orders.db")
+        port = _free_port()
+        env = {**os.environ, "PORT": str(port), "DB_PATH": str(workdir / "orders.db"),
+               "CHARTS_DIR": str(workdir / "charts"), "LOG_DIR": str(workdir / "logs")}
+        server = subprocess.Popen(
+            [sys.executable, str(BASE_DIR / "mcp_server_http.py")],
+            env=env, cwd=str(BASE_DIR), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        await _wait_healthy(base_url)
+        print(f"回放 {args.duration:g}s：{args.transport}，{args.rate:g} 会话/秒，并发 ≤ {args.concurrency}，"
+              f"思考时间中位数 {args.think_ms:g}ms")
+        report, _elapsed = await replay(base_url, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["categories"] if args.baseline else None
+    print_report(report, baseline)
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps({
+            "transport": args.transport, "rate": args.rate, "concurrency": args.concurrency,
+            "think_ms": args.think_ms, "categories": report,
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"💾 基线已保存: {args.save_baseline}")
+    if baseline:
+        worse = regressions(report, baseline, args.max_regression)
+        for line in worse:
+            print(f"❌ {line}")
+        if worse:
+            sys.exit(1)
+        print("✅ 未超出基线")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+基准测试：orders 表原地转换为紧凑编码前后（同一份数据、同一个文件）
+
+用法：python bench_storage.py [数据库路径] [订单数] [迭代次数]
+
+从源数据库复制客户、产品，按其订单分布生成指定数量的合成订单，建出原始布局（regions / customers /
+products / orders 四张表，orders 为文本日期 / 状态、REAL 金额，外加旧版本在它上面建的日期覆盖索引），
+复制一份后执行 db.ensure_schema()：orders 原地转换为 order_facts + orders 视图（与 migrate_db.py 相同），
+全文索引、草图、变更日志、快照表等也全部建好，并冻结月度快照。比较：
+- VACUUM 后的文件大小，订单存储本身（转换前 orders 表及其索引，转换后 order_facts 及其索引）的大小，
+  以及 dbstat 统计的各表 / 索引大小
+- 订单表上的扫描（日期区间、按状态分组、按月分桶求和）：转换前读文本列，转换后读编码列（queries.py 的模板），
+  以及转换后照原 SQL 经 orders 视图读
+- 热路径查询耗时（转换前用最初的 JOIN 查询，转换后用 queries.py 中的模板）与一批状态更新的耗时（含触发器维护）
+两边交替执行，取多轮中的最好成绩。
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+SOURCE = sys.argv[1] if len(sys.argv) > 1 else "orders.db"
+ORDERS = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+ITERATIONS = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+ROUNDS = 5
+UPDATES = 1000
+BASE_TABLES = ("regions", "customers", "products", "orders")
+# 转换前 ensure_schema 在 orders 上建的日期覆盖索引（转换时随 orders 表删除，改建在 order_facts 的编码列上）
+OLD_DATE_INDEX = "CREATE INDEX idx_orders_order_date ON orders(order_date, status, total_amount, quantity)"
+
+workdir = tempfile.mkdtemp(prefix="bench_storage_")
+BASELINE_PATH = os.path.join(workdir, "baseline.db")
+os.environ["DB_PATH"] = os.path.join(workdir, "current.db")
+os.environ.setdefault("LOG_DIR", os.path.join(workdir, "logs"))
+
+from orders_mcp import db, queries, snapshots  # noqa: E402
+from orders_mcp.config import DB_PATH  # noqa: E402
+
+# 订单表上的扫描：(名称, 转换前 SQL, 转换后 SQL, 参数)。转换前 SQL 也在转换后的库上经 orders 视图执行一次
+SCANS = [
+    (
+        "trend by month (2 years)",
+        "SELECT substr(order_date, 1, 7) || '-01' AS bucket, COUNT(*), SUM(total_amount), SUM(quantity)"
+        " FROM orders WHERE order_date BETWEEN ? AND ? GROUP BY bucket",
+        queries.ORDER_TREND["month", False],
+        ["2024-01-01", "2025-12-31"],
+    ),
+    (
+        "trend by day + status (1 quarter)",
+        "SELECT order_date AS bucket, COUNT(*), SUM(total_amount), SUM(quantity)"
+        " FROM orders WHERE order_date BETWEEN ? AND ? AND status = ? GROUP BY bucket",
+        queries.ORDER_TREND["day", True],
+        ["2025-01-01", "2025-03-31", "已完成"],
+    ),
+    (
+        "count / sum by status",
+        "SELECT status, COUNT(*), SUM(total_amount) FROM orders GROUP BY status",
+        "SELECT status_code, COUNT(*), SUM(amount_cents) / 100.0 FROM order_facts GROUP BY status_code",
+        [],
+    ),
+    (
+        "sum of amounts",
+        "SELECT SUM(total_amount) FROM orders",
+        "SELECT SUM(amount_cents) / 100.0 FROM order_facts",
+        [],
+    ),
+]
+
+# 热路径：(名称, 原始布局 SQL, 当前布局 SQL, 原始参数, 当前参数)；原始 SQL 与最初的工具实现相同
+HOT_QUERIES = [
+    (
+        "order detail",
+        "SELECT o.*, c.customer_name, c.phone, p.product_name FROM orders o"
+        " JOIN customers c ON o.customer_id = c.customer_id JOIN products p ON o.product_id = p.product_id"
+        " WHERE o.order_id = ?",
+        queries.ORDER_DETAIL,
+        ["BS00123456"], ["BS00123456"],
+    ),
+    (
+        "date range (1 month)",
+        "SELECT o.order_id, c.customer_name, o.total_amount, o.order_date, o.status FROM orders o"
+        " JOIN customers c ON o.customer_id = c.customer_id WHERE o.order_date BETWEEN ? AND ?"
+        " ORDER BY o.order_date DESC",
+        queries.ORDERS_BY_DATE_RANGE[False],
+        ["2025-03-01", "2025-03-31"], ["2025-03-01", "2025-03-31", 0],
+    ),
+    (
+        "status + date range",
+        "SELECT o.order_id, c.customer_name, o.total_amount, o.order_date, o.status FROM orders o"
+        " JOIN customers c ON o.customer_id = c.customer_id WHERE o.order_date BETWEEN ? AND ? AND o.status = ?"
+        " ORDER BY o.order_date DESC",
+        queries.ORDERS_BY_DATE_RANGE[True],
+        ["2025-01-01", "2025-06-30", "已完成"], ["2025-01-01", "2025-06-30", "已完成", 0],
+    ),
+    (
+        "list orders (customer)",
+        "SELECT o.order_id, c.customer_name, p.product_name, o.quantity, o.total_amount, o.order_date, o.status"
+        " FROM orders o JOIN customers c ON o.customer_id = c.customer_id"
+        " JOIN products p ON o.product_id = p.product_id WHERE 1=1 AND o.customer_id = ?"
+        " ORDER BY order_date DESC LIMIT ? OFFSET ?",
+        queries.LIST_ORDERS[False, True],
+        ["C001", 20, 0], ["C001", 20, 0],
+    ),
+    (
+        "sum by customer",
+        queries.ORDERS_BY_GROUP["customer_id", "DESC"],
+        queries.ORDERS_BY_GROUP["customer_id", "DESC"],
+        [10], [10],
+    ),
+    (
+        "summary with condition",
+        queries.ORDER_SUMMARY["sum", "total_amount"] + " WHERE status = '已完成'",
+        queries.ORDER_SUMMARY["sum", "total_amount"] + " WHERE status = '已完成'",
+        [], [],
+    ),
+]
+
+
+def _synthetic_orders(source):
+    """按源数据库的客户、产品、状态生成合成订单（固定种子）"""
+    rng = random.Random(42)
+    customers = [row[0] for row in source.execute("SELECT customer_id FROM customers")]
+    products = source.execute("SELECT product_id, unit_price FROM products").fetchall()
+    statuses = [row[0] for row in source.execute("SELECT status FROM orders")] or list(db.STATUSES)
+    start = date(2024, 1, 1)
+    for i in range(ORDERS):
+        product_id, unit_price = rng.choice(products)
+        quantity = rng.randint(1, 50)
+        yield (
+            f"BS{i:08d}", rng.choice(customers), product_id, quantity, unit_price,
+            round(quantity * unit_price * rng.uniform(0.8, 1.0), 2),
+            (start + timedelta(days=rng.randrange(730))).isoformat(), rng.choice(statuses),
+            f"测试地址{i % 500}号", f"订单备注{i}",
+        )
+
+
+def _build_baseline(source):
+    conn = sqlite3.connect(BASELINE_PATH)
+    for table in BASE_TABLES:
+        (ddl,) = source.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", [table]).fetchone()
+        conn.execute(ddl)
+    conn.execute("ATTACH DATABASE ? AS src", [os.path.abspath(SOURCE)])
+    for table in BASE_TABLES[:3]:
+        conn.execute(f"INSERT INTO {table} SELECT * FROM src.{table}")
+    conn.commit()
+    conn.execute("DETACH DATABASE src")
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", _synthetic_orders(source))
+    conn.execute(OLD_DATE_INDEX)
+    conn.commit()
+    conn.close()
+
+
+def _build_current():
+    shutil.copy(BASELINE_PATH, DB_PATH)
+    db.ensure_schema()  # orders 原地转换为紧凑编码，与 migrate_db.py 相同
+    conn = sqlite3.connect(DB_PATH)
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'orders'").fetchone() == ("view",)
+    with conn:
+        snapshots.refresh(conn)
+    conn.close()
+
+
+def _open(path):
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    conn.execute("ANALYZE")
+    return conn
+
+
+def _object_sizes(conn):
+    try:
+        return dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    except sqlite3.OperationalError:
+        return {}  # 未编译 SQLITE_ENABLE_DBSTAT_VTAB
+
+
+def _table_size(conn, objects, table):
+    """表及其全部索引的大小"""
+    names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE tbl_name = ? AND type IN ('table', 'index')", [table])]
+    return sum(objects.get(name, 0) for name in names)
+
+
+def _time_query(conn, sql, params):
+    """一轮 ITERATIONS 次的平均耗时（毫秒）与结果"""
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        rows = conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - started) / ITERATIONS * 1000, rows
+
+
+def _best(runs):
+    """runs：[(连接, SQL, 参数)]；交替执行 ROUNDS 轮，返回各自的最好成绩（毫秒）与最后一轮的结果"""
+    for conn, sql, params in runs:
+        conn.execute(sql, params).fetchall()  # 预热页缓存
+    best, results = [float("inf")] * len(runs), [None] * len(runs)
+    for _ in range(ROUNDS):
+        for i, (conn, sql, params) in enumerate(runs):
+            ms, results[i] = _time_query(conn, sql, params)
+            best[i] = min(best[i], ms)
+    return best, results
+
+
+def _time_updates(conn, sql, order_ids):
+    """在一个事务里更新 UPDATES 条订单状态后回滚，返回每条的平均耗时（毫秒，取多轮最好成绩）"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        for order_id in order_ids:
+            conn.execute(sql, ["已完成", order_id])
+        best = min(best, (time.perf_counter() - started) / len(order_ids) * 1000)
+        conn.rollback()
+    return best
+
+
+def _mb(size):
+    return f"{size / 1048576:>10.2f} MB" if size else f"{'-':>13}"
+
+
+def main():
+    try:
+        source = sqlite3.connect(SOURCE)
+        print(f"生成 {ORDERS:,} 条合成订单，建立原始布局并原地转换...")
+        _build_baseline(source)
+        source.close()
+        _build_current()
+        baseline, current = _open(BASELINE_PATH), _open(DB_PATH)
+
+        baseline_size, current_size = os.path.getsize(BASELINE_PATH), os.path.getsize(DB_PATH)
+        baseline_objects, current_objects = _object_sizes(baseline), _object_sizes(current)
+        print(f"\n{'size':<34} {'before':>13} {'after':>13}")
+        print(f"{'file':<34} {_mb(baseline_size)} {_mb(current_size)}   {current_size / baseline_size:>5.2f}x")
+        if baseline_objects:
+            before = _table_size(baseline, baseline_objects, "orders")
+            after = _table_size(current, current_objects, "order_facts")
+            print(f"{'orders storage (table + indexes)':<34} {_mb(before)} {_mb(after)}   {after / before:>5.2f}x")
+            # 订单本身的十列（不含冗余的客户 / 产品属性列，见 db.ORDERS_SQL）单独建表量一次
+            columns = ", ".join(c.strip() for c in queries.ORDER_FACT_COLUMNS.split(",")[:10])
+            current.execute(f"CREATE TEMP TABLE order_columns AS SELECT {columns} FROM order_facts")
+            (columns_size,) = current.execute("SELECT SUM(pgsize) FROM dbstat('temp') WHERE name = 'order_columns'").fetchone()
+            current.execute("DROP TABLE temp.order_columns")
+            before_columns = baseline_objects["orders"]
+            print(f"{'  order columns only (no index)':<34} {_mb(before_columns)} {_mb(columns_size)}"
+                  f"   {columns_size / before_columns:>5.2f}x")
+        largest = sorted(set(baseline_objects) | set(current_objects),
+                         key=lambda name: -max(baseline_objects.get(name, 0), current_objects.get(name, 0)))
+        for name in largest[:15]:
+            print(f"  {name:<32} {_mb(baseline_objects.get(name))} {_mb(current_objects.get(name))}")
+
+        print(f"\n{'scan (ms/query)':<34} {'before':>13} {'after':>13} {'after (view)':>13}   speedup")
+        for name, before_sql, after_sql, params in SCANS:
+            (before_ms, after_ms, view_ms), (expected, encoded, viewed) = _best(
+                [(baseline, before_sql, params), (current, after_sql, params), (current, before_sql, params)]
+            )
+            assert len(expected) == len(encoded) == len(viewed), (len(expected), len(encoded), len(viewed))
+            print(f"{name:<34} {before_ms:>13.3f} {after_ms:>13.3f} {view_ms:>13.3f}   {before_ms / after_ms:>6.2f}x")
+
+        print(f"\n{'query (ms/query)':<34} {'before':>13} {'after':>13}   speedup")
+        for name, baseline_sql, current_sql, baseline_params, current_params in HOT_QUERIES:
+            (baseline_ms, current_ms), (expected, rows) = _best(
+                [(baseline, baseline_sql, baseline_params), (current, current_sql, current_params)]
+            )
+            assert len(expected) == len(rows), (len(expected), len(rows))
+            print(f"{name:<34} {baseline_ms:>13.3f} {current_ms:>13.3f}   {baseline_ms / current_ms:>6.2f}x"
+                  f"  ({len(rows):,} rows)")
+
+        order_ids = [f"BS{i:08d}" for i in random.Random(7).sample(range(ORDERS), min(UPDATES, ORDERS))]
+        baseline_ms = _time_updates(baseline, "UPDATE orders SET status = ? WHERE order_id = ?", order_ids)
+        current_ms = _time_updates(current, queries.UPDATE_ORDER_STATUS.replace("main.", ""), order_ids)
+        print(f"{'update status (ms/row)':<34} {baseline_ms:>13.3f} {current_ms:>13.3f}"
+              f"   {baseline_ms / current_ms:>6.2f}x")
+        baseline.close()
+        current.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+基准测试：每次工具调用的 HTTP 往返次数与传输字节数（各传输方式对比）
+
+用法：python bench_transport.py [调用次数]
+
+启动一个临时的 mcp_server_http（数据库复制到临时目录），依次测量：
+- streamable: /mcp（initialize + initialized + N 次 tools/call，同一会话）
+- root-post:  POST /（Copilot Studio 当前路径）
+- rest:       POST /tools/{name}
+- legacy-sse: GET /sse + POST /messages（结果从 SSE 流返回）
+
+字节数包含请求/响应的头和体（响应体按线上压缩后的大小计算）；
+每种传输分别以 Accept-Encoding: gzip 和 identity（未压缩，即改动前的行为）各跑一次。
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BASE_DIR = Path(__file__).resolve().parent
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+TOOL_NAME = "list_orders"
+INIT_PARAMS = {
+    "protocolVersion": "2025-06-18",
+    "capabilities": {},
+    "clientInfo": {"name": "bench", "version": "1.0"},
+}
+
+
+def _tool_call(i):
+    """每次调用换一页，避免相同响应在长连接压缩里被重复字典放大效果"""
+    return {"name": TOOL_NAME, "arguments": {"limit": 50, "offset": (i * 37) % 150}}
+
+
+class Meter:
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+
+    def request(self, request):
+        self.requests += 1
+        self.bytes += len(request.content) + sum(len(k) + len(v) + 4 for k, v in request.headers.raw)
+
+    def response(self, response):
+        self.bytes += sum(len(k) + len(v) + 4 for k, v in response.headers.raw)
+
+    def body(self, response):
+        self.bytes += response.num_bytes_downloaded
+
+
+def _rpc(id_, method, params=None):
+    message = {"jsonrpc": "2.0", "method": method}
+    if id_ is not None:
+        message["id"] = id_
+    if params is not None:
+        message["params"] = params
+    return message
+
+
+async def _post(client, meter, url, payload, headers=None):
+    request = client.build_request("POST", url, json=payload, headers=headers)
+    meter.request(request)
+    response = await client.send(request, stream=True)
+    meter.response(response)
+    body = await response.aread()
+    meter.body(response)
+    return response, body
+
+
+def _sse_result(body, request_id):
+    for line in body.decode().splitlines():
+        if line.startswith("data:"):
+            message = json.loads(line[5:])
+            if message.get("id") == request_id:
+                return message
+    raise RuntimeError(f"no response for {request_id}")
+
+
+async def bench_streamable(client, meter):
+    headers = {"Accept": "application/json, text/event-stream"}
+    response, _ = await _post(client, meter, "/mcp", _rpc(0, "initialize", INIT_PARAMS), headers)
+    headers["Mcp-Session-Id"] = response.headers["mcp-session-id"]
+    headers["Mcp-Protocol-Version"] = INIT_PARAMS["protocolVersion"]
+    await _post(client, meter, "/mcp", _rpc(None, "notifications/initialized"), headers)
+    for i in range(1, CALLS + 1):
+        response, body = await _post(client, meter, "/mcp", _rpc(i, "tools/call", _tool_call(i)), headers)
+        if response.headers.get("content-type", "").startswith("text/event-stream"):
+            _sse_result(body, i)
+
+
+async def bench_root_post(client, meter):
+    await _post(client, meter, "/", _rpc(0, "initialize", INIT_PARAMS))
+    await _post(client, meter, "/", _rpc(None, "notifications/initialized"))
+    for i in range(1, CALLS + 1):
+        await _post(client, meter, "/", _rpc(i, "tools/call", _tool_call(i)))
+
+
+async def bench_rest(client, meter):
+    for i in range(1, CALLS + 1):
+        await _post(client, meter, f"/tools/{TOOL_NAME}", _tool_call(i)["arguments"])
+
+
+async def bench_legacy_sse(client, meter):
+    request = client.build_request("GET", "/sse")
+    meter.request(request)
+    stream = await client.send(request, stream=True)
+    meter.response(stream)
+    lines = stream.aiter_lines()
+
+    async def next_event():
+        event = {}
+        async for line in lines:
+            if not line:
+                return event
+            key, _, value = line.partition(":")
+            event[key] = value.strip()
+
+    endpoint = (await next_event())["data"]
+
+    async def call(id_, method, params=None):
+        await _post(client, meter, endpoint, _rpc(id_, method, params))
+        if id_ is None:
+            return
+        while True:
+            event = await next_event()
+            if "data" in event and json.loads(event["data"]).get("id") == id_:
+                return
+
+    await call(0, "initialize", INIT_PARAMS)
+    await call(None, "notifications/initialized")
+    for i in range(1, CALLS + 1):
+        await call(i, "tools/call", _tool_call(i))
+    meter.bytes += stream.num_bytes_downloaded
+    await stream.aclose()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def main():
+    workdir = Path(tempfile.mkdtemp())
+    shutil.copy(BASE_DIR / "orders.db", workdir / "orders.db")
+    port = _free_port()
+    env = {**os.environ, "PORT": str(port), "DB_PATH": str(workdir / "orders.db"), "CHARTS_DIR": str(workdir / "charts"),
+           "LOG_DIR": str(workdir / "logs")}
+    server = subprocess.Popen(
+        [sys.executable, str(BASE_DIR / "mcp_server_http.py")],
+        env=env, cwd=str(BASE_DIR), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/health")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+
+            print(f"{CALLS} 次 {TOOL_NAME}(limit=50) 调用（含会话建立）")
+            print(f"{'transport':<12} {'encoding':<9} {'requests':>9} {'req/call':>9} "
+                  f"{'bytes':>10} {'bytes/call':>11} {'ms/call':>8}")
+            for label, fn in [
+                ("streamable", bench_streamable),
+                ("root-post", bench_root_post),
+                ("rest", bench_rest),
+                ("legacy-sse", bench_legacy_sse),
+            ]:
+                for encoding in ("gzip", "identity"):
+                    client.headers["Accept-Encoding"] = encoding
+                    meter = Meter()
+                    start = time.perf_counter()
+                    await fn(client, meter)
+                    elapsed = (time.perf_counter() - start) / CALLS * 1000
+                    print(f"{label:<12} {encoding:<9} {meter.requests:>9} {meter.requests / CALLS:>9.2f} "
+                          f"{meter.bytes:>10} {meter.bytes / CALLS:>11.0f} {elapsed:>8.1f}")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+基准测试：订单状态写入（每个写入各自提交 vs 单写线程组提交）
+
+用法：python bench_writes.py [数据库路径] [每轮秒数] [并发写入数,...]
+
+在源数据库同目录下复制一份（同一文件系统，fsync 开销与生产一致），
+每种并发数下两种方式各跑一轮，N 个线程持续随机修改订单状态：
+- direct: 旧写法，每个线程自己的连接，UPDATE 后立即 commit（每次写入一次 fsync，线程间争抢写锁）
+- group:  当前写法，writer.submit() 交给单写线程，窗口内的写入合并为一次提交
+输出每秒写入数、延迟 p50 / p99（从发起到提交落盘）和失败次数（database is locked 等）。
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+SOURCE = sys.argv[1] if len(sys.argv) > 1 else "orders.db"
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+CONCURRENCY = [int(n) for n in sys.argv[3].split(",")] if len(sys.argv) > 3 else [1, 10, 100]
+STATUSES = ("待付款", "已付款", "已发货", "已完成", "已取消")
+
+workdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(SOURCE)), prefix=".bench_writes_")
+os.environ["DB_PATH"] = os.path.join(workdir, "orders.db")
+os.environ.setdefault("LOG_DIR", os.path.join(workdir, "logs"))
+
+from orders_mcp import db, queries, writer  # noqa: E402
+from orders_mcp.config import DB_PATH  # noqa: E402
+
+
+def _update(conn, order_id, status):
+    return conn.execute(queries.UPDATE_ORDER_STATUS, [status, order_id]).rowcount
+
+
+def _direct_writer(order_ids, stop, latencies, errors):
+    conn = sqlite3.connect(DB_PATH)
+    rng = random.Random()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            _update(conn, rng.choice(order_ids), rng.choice(STATUSES))
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def _group_writer(order_ids, stop, latencies, errors):
+    rng = random.Random()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            writer.submit(_update, rng.choice(order_ids), rng.choice(STATUSES)).result()
+        except sqlite3.OperationalError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def _run(target, writers, order_ids):
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [threading.Thread(target=target, args=(order_ids, stop, latencies, errors)) for _ in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(SECONDS)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else float("nan")
+    return len(latencies) / elapsed, pick(0.5), pick(0.99), len(errors)
+
+
+def main():
+    try:
+        shutil.copy(SOURCE, DB_PATH)
+        db.ensure_schema()  # 写入带上事实表、全文索引、草图和变更日志的触发器，与服务一致
+        conn = sqlite3.connect(DB_PATH)
+        order_ids = [row[0] for row in conn.execute("SELECT order_id FROM orders")]
+        journal = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        conn.close()
+        print(f"{len(order_ids)} 条订单，journal_mode={journal}，每轮 {SECONDS:g}s，"
+              f"组提交窗口 {writer.GROUP_COMMIT_WINDOW_SECONDS * 1000:g}ms")
+        print(f"\n{'writers':>7} {'mode':>7} {'writes/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for writers in CONCURRENCY:
+            for mode, target in (("direct", _direct_writer), ("group", _group_writer)):
+                rate, p50, p99, errors = _run(target, writers, order_ids)
+                print(f"{writers:>7} {mode:>7} {rate:>10.0f} {p50:>9.2f} {p99:>9.2f} {errors:>7}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
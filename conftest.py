@@ -0,0 +1,46 @@
+"""
+测试公共设置 - 所有测试共用一份临时数据库副本
+
+config 在导入时读取环境变量，所以在任何 orders_mcp 模块导入之前把 DB_PATH、LOG_DIR、SHARD_DIR
+指向临时目录（测试用的其他设置也在这里），仓库中的 orders.db 不会被改动。
+测试各自插入带独特前缀的合成订单，互不影响。
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parent
+WORKDIR = Path(tempfile.mkdtemp(prefix="orders_mcp_test_"))
+shutil.copy(BASE_DIR / "orders.db", WORKDIR / "orders.db")
+os.environ["DB_PATH"] = str(WORKDIR / "orders.db")
+os.environ["LOG_DIR"] = str(WORKDIR / "logs")
+os.environ["SHARD_DIR"] = str(WORKDIR / "shards")
+# 变更日志只保留 2000 条，几千次写入即可覆盖清理触发器与缺口处理
+os.environ["CHANGE_LOG_MAX_ROWS"] = "2000"
+
+
+@pytest.fixture(scope="session")
+def database():
+    """初始化临时数据库（补建索引、事实表、变更日志等），返回其路径"""
+    from orders_mcp import db
+
+    db.init_database()
+    return db.DB_PATH
+
+
+@pytest.fixture
+def conn(database):
+    """当前线程的持久连接，已挂载归档分片（与工具调用开始时相同）"""
+    from orders_mcp import db, shards
+
+    conn = db.get_db_connection()
+    shards.sync(conn)
+    return conn
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+数据库迁移：把已有数据库原地升级到当前格式（订单表紧凑编码等）
+
+用法：python migrate_db.py [数据库路径] [--vacuum]
+
+- orders 仍是文本表时原地转换：按紧凑编码写入 order_facts（天数 / 状态代码 / 分，保留 rowid），
+  orders 换成解码视图；已登记的旧格式归档分片同样转换。有日期不是 YYYY-MM-DD 的订单时中止，数据库不变
+- 补齐索引、快照表、全文索引和草图表（与服务启动时的 ensure_schema 相同，可重复执行）
+- --vacuum：迁移后 VACUUM，回收旧 orders 表占用的页，文件随之变小；同时把 auto_vacuum 切换为 INCREMENTAL，
+  之后删除订单、归档留下的空闲页由后台维护（maintenance.py）分批归还，不必再停服 VACUUM
+"""
+
+import os
+import sqlite3
+import sys
+
+args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+if args:
+    os.environ["DB_PATH"] = args[0]
+
+from orders_mcp import db  # noqa: E402
+from orders_mcp.config import DB_PATH  # noqa: E402
+
+
+def _state():
+    conn = sqlite3.connect(DB_PATH)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    (kind,) = conn.execute("SELECT type FROM sqlite_master WHERE name = 'orders'").fetchone() or (None,)
+    conn.close()
+    return version, kind, os.path.getsize(DB_PATH)
+
+
+def main():
+    if not os.path.exists(DB_PATH):
+        sys.exit(f"数据库不存在: {DB_PATH}")
+    version, kind, size = _state()
+    print(f"📂 {DB_PATH}: 格式版本 v{version}, orders 为{'视图' if kind == 'view' else '表'}, {size / 1024:.1f} KB")
+
+    try:
+        db.ensure_schema()
+    except ValueError as e:
+        sys.exit(f"❌ 迁移中止: {e}")
+    if "--vacuum" in sys.argv:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")  # 只有 VACUUM 时才能切换
+        conn.execute("VACUUM")
+        conn.close()
+
+    version, kind, size = _state()
+    print(f"✅ 迁移完成: 格式版本 v{version}, orders 为{'视图' if kind == 'view' else '表'}, {size / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+SQLite 订单 MCP 工具核心 - stdio（mcp_server.py）与 HTTP/SSE（mcp_server_http.py）共用
+
+只依赖 MCP SDK 与标准库；FastAPI、图表渲染等重模块由使用方按需加载。
+"""
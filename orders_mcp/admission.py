@@ -0,0 +1,267 @@
+"""
+准入控制 - 所有传输方式的工具调用都先经过这里
+
+1. 令牌桶限速：每个客户端一个总桶，每个 (客户端, 工具) 一个桶；超限立即拒绝并给出 retry_after。
+   在请求合并之前检查（check_rate），合并到别人调用上的请求同样消耗自己的令牌
+2. 并发上限：同时执行的工具调用不超过 MAX_CONCURRENT_TOOLS，其中重型工具（图表、全表聚合、
+   exact 模式等）不超过 MAX_HEAVY_TOOLS
+3. 优先级队列：没有空位时按 cheap → normal → heavy 排队，轻量查询（如 get_order_detail）插到重型任务前面；
+   队列满或等待超时同样拒绝
+
+通过准入的调用在工作线程中执行（每个线程有自己的事件循环和持久数据库连接），
+图表渲染、慢查询不再阻塞主事件循环，/health 等端点始终可以响应。
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from orders_mcp import metrics, tracing
+
+MAX_CONCURRENT_TOOLS = int(os.getenv("MAX_CONCURRENT_TOOLS", "8"))
+MAX_HEAVY_TOOLS = int(os.getenv("MAX_HEAVY_TOOLS", "2"))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "15"))
+CLIENT_RATE = float(os.getenv("CLIENT_RATE_LIMIT", "10"))  # 每秒令牌数
+CLIENT_BURST = float(os.getenv("CLIENT_RATE_BURST", "30"))
+MAX_TRACKED_CLIENTS = 10000
+
+# 单个工具的限速（每客户端）："tool=每秒/突发,..."，未列出的工具只受客户端总桶限制
+DEFAULT_TOOL_RATES = "generate_customer_chart=0.2/3"
+
+PRIORITIES = {"cheap": 0, "normal": 1, "heavy": 2}
+CHEAP_TOOLS = {"get_order_detail", "get_customers", "get_products", "get_top_n", "get_order_percentiles"}
+HEAVY_TOOLS = {"generate_customer_chart"}
+
+
+def _parse_tool_rates(spec):
+    rates = {}
+    for item in spec.split(","):
+        name, _, value = item.strip().partition("=")
+        if not value:
+            continue
+        rate, _, burst = value.partition("/")
+        rates[name.strip()] = (float(rate), float(burst or rate))
+    return rates
+
+
+TOOL_RATES = _parse_tool_rates(os.getenv("TOOL_RATE_LIMITS", DEFAULT_TOOL_RATES))
+
+
+class Overloaded(Exception):
+    """调用被准入控制拒绝；retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"服务器繁忙（{reason}），请 {retry_after} 秒后重试")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def error_data(self):
+        """JSON-RPC error 对象（code 取服务器自定义错误段）"""
+        return {"code": -32000, "message": str(self), "data": {"reason": self.reason, "retry_after": self.retry_after}}
+
+
+def tool_class(name, args, skill=None):
+    """cheap / normal / heavy"""
+    if name in HEAVY_TOOLS or args.get("mode") == "exact":
+        return "heavy"
+    if name == "get_order_summary" and args.get("condition"):
+        return "heavy"  # 自由条件无法走快照，整表扫描
+    if skill is not None and skill["full_scans"]:
+        return "heavy"
+    if name in CHEAP_TOOLS:
+        return "cheap"
+    return "normal"
+
+
+def client_id(headers=None, peer=None):
+    """客户端标识：X-Client-Id > Mcp-Session-Id > X-Forwarded-For 第一跳 > 对端地址"""
+    if headers is not None:
+        for header in ("x-client-id", "mcp-session-id"):
+            if value := headers.get(header):
+                return value
+        if forwarded := headers.get("x-forwarded-for"):
+            return forwarded.split(",")[0].strip()
+    return peer or "local"
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """取一个令牌；不够时返回需要等待的秒数（不扣减）"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class _Limiter:
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, rate, burst):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, burst)
+            if len(self._buckets) > MAX_TRACKED_CLIENTS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def check(self, client, tool):
+        with self._lock:
+            if tool in TOOL_RATES:
+                wait = self._bucket((client, tool), *TOOL_RATES[tool]).take()
+                if wait:
+                    raise Overloaded("tool_rate", math.ceil(wait))
+            if CLIENT_RATE > 0:
+                wait = self._bucket(client, CLIENT_RATE, CLIENT_BURST).take()
+                if wait:
+                    raise Overloaded("client_rate", math.ceil(wait))
+
+
+class _Scheduler:
+    """并发槽位 + 优先级等待队列（只在事件循环线程中使用）"""
+
+    def __init__(self):
+        self.running = 0
+        self.heavy = 0
+        self._waiters = []  # (priority, seq, heavy, future)
+        self._seq = itertools.count()
+
+    def _can_run(self, heavy):
+        return self.running < MAX_CONCURRENT_TOOLS and (not heavy or self.heavy < MAX_HEAVY_TOOLS)
+
+    def _start(self, heavy):
+        self.running += 1
+        self.heavy += heavy
+
+    async def acquire(self, priority, heavy):
+        if self._can_run(heavy) and not any(w[0] <= priority and not w[3].done() for w in self._waiters):
+            self._start(heavy)
+            return
+        if len(self._waiters) >= MAX_QUEUE:
+            raise Overloaded("queue_full", 1)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), heavy, future))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                return  # 超时的同时刚好被唤醒：槽位已分配
+            future.cancel()
+            self._purge()
+            raise Overloaded("queue_timeout", max(1, math.ceil(QUEUE_TIMEOUT_SECONDS / 4)))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(heavy)
+            else:
+                future.cancel()
+                self._purge()
+            raise
+
+    def release(self, heavy):
+        self.running -= 1
+        self.heavy -= heavy
+        self._wake()
+
+    def _purge(self):
+        self._waiters = [w for w in self._waiters if not w[3].done()]
+        heapq.heapify(self._waiters)
+
+    def _wake(self):
+        # 按优先级唤醒；重型槽位已满时跳过重型等待者，不挡住后面的轻量调用
+        skipped = []
+        while self._waiters and self.running < MAX_CONCURRENT_TOOLS:
+            waiter = heapq.heappop(self._waiters)
+            _priority, _seq, heavy, future = waiter
+            if future.done():
+                continue
+            if not self._can_run(heavy):
+                skipped.append(waiter)
+                continue
+            self._start(heavy)
+            future.set_result(None)
+        for waiter in skipped:
+            heapq.heappush(self._waiters, waiter)
+
+
+_limiter = _Limiter()
+_scheduler = _Scheduler()
+_executor = None
+_local = threading.local()
+_last_active = time.monotonic()
+
+
+def idle_seconds():
+    """没有工具在执行或排队时，距最近一次调用结束的秒数；否则为 0（供后台维护判断空闲）"""
+    if _scheduler.running or any(not w[3].done() for w in _scheduler._waiters):
+        return 0
+    return time.monotonic() - _last_active
+
+
+def _worker_run(handler, args):
+    """工作线程内执行异步处理函数（每个线程复用一个事件循环）"""
+    loop = getattr(_local, "loop", None)
+    if loop is None:
+        loop = _local.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(handler(*args))
+
+
+def check_rate(client, tool):
+    """扣减客户端（及工具）的令牌；超限时抛出 Overloaded"""
+    try:
+        _limiter.check(client, tool)
+    except Overloaded as e:
+        metrics.inc("admission_rejected", reason=e.reason, tool=tool)
+        raise
+
+
+@asynccontextmanager
+async def admit(tool, args, skill=None):
+    """占用执行槽位（限速已由 check_rate 检查）；返回 run(handler, *args)，在工作线程中执行处理函数"""
+    global _executor, _last_active
+    cls = tool_class(tool, args, skill)
+    try:
+        with tracing.span("admission.wait", tool_class=cls):
+            started = time.perf_counter()
+            await _scheduler.acquire(PRIORITIES[cls], cls == "heavy")
+    except Overloaded as e:
+        metrics.inc("admission_rejected", reason=e.reason, tool=tool)
+        raise
+    metrics.observe("admission_wait_seconds", time.perf_counter() - started, tool_class=cls)
+    metrics.inc("admission_admitted", tool_class=cls)
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TOOLS, thread_name_prefix="tool")
+
+    async def run(handler, *handler_args):
+        # 复制上下文，追踪 span 等 ContextVar 随调用进入工作线程
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            _executor, context.run, _worker_run, handler, handler_args
+        )
+
+    try:
+        yield run
+    finally:
+        _scheduler.release(cls == "heavy")
+        _last_active = time.monotonic()
@@ -0,0 +1,261 @@
+"""
+报表用的只读分析快照 - 重型报表不与交互查询、订单写入共用同一个数据库文件和锁
+
+快照文件（ANALYTICS_DB_PATH）用 SQLite 在线备份 API 从主库复制：backup() 一步完成，
+整个复制在一个读事务里，副本是一致的（主库为 WAL 模式，复制期间不阻塞写入）。
+副本改回回滚日志模式（单个文件，原子替换时不会丢下 -wal 中的内容），然后在副本上：
+- 冻结月度快照到当前（snapshots.refresh，从挂载了归档分片的连接读取），读快照时不需要写
+- 建报表专用的覆盖索引（REPORT_INDEXES_SQL，主库上不建，订单写入不用多维护这些索引）并完整 ANALYZE
+- 记录复制时的变更日志位置、维度版本（analytics_snapshot 表）
+最后原子替换旧文件。读连接以 immutable=1 只读打开（不加锁、不检查其他连接的写入）并开启 mmap，
+与主库完全隔离；替换后各线程在下一次报表调用时改开新文件。
+
+路由：报表工具调用 connection()。快照的滞后 = 快照之后第一条订单变更距今的秒数（没有变更时为 0；
+维度表改过时按快照年龄计）。滞后不超过调用方的 max_staleness_seconds（默认 ANALYTICS_MAX_STALENESS_SECONDS）
+时读快照，结果后附上数据截至时间；否则读主库。滞后超过 ANALYTICS_REFRESH_SECONDS 或快照不可用时，
+报表调用顺带在后台线程重建；重建（包括直接调用 build()）同一时间只有一个。
+快照之后有归档时（分片登记变了）快照不可用，等重建。ANALYTICS_REFRESH_SECONDS=0 关闭快照。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+from mcp.types import TextContent
+
+from orders_mcp import budget, changes, metrics, queries, shards, slowlog, snapshots
+from orders_mcp.config import ANALYTICS_DB_PATH, DB_PATH
+from orders_mcp.db import CACHED_STATEMENTS, get_db_connection
+from orders_mcp.log import log
+
+REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "60"))
+MAX_STALENESS_SECONDS = float(os.getenv("ANALYTICS_MAX_STALENESS_SECONDS", "60"))
+MMAP_BYTES = int(os.getenv("ANALYTICS_MMAP_BYTES", str(256 * 1024 * 1024)))
+BUSY_TIMEOUT_SECONDS = 30
+
+# 只建在快照上：exact 排行按客户 / 产品分组求和、exact 分位数按金额 / 数量排序、图表按客户名分组，
+# 都由 order_facts 编码列上的覆盖索引按序扫描完成，不再建临时 B 树排序
+REPORT_INDEXES_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_report_facts_customer ON order_facts(customer_id, amount_cents, quantity);
+    CREATE INDEX IF NOT EXISTS idx_report_facts_product ON order_facts(product_id, amount_cents, quantity);
+    CREATE INDEX IF NOT EXISTS idx_report_facts_amount ON order_facts(amount_cents);
+    CREATE INDEX IF NOT EXISTS idx_report_facts_quantity ON order_facts(quantity);
+    CREATE INDEX IF NOT EXISTS idx_report_facts_customer_name ON order_facts(customer_name, amount_cents);
+"""
+META_SQL = """
+    CREATE TABLE analytics_snapshot (
+        built_at REAL NOT NULL,
+        built_day TEXT NOT NULL,
+        change_seq INTEGER NOT NULL,
+        dimension_version INTEGER NOT NULL
+    );
+"""
+
+_state = None  # 当前快照：built_at, built_day, change_seq, dimension_version, generation
+_loaded = False
+_lock = threading.Lock()
+_build_lock = threading.Lock()  # 后台重建与直接调用 build()（bench_analytics.py）互斥
+_builder = None
+_last_attempt = float("-inf")
+_local = threading.local()
+
+
+def _read_meta(path):
+    conn = sqlite3.connect(Path(path).resolve().as_uri() + "?immutable=1", uri=True)
+    try:
+        built_at, built_day, change_seq, dimension_version = conn.execute(queries.ANALYTICS_META).fetchone()
+        registry = _registry(conn)
+    finally:
+        conn.close()
+    return {"built_at": built_at, "built_day": built_day, "change_seq": change_seq,
+            "dimension_version": dimension_version, "shards": registry}
+
+
+def _current():
+    """当前快照；首次调用时读取上次运行留下的快照文件"""
+    global _state, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                try:
+                    if os.path.exists(ANALYTICS_DB_PATH):
+                        _state = {**_read_meta(ANALYTICS_DB_PATH), "generation": 1}
+                except (sqlite3.Error, TypeError) as e:
+                    log(f"⚠️ Ignoring unreadable analytics snapshot: {e}")
+                _loaded = True
+    return _state
+
+
+def _dimension_version(conn):
+    try:
+        return conn.execute(queries.DIMENSION_VERSION).fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def _registry(conn):
+    try:
+        return tuple(tuple(row) for row in conn.execute(queries.SHARD_REGISTRY))
+    except sqlite3.OperationalError:
+        return ()
+
+
+def _refresh_snapshots(target, path):
+    """在副本上冻结月度快照：从挂载了归档分片的连接读取（orders 含全部订单），在 target 上写入"""
+    reader = sqlite3.connect(path, factory=slowlog.LoggedConnection)
+    try:
+        shards.sync(reader)
+        if getattr(reader, "shard_registry", ()) != _registry(reader):
+            raise sqlite3.OperationalError("归档分片挂载失败")  # 否则快照会漏掉已归档的订单
+        with target:
+            snapshots.refresh(target, reader)
+    finally:
+        reader.close()
+
+
+def build():
+    """从主库复制一份新快照并原子替换旧快照，返回快照信息（阻塞，在后台线程中调用；同一时间只有一个在建）"""
+    global _state, _loaded
+    with _build_lock:
+        started = time.perf_counter()
+        tmp = f"{ANALYTICS_DB_PATH}.{os.getpid()}.tmp"  # 同一数据库的多个服务进程各用各的临时文件
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        source = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_SECONDS)
+        target = sqlite3.connect(tmp)
+        try:
+            source.backup(target)  # pages=-1：一步复制完，一致的副本
+            source.close()
+            target.execute("PRAGMA journal_mode = delete")
+            _refresh_snapshots(target, tmp)
+            target.executescript(REPORT_INDEXES_SQL)
+            target.execute("ANALYZE")
+            meta = {
+                "built_at": time.time(),
+                "built_day": date.today().isoformat(),
+                "change_seq": changes.head(target),
+                "dimension_version": _dimension_version(target),
+            }
+            target.executescript(META_SQL)
+            with target:
+                target.execute(queries.ANALYTICS_SET_META, list(meta.values()))
+            registry = _registry(target)
+        except BaseException:
+            source.close()
+            target.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        target.close()
+        os.replace(tmp, ANALYTICS_DB_PATH)
+        with _lock:
+            _state = {**meta, "shards": registry, "generation": (_state["generation"] + 1) if _state else 1}
+            _loaded = True
+        metrics.inc("analytics_builds")
+        metrics.observe("analytics_build_seconds", time.perf_counter() - started)
+        return _state
+
+
+def _build_in_background():
+    try:
+        build()
+    except (sqlite3.Error, OSError) as e:
+        log(f"⚠️ Analytics snapshot build failed: {e}")
+        metrics.inc("analytics_build_failures")
+
+
+def _start_build():
+    """后台重建（已有重建在进行、或距上次开始不足 ANALYTICS_REFRESH_SECONDS 时跳过）"""
+    global _builder, _last_attempt
+    with _lock:
+        if (_builder is not None and _builder.is_alive()) or time.monotonic() - _last_attempt < REFRESH_SECONDS:
+            return
+        _last_attempt = time.monotonic()
+        _builder = threading.Thread(target=_build_in_background, name="analytics-build", daemon=True)
+        _builder.start()
+
+
+def _lag(live, state):
+    """快照落后主库的秒数；快照不能用时（跨月、快照之后的变更已被清理）返回 None"""
+    if state["built_day"][:7] != date.today().isoformat()[:7]:
+        return None  # 快照里的月度快照没有冻结新结束的月份，只读连接上补不了
+    if getattr(live, "shard_registry", ()) != state["shards"]:
+        return None  # 快照之后有归档（归档移出主库不记变更日志），快照登记的分片文件可能已被替换
+    row = live.execute(queries.ANALYTICS_FIRST_CHANGE, [state["change_seq"]]).fetchone()
+    if row is not None and row[0] != state["change_seq"] + 1:
+        return None
+    lag = row[1] if row is not None else 0.0
+    if _dimension_version(live) != state["dimension_version"]:
+        lag = max(lag, time.time() - state["built_at"])
+    return max(lag, 0.0)
+
+
+def _reader(state):
+    """当前线程的快照连接；快照替换后改开新文件"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.generation == state["generation"]:
+        return conn
+    if conn is not None:
+        conn.close()
+    conn = sqlite3.connect(
+        Path(ANALYTICS_DB_PATH).resolve().as_uri() + "?immutable=1", uri=True,
+        cached_statements=CACHED_STATEMENTS, factory=slowlog.LoggedConnection,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA mmap_size = {MMAP_BYTES}")
+    shards.sync(conn)
+    _local.conn, _local.generation = conn, state["generation"]
+    return conn
+
+
+def connection(args, tool):
+    """
+    报表查询用的 (连接, 滞后秒数)：快照满足 max_staleness_seconds 时为 (快照连接, 滞后)，否则为 (主库连接, None)。
+    快照连接装上当前调用的查询预算
+    """
+    live = get_db_connection()
+    bound = float(args.get("max_staleness_seconds", MAX_STALENESS_SECONDS))
+    if REFRESH_SECONDS <= 0 or bound <= 0:
+        return live, None
+    state = _current()
+    lag = _lag(live, state) if state is not None else None
+    if lag is None or lag > REFRESH_SECONDS:
+        _start_build()
+    if lag is None or lag > bound:
+        metrics.inc("analytics_fallbacks", tool=tool, reason="unavailable" if lag is None else "stale")
+        return live, None
+    conn = _reader(state)
+    budget.attach(conn)
+    metrics.inc("analytics_queries", tool=tool)
+    metrics.observe("analytics_lag_seconds", lag)
+    return conn, lag
+
+
+def annotate(content, lag):
+    """读快照的结果后附上数据截至时间（读主库时原样返回）"""
+    if lag is None:
+        return content
+    note = {
+        "数据来源": "分析快照",
+        "数据截至": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - lag)),
+        "滞后秒数": round(lag, 1),
+    }
+    return content + [TextContent(type="text", text=json.dumps(note, ensure_ascii=False))]
+
+
+def status():
+    """当前快照的建立时间、变更日志位置和大小（/metrics 的 analytics 段）"""
+    state = _current()
+    if state is None:
+        return {"enabled": REFRESH_SECONDS > 0, "built": False}
+    return {
+        "enabled": REFRESH_SECONDS > 0,
+        "built": True,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(state["built_at"])),
+        "change_seq": state["change_seq"],
+        "size_bytes": os.path.getsize(ANALYTICS_DB_PATH) if os.path.exists(ANALYTICS_DB_PATH) else 0,
+    }
@@ -0,0 +1,178 @@
+"""
+查询预算 - 每次工具调用的 SQL 墙钟时间、VM 步数和返回行数上限
+
+工作线程执行工具前在本线程的连接上安装 progress handler：每 PROGRESS_STEPS 条 VM 指令检查一次，
+超出步数或超时即中止当前语句。事件循环侧另设一个宽限后的 interrupt() 兜底（以及调用被取消时立即中断）。
+超限返回结构化错误（JSON），给出缩小查询的建议；被中止的查询计入 metrics queries_killed。
+
+预算按准入分级（cheap / normal / heavy）给默认值，可用 QUERY_BUDGETS 按工具覆盖：
+    QUERY_BUDGETS="get_order_summary=2000/20000000/1000,list_orders=1000/5000000/500"
+    （毫秒 / VM 步数 / 行数）
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from orders_mcp import metrics, shards, slowlog
+from orders_mcp.db import get_db_connection
+
+PROGRESS_STEPS = 10000
+INTERRUPT_GRACE_SECONDS = 1.0
+
+
+@dataclass(frozen=True)
+class Limits:
+    wall_ms: int
+    steps: int
+    max_rows: int
+
+
+CLASS_LIMITS = {
+    "cheap": Limits(int(os.getenv("QUERY_BUDGET_CHEAP_MS", "1000")), 10_000_000, 5000),
+    "normal": Limits(int(os.getenv("QUERY_BUDGET_MS", "3000")), 50_000_000, int(os.getenv("QUERY_MAX_ROWS", "5000"))),
+    "heavy": Limits(int(os.getenv("QUERY_BUDGET_HEAVY_MS", "10000")), 200_000_000, int(os.getenv("QUERY_MAX_ROWS", "5000"))),
+}
+
+SUGGESTIONS = {
+    "get_order_summary": "缩小 condition 的范围（例如加上 order_date 区间），或改用 get_order_trend / get_orders_by_customer",
+    "get_orders_by_date_range": "缩短日期范围或加 status 筛选；需要汇总时改用 get_order_trend",
+    "list_orders": "减小 limit，或按 status / customer_id 筛选后分页",
+    "search_orders": "使用更长、更具体的关键词（三个字及以上走索引），或减小 limit",
+    "get_customers": "按 region_id 筛选",
+    "get_products": "按 category 筛选",
+}
+DEFAULT_SUGGESTION = "缩小查询范围或增加筛选条件后重试"
+
+
+def _parse_overrides(spec):
+    overrides = {}
+    for item in spec.split(","):
+        name, _, value = item.strip().partition("=")
+        if not value:
+            continue
+        wall_ms, steps, max_rows = (value.split("/") + ["", ""])[:3]
+        overrides[name.strip()] = (int(wall_ms), int(steps or 0), int(max_rows or 0))
+    return overrides
+
+
+TOOL_OVERRIDES = _parse_overrides(os.getenv("QUERY_BUDGETS", ""))
+
+
+def limits_for(tool, tool_class):
+    base = CLASS_LIMITS[tool_class]
+    if tool not in TOOL_OVERRIDES:
+        return base
+    wall_ms, steps, max_rows = TOOL_OVERRIDES[tool]
+    return Limits(wall_ms, steps or base.steps, max_rows or base.max_rows)
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, tool, reason, limits):
+        super().__init__(f"{tool}: 查询超出预算（{reason}）")
+        self.tool = tool
+        self.reason = reason  # time / steps / rows
+        self.limits = limits
+
+    def to_json(self):
+        return json.dumps({
+            "error": "query_budget_exceeded",
+            "tool": self.tool,
+            "reason": self.reason,
+            "budget": {"wall_ms": self.limits.wall_ms, "steps": self.limits.steps, "max_rows": self.limits.max_rows},
+            "suggestion": SUGGESTIONS.get(self.tool, DEFAULT_SUGGESTION),
+        }, ensure_ascii=False)
+
+
+_local = threading.local()
+
+
+def fetch_rows(cursor):
+    """fetchall 的受限版本：超过当前预算的 max_rows 时抛出 QueryBudgetExceeded"""
+    guard = getattr(_local, "guard", None)
+    if guard is None:
+        return cursor.fetchall()
+    try:
+        rows = cursor.fetchmany(guard.limits.max_rows + 1)
+    finally:
+        # 没读完的语句持有读事务（回滚日志模式下是 SHARED 锁，挡住写线程提交）：拒绝前先关闭，
+        # 不等异常回溯里的游标被回收
+        cursor.close()
+    if len(rows) > guard.limits.max_rows:
+        guard.exceeded = "rows"
+        raise guard.error()
+    return rows
+
+
+def attach(conn):
+    """把当前调用（如果有）的预算装到 conn 上"""
+    guard = getattr(_local, "guard", None)
+    if guard is not None:
+        guard.attach(conn)
+
+
+class Guard:
+    """一次工具调用的预算；run() 在工作线程中执行，interrupt() 可从任意线程调用"""
+
+    def __init__(self, tool, limits):
+        self.tool = tool
+        self.limits = limits
+        self.exceeded = None
+        self._conns = []
+        self._lock = threading.Lock()
+        self._steps = 0
+        self._deadline = 0.0
+
+    def _progress(self):
+        self._steps += PROGRESS_STEPS
+        if self._steps > self.limits.steps:
+            self.exceeded = "steps"
+            return 1
+        if time.monotonic() > self._deadline:
+            self.exceeded = "time"
+            return 1
+        return 0
+
+    def error(self):
+        metrics.inc("queries_killed", tool=self.tool, reason=self.exceeded)
+        return QueryBudgetExceeded(self.tool, self.exceeded, self.limits)
+
+    def interrupt(self, reason="time"):
+        with self._lock:
+            if self._conns:
+                self.exceeded = self.exceeded or reason
+                for conn in self._conns:
+                    conn.interrupt()
+
+    def attach(self, conn):
+        """本次调用还要查询另一个连接（分析快照）：装上同一个预算，run() 结束时一并卸下"""
+        conn.set_progress_handler(self._progress, PROGRESS_STEPS)
+        with self._lock:
+            self._conns.append(conn)
+
+    async def run(self, handler, *args):
+        conn = get_db_connection()
+        shards.sync(conn)
+        self._deadline = time.monotonic() + self.limits.wall_ms / 1000
+        conn.set_progress_handler(self._progress, PROGRESS_STEPS)
+        with self._lock:
+            self._conns = [conn]
+        _local.guard = self
+        slowlog.set_context(self.tool, lambda: self._steps)
+        try:
+            return await handler(*args)
+        except sqlite3.OperationalError as e:
+            if self.exceeded is None or "interrupted" not in str(e):
+                raise
+            raise self.error() from e
+        finally:
+            with self._lock:
+                conns, self._conns = self._conns, []
+            _local.guard = None
+            slowlog.clear_context()
+            for conn in conns:
+                conn.set_progress_handler(None, PROGRESS_STEPS)
+            metrics.observe("query_steps", self._steps, tool=self.tool)
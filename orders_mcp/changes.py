@@ -0,0 +1,239 @@
+"""
+订单变更日志（CDC）- order_changes 表、订阅推送与缓存失效
+
+订单存储表 order_facts 上的触发器在写入的同一事务里为每行增删改追加一条变更：update_order_status、
+外部批量导入、手工 SQL 都一样，写入路径不用做任何事。seq 单调递增且连续
+（AUTOINCREMENT，回滚的写入不占号）；归档移出主库的订单（order_shards 中 state = 'archiving'
+的周期）不记录，订单内容没有变化。表只保留最近 CHANGE_LOG_MAX_ROWS 条，每追加 1000 条删一次旧行。
+
+消费者各自保存游标（已处理到的 seq），读取游标之后的变更：
+- 月度快照（snapshots.py）读取时实时扫描涉及的已冻结月份、由写线程重算，趋势缓存（trend.py）丢弃涉及的桶
+- subscribe_order_changes 工具：有会话的传输（/sse、/mcp、stdio）逐条以 notifications/message 推送，
+  其他传输（POST /、REST）退化为长轮询，返回一批变更
+游标之后的变更已被删除时（读到的第一条 seq 不连续）视为缺口：缓存整体重建，订阅方收到 reset。
+
+推送：有订阅者时后台任务每 CHANGE_POLL_MS 读一次专用连接的 PRAGMA data_version，
+有其他连接提交过写入才读取新变更，分发给各订阅者的队列。
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from orders_mcp import admission, metrics, queries
+from orders_mcp.config import DB_PATH
+from orders_mcp.log import log
+
+CHANGE_LOG_MAX_ROWS = int(os.getenv("CHANGE_LOG_MAX_ROWS", "100000"))
+POLL_SECONDS = float(os.getenv("CHANGE_POLL_MS", "200")) / 1000
+MAX_SUBSCRIBERS = int(os.getenv("CHANGE_MAX_SUBSCRIBERS", "100"))
+MAX_SUBSCRIBE_SECONDS = float(os.getenv("CHANGE_SUBSCRIBE_MAX_SECONDS", "300"))
+PAGE_SIZE = 500
+
+OPS = ("insert", "update", "delete")
+# queries.CHANGE_LOG_SINCE 的列
+FIELDS = ("seq", "op", "order_id", "customer_id", "order_date", "old_order_date", "status", "old_status", "changed_at")
+SEQ, ORDER_DATE, OLD_ORDER_DATE = 0, 4, 5
+
+_ARCHIVING = f"""EXISTS (
+            SELECT 1 FROM order_shards
+            WHERE state = 'archiving' AND {queries.order_date_of("old.order_day")} >= start_date
+              AND {queries.order_date_of("old.order_day")} < end_date
+        )"""
+# 变更记录解码后的日期与状态名，与 orders 视图的列相同
+_DATE = {row: queries.order_date_of(f"{row}.order_day") for row in ("new", "old")}
+_STATUS = {row: queries.status_of(f"{row}.status_code") for row in ("new", "old")}
+
+# 由 db.ensure_schema() 执行（须在 shards.SCHEMA_SQL 之后）。
+# status / old_status 是变更后 / 前的状态：插入只有 status，删除只有 old_status；
+# 更新只看订单自身的列，客户、产品改名同步到 order_facts 的名称列不算订单变更；清理触发器每次重建，CHANGE_LOG_MAX_ROWS 改动后重启即生效
+SCHEMA_SQL = f"""
+    BEGIN;
+    CREATE TABLE IF NOT EXISTS order_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        op TEXT NOT NULL,
+        order_id TEXT NOT NULL,
+        customer_id TEXT,
+        order_date TEXT,
+        old_order_date TEXT,
+        status TEXT,
+        old_status TEXT,
+        changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+
+    CREATE TRIGGER IF NOT EXISTS order_changes_ai AFTER INSERT ON order_facts BEGIN
+        INSERT INTO order_changes (op, order_id, customer_id, order_date, status)
+        VALUES ('insert', new.order_id, new.customer_id, {_DATE["new"]}, {_STATUS["new"]});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS order_changes_au
+    AFTER UPDATE OF order_id, customer_id, product_id, quantity, unit_price_cents, amount_cents, order_day, status_code,
+                    shipping_address, notes ON order_facts BEGIN
+        INSERT INTO order_changes (op, order_id, customer_id, order_date, old_order_date, status, old_status)
+        VALUES ('update', new.order_id, new.customer_id, {_DATE["new"]}, {_DATE["old"]},
+                {_STATUS["new"]}, {_STATUS["old"]});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS order_changes_ad AFTER DELETE ON order_facts
+    WHEN NOT {_ARCHIVING}
+    BEGIN
+        INSERT INTO order_changes (op, order_id, customer_id, order_date, old_status)
+        VALUES ('delete', old.order_id, old.customer_id, {_DATE["old"]}, {_STATUS["old"]});
+    END;
+
+    DROP TRIGGER IF EXISTS order_changes_prune;
+    CREATE TRIGGER order_changes_prune AFTER INSERT ON order_changes WHEN new.seq % 1000 = 0 BEGIN
+        DELETE FROM order_changes WHERE seq <= new.seq - {CHANGE_LOG_MAX_ROWS};
+    END;
+    COMMIT;
+"""
+
+
+def head(conn):
+    """最新一条变更的 seq（还没有变更时为 0）"""
+    return conn.execute(queries.CHANGE_LOG_HEAD).fetchone()[0]
+
+
+def read(conn, cursor, limit=-1):
+    """cursor 之后的变更（按 seq 升序，至多 limit 条）与是否有缺口（cursor 之后的部分变更已被删除）"""
+    rows = conn.execute(queries.CHANGE_LOG_SINCE, [cursor, limit]).fetchall()
+    return rows, bool(rows) and rows[0][SEQ] != cursor + 1
+
+
+def changed_dates(rows):
+    """变更涉及的订单日期（更新前后的日期都算）"""
+    dates = set()
+    for row in rows:
+        dates.add(row[ORDER_DATE])
+        dates.add(row[OLD_ORDER_DATE])
+    dates.discard(None)
+    return dates
+
+
+def event(row):
+    return dict(zip(FIELDS, row))
+
+
+# ---------------------------------------------------------------- 订阅
+
+class _Subscriber:
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+
+_subscribers = set()
+_poller = None
+# 轮询连接只在这个单线程执行器里使用：轮询任务被取消时，关闭排在仍在运行的读取之后
+_feed = ThreadPoolExecutor(1, thread_name_prefix="change-feed")
+
+
+def _poll_once(conn, version, cursor):
+    """data_version 变化时读取 cursor 之后的变更：(data_version, 变更)"""
+    current = conn.execute("PRAGMA data_version").fetchone()[0]
+    if current == version:
+        return current, []
+    return current, read(conn, cursor)[0]
+
+
+async def _poll():
+    """有订阅者期间持续轮询，把新变更按批分发给每个订阅者（批次不连续时由订阅者自己补读）"""
+    loop = asyncio.get_running_loop()
+    opened = _feed.submit(sqlite3.connect, DB_PATH)
+    try:
+        conn = await asyncio.wrap_future(opened)
+        cursor = await loop.run_in_executor(_feed, head, conn)
+        version = None
+        while _subscribers:
+            try:
+                version, rows = await loop.run_in_executor(_feed, _poll_once, conn, version, cursor)
+            except sqlite3.OperationalError as e:
+                log(f"⚠️ Change feed poll failed: {e}")
+                version, rows = None, []
+            if rows:
+                cursor = rows[-1][SEQ]
+                for subscriber in _subscribers:
+                    subscriber.queue.put_nowait(rows)
+            await asyncio.sleep(POLL_SECONDS)
+    finally:
+        _feed.submit(lambda: opened.result().close())
+
+
+def _register():
+    global _poller
+    if len(_subscribers) >= MAX_SUBSCRIBERS:
+        raise admission.Overloaded("subscribers", 5)
+    subscriber = _Subscriber()
+    _subscribers.add(subscriber)
+    if _poller is None or _poller.done():
+        _poller = asyncio.ensure_future(_poll())
+    metrics.inc("change_subscriptions")
+    return subscriber
+
+
+def _matches(row, filters):
+    return all(row[FIELDS.index(field)] in values for field, values in filters.items())
+
+
+def _result(cursor, delivered, events, notify):
+    metrics.inc("change_events_delivered", delivered, mode="push" if notify is not None else "poll")
+    if notify is not None:
+        return {"cursor": cursor, "pushed": delivered}
+    return {"cursor": cursor, "events": events}
+
+
+async def subscribe(connect, cursor=None, filters=None, limit=100, seconds=30, notify=None):
+    """
+    投递 cursor 之后匹配 filters（字段 → 允许的值集合）的变更；cursor 为空时从当前最新位置开始。
+    notify 不为空时逐条推送，直到 seconds 秒或已推送 limit 条；否则等到第一批匹配的变更
+    （至多 seconds 秒）后返回。返回 {"cursor", ...}，下次从返回的 cursor 继续。
+    数据库读取在线程池中用 connect() 的连接执行，不阻塞事件循环
+    """
+    filters = filters or {}
+    deadline = time.monotonic() + min(max(float(seconds), 0), MAX_SUBSCRIBE_SECONDS)
+    subscriber = _register()
+    delivered, events = 0, []
+    try:
+        if cursor is None:
+            cursor = await asyncio.to_thread(lambda: head(connect()))
+        batch = None  # 轮询任务分发、尚未处理的一批
+        while True:
+            if batch is None or batch[0][SEQ] > cursor + 1:
+                # 初次订阅，或分发的批次与游标之间有空档：从变更表补读
+                rows, gap = await asyncio.to_thread(lambda: read(connect(), cursor, PAGE_SIZE))
+                more = len(rows) == PAGE_SIZE
+                if gap:
+                    metrics.inc("change_subscription_resets")
+                    return {
+                        "reset": True,
+                        "cursor": await asyncio.to_thread(lambda: head(connect())),
+                        "message": "游标之后的部分变更已被清理，请重新读取订单后从返回的 cursor 继续订阅",
+                    }
+            else:
+                rows, more = batch, False
+            for row in rows:
+                if row[SEQ] <= cursor:
+                    continue
+                cursor = row[SEQ]
+                if not _matches(row, filters):
+                    continue
+                if notify is not None:
+                    await notify(event(row))
+                else:
+                    events.append(event(row))
+                delivered += 1
+                if delivered >= limit:
+                    return _result(cursor, delivered, events, notify)
+            if more:
+                batch = None
+                continue
+            remaining = deadline - time.monotonic()
+            if (events and notify is None) or remaining <= 0:
+                return _result(cursor, delivered, events, notify)
+            try:
+                batch = await asyncio.wait_for(subscriber.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return _result(cursor, delivered, events, notify)
+    finally:
+        _subscribers.discard(subscriber)
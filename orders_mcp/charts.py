@@ -0,0 +1,145 @@
+"""
+图表生成 - 调用 mcp-echarts（Node 子进程）渲染客户订单统计图
+
+该模块较重（子进程、临时文件），由 tools.generate_customer_chart 按需导入。
+"""
+
+import base64
+import json
+import os
+import subprocess
+import tempfile
+import traceback
+import uuid
+
+from mcp.types import TextContent
+
+from orders_mcp import analytics, queries, tracing
+from orders_mcp.config import CHARTS_DIR, CHART_BASE_URL
+from orders_mcp.log import log
+
+
+async def generate_customer_chart(args):
+    """生成客户订单统计图表（试验性功能）"""
+    chart_type = args.get("chart_type", "bar")
+    limit = args.get("limit", 10)
+
+    # 1. 获取客户订单统计数据（全部历史的分组聚合，读分析快照）
+    conn, lag = analytics.connection(args, "generate_customer_chart")
+    rows = conn.execute(queries.CUSTOMER_CHART, [limit]).fetchall()
+
+    if not rows:
+        return [TextContent(type="text", text="No data available for chart generation.")]
+
+    # 2. 准备图表数据
+    chart_data = []
+    for row in rows:
+        chart_data.append({
+            "category": row[0],  # customer_name
+            "value": float(row[1])  # total_amount
+        })
+
+    # 3. 调用 mcp-echarts 生成图表
+    try:
+        CHARTS_DIR.mkdir(parents=True, exist_ok=True)
+        chart_id = str(uuid.uuid4())
+        chart_file = CHARTS_DIR / f"{chart_id}.png"
+
+        # 构建 mcp-echarts 输入（使用临时文件）
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+            echarts_input = {
+                "title": f"Top {limit} Customers by Order Amount",
+                "axisXTitle": "Customer",
+                "axisYTitle": "Total Amount",
+                "data": chart_data,
+                "width": 800,
+                "height": 600,
+                "theme": "default",
+                "outputType": "png"
+            }
+            json.dump(echarts_input, f)
+            input_file = f.name
+
+        # 调用 mcp-echarts（使用 stdio 模式）
+        tool_name = f"generate_{chart_type}_chart"
+
+        # 创建 MCP 请求
+        mcp_request = {
+            "jsonrpc": "2.0",
+            "id": "1",
+            "method": "tools/call",
+            "params": {
+                "name": tool_name,
+                "arguments": echarts_input
+            }
+        }
+
+        log(f"📊 Calling mcp-echarts: {tool_name}")
+        log(f"📊 Input data: {chart_data[:3]}...")
+
+        with tracing.span("render", renderer="mcp-echarts", chart_type=chart_type):
+            result = subprocess.run(
+                ["npx", "-y", "mcp-echarts"],
+                input=json.dumps(mcp_request) + "\n",
+                capture_output=True,
+                text=True,
+                timeout=30,
+                env={**os.environ, "NODE_ENV": "production"}
+            )
+
+        log(f"📊 Return code: {result.returncode}")
+        log(f"📊 Stdout length: {len(result.stdout)}")
+        log(f"📊 Stderr: {result.stderr[:200] if result.stderr else 'None'}")
+
+        # 清理临时文件
+        try:
+            os.unlink(input_file)
+        except:
+            pass
+
+        if result.returncode != 0:
+            return [TextContent(type="text", text=f"Chart generation failed (exit code {result.returncode}): {result.stderr[:500]}")]
+
+        if not result.stdout.strip():
+            return [TextContent(type="text", text=f"Chart generation failed: mcp-echarts returned empty output. Stderr: {result.stderr[:500]}")]
+
+        # 解析返回的 base64 图片
+        try:
+            response = json.loads(result.stdout)
+        except json.JSONDecodeError as e:
+            return [TextContent(type="text", text=f"Failed to parse mcp-echarts response: {str(e)}. Output: {result.stdout[:200]}")]
+
+        if "result" in response and "content" in response["result"]:
+            content = response["result"]["content"][0]
+
+            # mcp-echarts 返回格式：{"type":"image","data":"base64..."}
+            if content.get("type") == "image" and "data" in content:
+                base64_data = content["data"]
+            # 或者旧格式：{"type":"text","text":"data:image/png;base64,..."}
+            elif content.get("type") == "text" and "text" in content:
+                base64_data = content["text"]
+                if "base64," in base64_data:
+                    base64_data = base64_data.split("base64,")[1]
+            else:
+                return [TextContent(type="text", text=f"Unexpected content format: {json.dumps(content)[:200]}")]
+
+            # 保存图片
+            try:
+                chart_file.write_bytes(base64.b64decode(base64_data))
+            except Exception as e:
+                return [TextContent(type="text", text=f"Failed to decode base64 image: {str(e)}")]
+
+            # 返回图表 URL
+            chart_url = f"{CHART_BASE_URL}/{chart_id}.png"
+            return analytics.annotate([TextContent(
+                type="text",
+                text=f"📊 Chart generated successfully!\n\nView chart: {chart_url}\n\nData summary:\n" +
+                     "\n".join([f"- {d['category']}: ${d['value']:,.2f}" for d in chart_data[:5]])
+            )], lag)
+        else:
+            return [TextContent(type="text", text=f"Unexpected response from mcp-echarts: {json.dumps(response)[:500]}")]
+
+    except subprocess.TimeoutExpired:
+        return [TextContent(type="text", text="Chart generation timed out. Please try again.")]
+    except Exception as e:
+        return [TextContent(type="text", text=f"Chart generation error: {str(e)}\n\nTraceback: {traceback.format_exc()[:500]}")]
@@ -0,0 +1,37 @@
+"""
+请求合并（single-flight）- 并发的相同工具调用只执行一次
+
+键为工具名 + 规范化参数（键排序的 JSON）；第一个调用（leader）在独立任务中执行，
+之后到达的相同调用（follower）直接等待同一结果。leader 的调用方断开不会取消执行，
+其余等待者照常拿到结果。合并次数计入 metrics：coalesce_leaders / coalesce_followers。
+"""
+
+import asyncio
+import json
+
+from orders_mcp import metrics
+
+_inflight = {}
+
+
+def flight_key(name, arguments):
+    return name, json.dumps(arguments, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _finished(key, task):
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # 所有等待者都已离开时，避免 "exception was never retrieved" 警告
+
+
+async def run_once(key, factory):
+    """key 相同的并发调用共享 factory() 的一次执行"""
+    task = _inflight.get(key)
+    if task is None:
+        metrics.inc("coalesce_leaders", tool=key[0])
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _finished(key, t))
+    else:
+        metrics.inc("coalesce_followers", tool=key[0])
+    return await asyncio.shield(task)
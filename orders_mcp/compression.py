@@ -0,0 +1,159 @@
+"""
+响应压缩（ASGI 中间件）- 按 Accept-Encoding 协商 brotli / gzip
+
+- 普通响应：整体缓冲，超过 MIN_COMPRESS_SIZE 才压缩
+- SSE（text/event-stream）：逐块压缩并 flush，事件不会因为压缩缓冲而延迟
+- PNG 等已压缩内容直接透传（SVG 图表仍会压缩）
+
+brotli 为可选依赖：未安装时只协商 gzip。压缩前后字节数计入 metrics。
+"""
+
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from orders_mcp import metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+MIN_COMPRESS_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+_COMPRESSIBLE_IMAGES = ("image/svg+xml",)
+_SKIP_TYPES = ("image/", "application/octet-stream", "application/zip")
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def negotiate_encoding(accept_encoding):
+    """按 q 值选择编码：同等权重下优先 br，其次 gzip；都不接受时返回 None"""
+    best, best_q = None, 0.0
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name == "*":
+            candidates = ["br", "gzip"]
+        else:
+            candidates = [name]
+        for candidate in candidates:
+            if candidate == "br" and brotli is None:
+                continue
+            if candidate not in ("br", "gzip") or q <= 0:
+                continue
+            if q > best_q or (q == best_q and candidate == "br"):
+                best, best_q = candidate, q
+    return best
+
+
+class _Encoder:
+    """流式压缩器：gzip 用 zlib，br 用 brotli.Compressor"""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+
+    def chunk(self, data, final):
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def _set_encoding_headers(message, encoding, streaming):
+    headers = MutableHeaders(raw=message["headers"])
+    headers["Content-Encoding"] = encoding
+    headers.add_vary_header("Accept-Encoding")
+    if streaming and "content-length" in headers:
+        del headers["Content-Length"]
+    return headers
+
+
+def _record(encoding, size_in, size_out):
+    metrics.inc("compression_bytes_in", size_in, encoding=encoding)
+    metrics.inc("compression_bytes_out", size_out, encoding=encoding)
+    metrics.inc("compression_bytes_saved", size_in - size_out, encoding=encoding)
+
+
+def _is_compressible(content_type):
+    if content_type.startswith(_COMPRESSIBLE_IMAGES):
+        return True
+    return not content_type.startswith(_SKIP_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=MIN_COMPRESS_SIZE, level=COMPRESS_LEVEL):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http":
+            encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        mode = None  # "passthrough" | "stream" | "buffer"
+        encoder = None
+        chunks = []
+
+        async def send_wrapper(message):
+            nonlocal start_message, mode, encoder
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or not _is_compressible(content_type):
+                    mode = "passthrough"
+                    await send(message)
+                elif content_type.startswith("text/event-stream"):
+                    mode = "stream"
+                    encoder = _Encoder(encoding, self.level)
+                    _set_encoding_headers(message, encoding, streaming=True)
+                    await send(message)
+                else:
+                    mode = "buffer"
+                    start_message = message
+                return
+            if mode == "passthrough" or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if mode == "stream":
+                data = encoder.chunk(body, final=not more_body)
+                _record(encoding, len(body), len(data))
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            chunks.append(body)
+            if more_body:
+                return
+            body = b"".join(chunks)
+            if len(body) >= self.minimum_size:
+                compressed = _Encoder(encoding, self.level).chunk(body, final=True)
+                _record(encoding, len(body), len(compressed))
+                body = compressed
+                headers = _set_encoding_headers(start_message, encoding, streaming=False)
+                headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,22 @@
+"""
+配置 - 环境变量优先，默认路径相对于项目根目录（stdio 客户端的工作目录不确定）
+"""
+
+import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+DB_PATH = os.getenv("DB_PATH", str(BASE_DIR / "orders.db"))
+SKILLS_DIR = Path(os.getenv("SKILLS_DIR", str(BASE_DIR / "skills")))
+CHARTS_DIR = Path(os.getenv("CHARTS_DIR", str(BASE_DIR / "static" / "charts")))
+CHART_BASE_URL = os.getenv("CHART_BASE_URL", "https://newkuhne-dockversion.onrender.com/charts")
+LOG_DIR = Path(os.getenv("LOG_DIR", str(BASE_DIR / "logs")))
+SHARD_DIR = Path(os.getenv("SHARD_DIR", str(BASE_DIR / "shards")))
+# 报表用的只读分析快照（orders_mcp/analytics.py 定期从主库复制）
+ANALYTICS_DB_PATH = os.getenv("ANALYTICS_DB_PATH", str(Path(DB_PATH).with_suffix(".analytics.db")))
+
+# 管理功能：HTTP /admin/* 需要 Authorization: Bearer <ADMIN_TOKEN>（未设置时关闭）；
+# ADMIN_TOOLS=true 时把管理工具（慢查询日志等）也暴露为 MCP 工具（适合本地 stdio 使用）
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+ADMIN_TOOLS = os.getenv("ADMIN_TOOLS", "false").lower() == "true"
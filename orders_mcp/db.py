@@ -0,0 +1,419 @@
+"""
+数据库访问 - 连接、初始化与行转换
+"""
+
+import os
+import random
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from orders_mcp import changes, dimensions, idempotency, maintenance, queries, shards, sketches, slowlog
+from orders_mcp.config import DB_PATH
+from orders_mcp.log import log
+
+# 每个连接缓存的预编译语句数（Python 默认 128）；工具 SQL 都是固定模板，缓存足够大时只 prepare 一次
+CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "256"))
+# WAL：读者不挡写线程提交，写入也不挡读者（回滚日志模式下任何未结束的读事务都会让 COMMIT 等到 busy timeout）。
+# 数据库放在不支持共享内存的网络文件系统上时设为 delete
+JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "wal").lower()
+
+_local = threading.local()
+
+# order_snapshots：已结束月份按 (月份, 客户, 状态) 冻结的聚合，见 orders_mcp/snapshots.py
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS order_snapshots (
+        period TEXT NOT NULL,
+        customer_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        cnt INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        qty INTEGER NOT NULL,
+        min_amount REAL NOT NULL,
+        max_amount REAL NOT NULL,
+        min_qty INTEGER NOT NULL,
+        max_qty INTEGER NOT NULL,
+        PRIMARY KEY (period, customer_id, status)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS snapshot_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+"""
+
+
+# 全文检索：trigram 分词按子串匹配（中文无需分词），三个字及以上的查询走索引；
+# 触发器在订单变化时同步（客户、产品改名经 order_facts 的名称列级联过来），首次建立时从现有订单回填
+FTS_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(
+        order_id UNINDEXED, customer_name, product_name, shipping_address, notes,
+        tokenize = 'trigram'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS orders_fts_ai AFTER INSERT ON order_facts BEGIN
+        INSERT INTO orders_fts (rowid, order_id, customer_name, product_name, shipping_address, notes)
+        VALUES (new.rowid, new.order_id, new.customer_name, new.product_name, new.shipping_address, new.notes);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS orders_fts_au
+    AFTER UPDATE OF order_id, customer_name, product_name, shipping_address, notes ON order_facts BEGIN
+        UPDATE orders_fts SET
+            order_id = new.order_id,
+            customer_name = new.customer_name,
+            product_name = new.product_name,
+            shipping_address = new.shipping_address,
+            notes = new.notes
+        WHERE rowid = new.rowid;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS orders_fts_ad AFTER DELETE ON order_facts BEGIN
+        DELETE FROM orders_fts WHERE rowid = old.rowid;
+    END;
+
+    INSERT INTO orders_fts (rowid, order_id, customer_name, product_name, shipping_address, notes)
+    SELECT rowid, order_id, customer_name, product_name, shipping_address, notes
+    FROM order_facts
+    WHERE NOT EXISTS (SELECT 1 FROM orders_fts);
+"""
+
+
+
+# 一两个字的搜索词用的 n-gram 索引（文档格式见 queries.grams_doc）。无内容表删除时要给出原文档：
+# BEFORE 触发器按 orders_fts 中尚未更新的旧值生成，AFTER 触发器按与 orders_fts 相同的新值插入。
+# orders_grams 不存在时 GRAMS_SQL 整段执行一次（建表、触发器、从 orders_fts 回填在同一事务里），
+# 之后每次启动只补齐触发器
+_OLD_GRAMS = queries.grams_doc("f.customer_name", "f.product_name", "f.shipping_address", "f.notes")
+_NEW_GRAMS = queries.grams_doc("new.customer_name", "new.product_name", "new.shipping_address", "new.notes")
+GRAMS_TRIGGERS_SQL = f"""
+    CREATE TRIGGER IF NOT EXISTS orders_grams_ai AFTER INSERT ON order_facts BEGIN
+        INSERT INTO orders_grams (rowid, grams) VALUES (new.rowid, {_NEW_GRAMS});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS orders_grams_bu
+    BEFORE UPDATE OF customer_name, product_name, shipping_address, notes ON order_facts BEGIN
+        INSERT INTO orders_grams (orders_grams, rowid, grams)
+        SELECT 'delete', f.rowid, {_OLD_GRAMS} FROM orders_fts f WHERE f.rowid = old.rowid;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS orders_grams_au
+    AFTER UPDATE OF customer_name, product_name, shipping_address, notes ON order_facts BEGIN
+        INSERT INTO orders_grams (rowid, grams) VALUES (new.rowid, {_NEW_GRAMS});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS orders_grams_bd BEFORE DELETE ON order_facts BEGIN
+        INSERT INTO orders_grams (orders_grams, rowid, grams)
+        SELECT 'delete', f.rowid, {_OLD_GRAMS} FROM orders_fts f WHERE f.rowid = old.rowid;
+    END;
+"""
+GRAMS_SQL = f"""
+    BEGIN;
+    CREATE TABLE IF NOT EXISTS gram_positions (n INTEGER PRIMARY KEY);
+    {queries.GRAM_POSITIONS_FILL};
+
+    CREATE VIRTUAL TABLE orders_grams USING fts5(grams, content = '', detail = none, columnsize = 0);
+    {GRAMS_TRIGGERS_SQL}
+
+    {queries.GRAMS_BACKFILL};
+    COMMIT;
+"""
+
+
+# 订单存储（ORDERS_VERSION 3）：order_facts 是订单的唯一一份，紧凑编码——日期存为 1970-01-01 起的天数，
+# 状态存为 statuses 表中的整数代码，金额、单价存为整数分——并带上客户名/区域/电话、产品名/类别，
+# 列表、明细、日期范围和图表查询只读这一张表、不再 JOIN。orders 是同名视图，列与最初的 orders 表相同
+# （文本日期、状态名、以元计的金额，queries.orders_view），自由条件、技能和外部 SQL 照旧读写：
+# INSTEAD OF 触发器把写入编码后落到 order_facts。全文索引、草图、变更日志的触发器都在 order_facts 上；
+# 客户、产品改名（或改区域、类别）时同步更新其全部订单
+ORDERS_VERSION = 3
+STATUSES = queries.STATUSES
+
+# 覆盖索引：日期范围、趋势统计（按日期分桶求和）、按状态 / 客户分组求和只扫索引，不回表
+_FACTS_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS statuses (
+        code INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    INSERT OR IGNORE INTO statuses (code, name) VALUES
+        {", ".join(f"({code}, '{name}')" for code, name in enumerate(STATUSES, 1))};
+
+    CREATE TABLE IF NOT EXISTS order_facts (
+        order_id TEXT PRIMARY KEY,
+        customer_id TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        unit_price_cents INTEGER NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        order_day INTEGER NOT NULL,
+        status_code INTEGER NOT NULL,
+        shipping_address TEXT,
+        notes TEXT,
+        customer_name TEXT,
+        region_id TEXT,
+        phone TEXT,
+        product_name TEXT,
+        category TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_order_facts_day ON order_facts(order_day, status_code, amount_cents, quantity);
+    CREATE INDEX IF NOT EXISTS idx_order_facts_status ON order_facts(status_code, order_day, amount_cents, quantity);
+    CREATE INDEX IF NOT EXISTS idx_order_facts_customer ON order_facts(customer_id, order_day, amount_cents, quantity);
+"""
+
+_CUSTOMER = "(SELECT {} FROM customers WHERE customer_id = new.customer_id)"
+_PRODUCT = "(SELECT {} FROM products WHERE product_id = new.product_id)"
+_ATTRIBUTES = ", ".join([_CUSTOMER.format(column) for column in ("customer_name", "region_id", "phone")]
+                        + [_PRODUCT.format(column) for column in ("product_name", "category")])
+# 只接受 YYYY-MM-DD（天数换回来须是原样）；状态表里没有的状态名先登记。
+# 不用 INSERT OR IGNORE：外层语句的 OR REPLACE 会覆盖触发器内的冲突处理，已有状态名会换成新代码
+_CHECK_ORDER = """
+        SELECT RAISE(ABORT, 'order_date must be YYYY-MM-DD') WHERE date(new.order_date) IS NOT new.order_date;
+        INSERT INTO statuses (name) SELECT new.status WHERE NOT EXISTS (SELECT 1 FROM statuses WHERE name = new.status);
+"""
+
+_ORDERS_VIEW_SQL = f"""
+    CREATE VIEW IF NOT EXISTS orders AS {queries.orders_view("order_facts")};
+
+    CREATE TRIGGER IF NOT EXISTS orders_insert INSTEAD OF INSERT ON orders BEGIN
+        {_CHECK_ORDER}
+        INSERT INTO order_facts ({queries.ORDER_FACT_COLUMNS})
+        VALUES ({queries.encode_order("new")}, {_ATTRIBUTES});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS orders_update INSTEAD OF UPDATE ON orders BEGIN
+        {_CHECK_ORDER}
+        UPDATE order_facts SET ({queries.ORDER_FACT_COLUMNS}) = ({queries.encode_order("new")}, {_ATTRIBUTES})
+        WHERE order_id = old.order_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS orders_delete INSTEAD OF DELETE ON orders BEGIN
+        DELETE FROM order_facts WHERE order_id = old.order_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS customers_facts_au
+    AFTER UPDATE OF customer_name, region_id, phone ON customers BEGIN
+        UPDATE order_facts SET customer_name = new.customer_name, region_id = new.region_id, phone = new.phone
+        WHERE customer_id = new.customer_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS products_facts_au
+    AFTER UPDATE OF product_name, category ON products BEGIN
+        UPDATE order_facts SET product_name = new.product_name, category = new.category
+        WHERE product_id = new.product_id;
+    END;
+"""
+
+ORDERS_SQL = f"""
+    BEGIN;
+    {_FACTS_TABLE_SQL}
+    {_ORDERS_VIEW_SQL}
+    COMMIT;
+"""
+
+# 旧格式：orders 是文本表（v2 另有编码副本 order_facts）。整段在一个事务里：按 orders 重建 statuses 与 order_facts
+# （保留 rowid，全文索引和 n-gram 索引的键不变），删掉 orders 表（连同其上的触发器、索引）换成视图。
+# 客户、产品改名时更新全文索引的触发器改由 order_facts 名称列的更新级联，一并删除
+_MIGRATE_SQL = f"""
+    BEGIN;
+    DROP TRIGGER IF EXISTS customers_fts_au;
+    DROP TRIGGER IF EXISTS products_fts_au;
+    DROP TRIGGER IF EXISTS customers_grams_bu;
+    DROP TRIGGER IF EXISTS customers_grams_au;
+    DROP TRIGGER IF EXISTS products_grams_bu;
+    DROP TRIGGER IF EXISTS products_grams_au;
+    DROP TABLE IF EXISTS order_facts;
+    DROP TABLE IF EXISTS statuses;
+    {_FACTS_TABLE_SQL}
+
+    INSERT INTO statuses (name) SELECT DISTINCT status FROM orders WHERE status NOT IN (SELECT name FROM statuses);
+    INSERT INTO order_facts (rowid, {queries.ORDER_FACT_COLUMNS})
+    SELECT o.rowid, {queries.encode_order("o")}, c.customer_name, c.region_id, c.phone, p.product_name, p.category
+    FROM orders o
+    LEFT JOIN customers c ON o.customer_id = c.customer_id
+    LEFT JOIN products p ON o.product_id = p.product_id
+    ORDER BY o.rowid;
+    DROP TABLE orders;
+
+    {_ORDERS_VIEW_SQL}
+    PRAGMA user_version = {ORDERS_VERSION};
+    COMMIT;
+"""
+
+
+def migrate_orders(conn):
+    """orders 仍是文本表（旧格式）时原地转换为紧凑编码的 order_facts + orders 视图；返回是否做了迁移"""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'orders'").fetchone()
+    if row is None or row[0] != "table":
+        return False
+    invalid = conn.execute("SELECT COUNT(*) FROM orders WHERE date(order_date) IS NOT order_date").fetchone()[0]
+    if invalid:
+        raise ValueError(f"{invalid} 条订单的 order_date 不是 YYYY-MM-DD，无法编码为天数；修正后重新迁移")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.executescript(_MIGRATE_SQL)
+    log(f"🔄 orders migrated to compact encoding (v{version} → v{ORDERS_VERSION})")
+    return True
+
+
+def init_database():
+    """初始化数据库（不存在时创建示例数据），补齐索引、快照表和全文索引，并载入维度缓存"""
+    if not os.path.exists(DB_PATH):
+        _create_sample_database()
+    ensure_schema()
+    dimensions.current(get_db_connection())
+
+
+def ensure_schema():
+    """旧格式的订单表原地转换为紧凑编码，再创建快照表、订单存储、变更日志、幂等键表、维护记录、全文索引和草图表（幂等）"""
+    conn = sqlite3.connect(DB_PATH)
+    mode = conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}").fetchone()[0]
+    if mode != JOURNAL_MODE:
+        log(f"⚠️ journal_mode={mode}（要求 {JOURNAL_MODE}）：读事务未结束时写入提交需要等待")
+    migrate_orders(conn)
+    with conn:
+        conn.executescript(SCHEMA_SQL)
+    conn.executescript(ORDERS_SQL)
+    conn.executescript(dimensions.SCHEMA_SQL)
+    conn.executescript(shards.SCHEMA_SQL)
+    shards.migrate(conn)
+    conn.executescript(changes.SCHEMA_SQL)
+    with conn:
+        conn.executescript(idempotency.SCHEMA_SQL)
+        conn.executescript(maintenance.SCHEMA_SQL)
+    try:
+        with conn:
+            conn.executescript(FTS_SQL)
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'orders_grams'").fetchone():
+            conn.executescript(GRAMS_SQL)
+        with conn:
+            conn.executescript(GRAMS_TRIGGERS_SQL)
+    except sqlite3.OperationalError as e:
+        conn.rollback()
+        # SQLite < 3.34 没有 trigram 分词器（或未编译 FTS5）：search_orders 不可用，其余功能不受影响
+        log(f"⚠️ Full-text index unavailable: {e}")
+    try:
+        with conn:
+            conn.executescript(sketches.SCHEMA_SQL)
+    except sqlite3.OperationalError as e:
+        # 未编译数学函数（ln）时草图不可用：get_top_n 改为扫描订单表，get_order_percentiles 的 exact 模式仍可用
+        log(f"⚠️ Sketch tables unavailable: {e}")
+    conn.close()
+
+
+def _create_sample_database():
+    log(f"🆕 Creating database at {DB_PATH}")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    # 创建表
+    cursor.executescript("""
+        CREATE TABLE regions (
+            region_id TEXT PRIMARY KEY,
+            region_name TEXT NOT NULL,
+            city TEXT NOT NULL
+        );
+        
+        CREATE TABLE customers (
+            customer_id TEXT PRIMARY KEY,
+            customer_name TEXT NOT NULL,
+            region_id TEXT,
+            contact TEXT,
+            phone TEXT,
+            FOREIGN KEY (region_id) REFERENCES regions(region_id)
+        );
+        
+        CREATE TABLE products (
+            product_id TEXT PRIMARY KEY,
+            product_name TEXT NOT NULL,
+            category TEXT,
+            unit_price REAL NOT NULL
+        );
+        
+        CREATE TABLE orders (
+            order_id TEXT PRIMARY KEY,
+            customer_id TEXT NOT NULL,
+            product_id TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            total_amount REAL NOT NULL,
+            order_date TEXT NOT NULL,
+            status TEXT NOT NULL,
+            shipping_address TEXT,
+            notes TEXT,
+            FOREIGN KEY (customer_id) REFERENCES customers(customer_id),
+            FOREIGN KEY (product_id) REFERENCES products(product_id)
+        );
+    """)
+    
+    # 插入示例数据
+    regions = [
+        ("R001", "华东区", "杭州"),
+        ("R002", "华南区", "深圳"),
+        ("R003", "华北区", "北京"),
+        ("R004", "西南区", "成都"),
+        ("R005", "华中区", "武汉"),
+    ]
+    
+    customers = [
+        ("C001", "阿里巴巴", "R001", "联系人1", "13800000001"),
+        ("C002", "腾讯科技", "R002", "联系人2", "13800000002"),
+        ("C003", "字节跳动", "R003", "联系人3", "13800000003"),
+        ("C004", "美团", "R003", "联系人4", "13800000004"),
+        ("C005", "拼多多", "R001", "联系人5", "13800000005"),
+    ]
+    
+    products = [
+        ("P001", "企业服务器", "硬件", 50000),
+        ("P002", "云计算资源", "服务", 12000),
+        ("P003", "企业路由器", "硬件", 8500),
+        ("P004", "网络安全设备", "硬件", 15000),
+        ("P005", "企业软件许可", "软件", 25000),
+    ]
+    
+    cursor.executemany("INSERT INTO regions VALUES (?, ?, ?)", regions)
+    cursor.executemany("INSERT INTO customers VALUES (?, ?, ?, ?, ?)", customers)
+    cursor.executemany("INSERT INTO products VALUES (?, ?, ?, ?)", products)
+    
+    # 生成 50 条订单
+    statuses = ["待付款", "已付款", "已发货", "已完成", "已取消"]
+    for i in range(50):
+        order_id = f"OR2025{i+1:04d}"
+        customer = random.choice(customers)
+        product = random.choice(products)
+        quantity = random.randint(1, 10)
+        total = quantity * product[3] * random.uniform(0.9, 1.1)
+        status = random.choice(statuses)
+        days_ago = random.randint(1, 365)
+        order_date = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
+        
+        cursor.execute("""
+            INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (order_id, customer[0], product[0], quantity, product[3], 
+              round(total, 2), order_date, status, f"{customer[2]}市XX路", f"备注{i}"))
+    
+    conn.commit()
+    conn.close()
+    log("✅ Database created with sample data")
+
+
+def get_db_connection():
+    """返回当前线程的持久连接（不要 close，预编译语句缓存随连接保留）"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, cached_statements=CACHED_STATEMENTS, factory=slowlog.LoggedConnection)
+        conn.row_factory = sqlite3.Row
+        shards.sync(conn)
+        _local.conn = conn
+    return conn
+
+
+def close_db_connection():
+    """关闭当前线程的持久连接（测试或切换数据库时使用）"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+def dict_from_row(row):
+    if row is None:
+        return None
+    return dict(zip(row.keys(), row))
@@ -0,0 +1,121 @@
+"""
+维度缓存 - customers / products / regions 常驻内存
+
+三张维度表很小且极少变化：启动时整表载入为不可变的 namedtuple 记录，按 ID 建 dict 索引，
+get_customers / get_products 直接从内存返回（无筛选与按区域 / 类别筛选的 JSON 预先序列化好），
+get_orders_by_customer、get_top_n 的 SQL 只返回客户 / 产品 ID，名称和区域在这里补上。
+
+失效：触发器在维度表任意增删改时递增 dimension_version。每次取缓存先读本连接的
+PRAGMA data_version（其他连接提交过写入才会变化，开销可忽略），变化时才读 dimension_version，
+与缓存版本不同则整体重新载入。本进程只写订单，维度表由外部工具修改。
+"""
+
+import json
+import threading
+from collections import namedtuple
+
+from orders_mcp import metrics, queries
+
+CUSTOMER_FIELDS = ("customer_id", "customer_name", "region_id", "contact", "phone")
+PRODUCT_FIELDS = ("product_id", "product_name", "category", "unit_price")
+REGION_FIELDS = ("region_id", "region_name", "city")
+
+Customer = namedtuple("Customer", CUSTOMER_FIELDS)
+Product = namedtuple("Product", PRODUCT_FIELDS)
+Region = namedtuple("Region", REGION_FIELDS)
+
+
+def _bump(table, event):
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_version_{event[0].lower()} AFTER {event} ON {table} BEGIN
+        UPDATE dimension_version SET version = version + 1;
+    END;
+    """
+
+
+# 由 db.ensure_schema() 执行
+SCHEMA_SQL = """
+    BEGIN;
+    CREATE TABLE IF NOT EXISTS dimension_version (version INTEGER NOT NULL);
+    INSERT INTO dimension_version SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM dimension_version);
+""" + "".join(
+    _bump(table, event) for table in ("customers", "products", "regions") for event in ("INSERT", "UPDATE", "DELETE")
+) + """
+    COMMIT;
+"""
+
+
+class Dimensions:
+    """某一版本维度表的只读快照"""
+
+    def __init__(self, version, customers, products, regions):
+        self.version = version
+        self.customers = {c.customer_id: c for c in customers}
+        self.products = {p.product_id: p for p in products}
+        self.regions = {r.region_id: r for r in regions}
+        self._customer_lists = self._lists(customers, "region_id")
+        self._product_lists = self._lists(products, "category")
+
+    @staticmethod
+    def _lists(records, filter_field):
+        """None（全部）与每个筛选值 → (行 dict 列表, 预先序列化的 JSON)"""
+        groups = {None: list(records)}
+        for record in records:
+            groups.setdefault(getattr(record, filter_field), []).append(record)
+        lists = {}
+        for key, members in groups.items():
+            rows = tuple(record._asdict() for record in members)
+            lists[key] = (rows, json.dumps(rows, ensure_ascii=False))
+        return lists
+
+    def customer_list(self, region_id=None):
+        return self._customer_lists.get(region_id, ((), "[]"))
+
+    def product_list(self, category=None):
+        return self._product_lists.get(category, ((), "[]"))
+
+    def customer_name(self, customer_id):
+        customer = self.customers.get(customer_id)
+        return customer.customer_name if customer else customer_id
+
+    def product_name(self, product_id):
+        product = self.products.get(product_id)
+        return product.product_name if product else product_id
+
+
+_cache = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _load(conn, version):
+    return Dimensions(
+        version,
+        [Customer(*row) for row in conn.execute(queries.DIM_CUSTOMERS)],
+        [Product(*row) for row in conn.execute(queries.DIM_PRODUCTS)],
+        [Region(*row) for row in conn.execute(queries.DIM_REGIONS)],
+    )
+
+
+def current(conn):
+    """当前维度快照；data_version 变化且 dimension_version 不同于缓存时重新载入"""
+    global _cache
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    cache = _cache
+    if cache is not None and getattr(_local, "data_version", None) == data_version:
+        return cache
+    version = conn.execute(queries.DIMENSION_VERSION).fetchone()[0]
+    if cache is None or cache.version != version:
+        with _lock:
+            if _cache is None or _cache.version != version:
+                _cache = _load(conn, version)
+                metrics.inc("dimension_cache_loads")
+            cache = _cache
+    _local.data_version = data_version
+    return cache
+
+
+def clear_cache():
+    global _cache
+    with _lock:
+        _cache = None
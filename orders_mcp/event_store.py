@@ -0,0 +1,48 @@
+"""
+Streamable HTTP 事件存储 - 支持断线后按 Last-Event-ID 续传
+
+只保存在内存中，每个流保留最近 EVENTS_PER_STREAM 条；进程重启后无法续传，
+客户端会重新建立会话。
+"""
+
+import itertools
+import os
+from collections import OrderedDict, deque
+
+from mcp.server.streamable_http import EventCallback, EventId, EventMessage, EventStore, StreamId
+from mcp.types import JSONRPCMessage
+
+EVENTS_PER_STREAM = int(os.getenv("MCP_EVENTS_PER_STREAM", "100"))
+MAX_STREAMS = int(os.getenv("MCP_MAX_STREAMS", "1000"))
+
+
+class InMemoryEventStore(EventStore):
+    def __init__(self, events_per_stream=EVENTS_PER_STREAM, max_streams=MAX_STREAMS):
+        self.events_per_stream = events_per_stream
+        self.max_streams = max_streams
+        # stream_id → deque[(seq, message)]，按最近使用排序，超出 max_streams 时淘汰最旧的流
+        self._streams = OrderedDict()
+        self._seq = itertools.count(1)
+
+    async def store_event(self, stream_id: StreamId, message: JSONRPCMessage | None) -> EventId:
+        seq = next(self._seq)
+        events = self._streams.get(stream_id)
+        if events is None:
+            events = self._streams[stream_id] = deque(maxlen=self.events_per_stream)
+            while len(self._streams) > self.max_streams:
+                self._streams.popitem(last=False)
+        else:
+            self._streams.move_to_end(stream_id)
+        events.append((seq, message))
+        return f"{stream_id}:{seq}"
+
+    async def replay_events_after(self, last_event_id: EventId, send_callback: EventCallback) -> StreamId | None:
+        stream_id, _, seq = last_event_id.rpartition(":")
+        events = self._streams.get(stream_id)
+        if events is None or not seq.isdigit():
+            return None
+        last_seq = int(seq)
+        for event_seq, message in events:
+            if event_seq > last_seq and message is not None:
+                await send_callback(EventMessage(message, f"{stream_id}:{event_seq}"))
+        return stream_id
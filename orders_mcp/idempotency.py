@@ -0,0 +1,73 @@
+"""
+写工具的幂等键 - 客户端超时重试（Copilot Studio、Cloudflare 隧道）不重复写入
+
+写工具带 idempotency_key 时，成功的写入在同一事务里把 (键, 请求摘要, 返回文本) 记入
+idempotency_keys；之后同一键、同样参数的请求直接返回原来的文本，不再排队写入、不碰 orders。
+- 读路径先查一次（命中时完全不进写线程），写线程里在同一事务中再查一次，挡住并发到达的重试
+- 同一键换了工具或参数：拒绝（KeyConflict），不会把别的请求的结果当成这次的
+- 只记录改动了数据的写入；参数无效、订单不存在等没有写入的结果不记录，重试时重新判断
+- 键保留 IDEMPOTENCY_TTL_HOURS 小时；写入时顺带删除过期的键（至多每 PRUNE_SECONDS 一次）
+
+表是 WITHOUT ROWID，请求摘要存 8 字节 BLOB，每个键一行几十字节。
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from orders_mcp import metrics, queries
+
+TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")) * 3600
+PRUNE_SECONDS = 600
+MAX_KEY_LENGTH = 200
+
+# 由 db.ensure_schema() 执行
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,
+        digest BLOB NOT NULL,
+        result TEXT NOT NULL,
+        created_at INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys(created_at);
+"""
+
+_last_prune = 0.0
+
+
+class KeyConflict(ValueError):
+    """同一幂等键用于不同的工具或参数"""
+
+
+def request_digest(tool, args):
+    """工具名 + 除幂等键外的参数（键排序）的摘要"""
+    key = args.get("idempotency_key")
+    if not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"idempotency_key 须为 1-{MAX_KEY_LENGTH} 个字符的字符串")
+    payload = {k: v for k, v in args.items() if k != "idempotency_key"}
+    text = tool + json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode()).digest()[:8]
+
+
+def lookup(conn, key, digest, tool):
+    """未过期的键的原返回文本；没有记录时返回 None，参数不同时抛出 KeyConflict"""
+    row = conn.execute(queries.IDEMPOTENCY_LOOKUP, [key, int(time.time() - TTL_SECONDS)]).fetchone()
+    if row is None:
+        return None
+    if bytes(row[0]) != digest:
+        metrics.inc("idempotency_conflicts", tool=tool)
+        raise KeyConflict(f"幂等键 {key} 已用于不同的请求，请换一个新的键")
+    metrics.inc("idempotency_replays", tool=tool)
+    return row[1]
+
+
+def record(conn, key, digest, result):
+    """在写入的事务里记录键（覆盖同名的过期记录），顺带清理过期的键"""
+    global _last_prune
+    now = time.time()
+    conn.execute(queries.IDEMPOTENCY_RECORD, [key, digest, result, int(now)])
+    if now - _last_prune >= PRUNE_SECONDS:
+        _last_prune = now
+        pruned = conn.execute(queries.IDEMPOTENCY_PRUNE, [int(now - TTL_SECONDS)]).rowcount
+        metrics.inc("idempotency_keys_pruned", max(pruned, 0))
@@ -0,0 +1,63 @@
+"""
+日志输出 - 统一写 stderr（stdio 模式下 stdout 是 JSON-RPC 通道）
+
+JsonlLog：慢查询、慢请求、追踪等结构化日志，每行一个 JSON，按大小滚动。
+"""
+
+import json
+import logging
+import logging.handlers
+import sys
+import threading
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+class JsonlLog:
+    """按大小滚动的 JSONL 文件（首次写入时才创建目录和文件）"""
+
+    def __init__(self, path, max_bytes, backups):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._logger = None
+        self._lock = threading.Lock()
+
+    def _get_logger(self):
+        with self._lock:
+            if self._logger is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger(f"orders_mcp.jsonl.{self.path}")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+                self._logger = logger
+        return self._logger
+
+    def write(self, entry):
+        self._get_logger().info(json.dumps(entry, ensure_ascii=False))
+
+    def read(self, limit=20, match=None):
+        """最近的记录（新 → 旧），包括已滚动的旧文件；match(entry) 为 False 的跳过"""
+        entries = []
+        paths = [self.path] + [self.path.with_name(f"{self.path.name}.{i}") for i in range(1, self.backups + 1)]
+        for path in paths:
+            if not path.exists():
+                continue
+            for line in reversed(path.read_text(encoding="utf-8").splitlines()):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if match is not None and not match(entry):
+                    continue
+                entries.append(entry)
+                if len(entries) >= limit:
+                    return entries
+        return entries
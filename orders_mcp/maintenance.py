@@ -0,0 +1,243 @@
+"""
+数据库维护调度 - 统计信息、WAL 检查点、增量 VACUUM 与完整性检查
+
+HTTP 与 stdio 服务都启动后台任务，每 MAINTENANCE_CHECK_SECONDS 检查一次到期的维护项，只在空闲时执行：
+没有工具在执行或排队，且距上一次调用结束已超过 MAINTENANCE_IDLE_SECONDS。到期超过两个周期
+仍等不到空闲时照常执行，一直繁忙的服务也不会永远不维护。每次检查至多执行一项，每项都有上限：
+
+- statistics：距上次 ANALYZE 的订单变更数（变更日志 seq 之差）达到当时行数的 ANALYZE_CHANGE_RATIO，
+  或还没有统计信息时，以 analysis_limit 执行 ANALYZE（每个索引只抽样，不全表扫描），之后 PRAGMA optimize
+- checkpoint：WAL 模式下 PRAGMA wal_checkpoint(PASSIVE)，不等待读者和写者；回滚日志模式下跳过
+- incremental_vacuum：auto_vacuum = INCREMENTAL 的库每步归还至多 VACUUM_PAGES_PER_STEP 页，分多个短事务；
+  auto_vacuum = NONE 的库只报告空闲页（python migrate_db.py --vacuum 一次性切换为 INCREMENTAL）
+- integrity：PRAGMA quick_check，发现问题写日志并计数。回滚日志模式下读事务期间写者无法提交，
+  改为逐表检查（每张表连同其索引一个短读事务），订单写入可以在表与表之间提交
+
+ANALYZE 和增量 VACUUM 交给单写线程（writer.py），与订单写入排队，不会 database is locked；
+读者不受影响。每次运行的耗时与效果记入 maintenance_runs 表（重启后按上次运行时间继续计算周期），
+并出现在 /metrics 的 maintenance 段和 maintenance_* 指标中。
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+
+from orders_mcp import admission, changes, metrics, queries, writer
+from orders_mcp.config import DB_PATH
+from orders_mcp.log import log
+
+# 维护项=周期秒数，0 表示不执行
+DEFAULT_SCHEDULE = "statistics=3600,checkpoint=300,incremental_vacuum=3600,integrity=86400"
+CHECK_SECONDS = float(os.getenv("MAINTENANCE_CHECK_SECONDS", "60"))
+IDLE_SECONDS = float(os.getenv("MAINTENANCE_IDLE_SECONDS", "10"))
+ANALYZE_CHANGE_RATIO = float(os.getenv("ANALYZE_CHANGE_RATIO", "0.1"))
+ANALYSIS_LIMIT = 1000
+VACUUM_PAGES_PER_STEP = 256
+VACUUM_MAX_STEPS = 64
+INTEGRITY_MAX_ERRORS = 20
+
+# 由 db.ensure_schema() 执行
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS maintenance_runs (
+        task TEXT PRIMARY KEY,
+        finished_at REAL NOT NULL,
+        duration_ms REAL NOT NULL,
+        result TEXT NOT NULL,
+        detail TEXT NOT NULL
+    );
+"""
+
+
+def _parse_schedule(spec):
+    schedule = {}
+    for item in spec.split(","):
+        name, _, value = item.strip().partition("=")
+        if value and float(value) > 0:
+            schedule[name.strip()] = float(value)
+    return schedule
+
+
+SCHEDULE = _parse_schedule(os.getenv("MAINTENANCE_SCHEDULE", DEFAULT_SCHEDULE))
+
+_runs = {}  # 维护项 → 最近一次运行的记录
+
+
+def _connect():
+    return sqlite3.connect(DB_PATH, isolation_level=None, timeout=writer.BUSY_TIMEOUT_SECONDS)
+
+
+# ---------------------------------------------------------------- 维护项
+# 每项返回效果（dict）；含 skipped 时记为跳过
+
+def _stat_rows(conn):
+    try:
+        row = conn.execute(queries.ORDERS_STAT_ROWS).fetchone()
+    except sqlite3.OperationalError:  # 还没有执行过 ANALYZE，sqlite_stat1 不存在
+        return None
+    return int(row[0].split()[0]) if row else None
+
+
+def _analyze(conn):
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute("ANALYZE main")
+    conn.execute("PRAGMA optimize")
+
+
+def _statistics(conn):
+    seq = changes.head(conn)
+    analyzed_seq = json.loads(_runs["statistics"]["detail"]).get("analyze_seq") if "statistics" in _runs else None
+    rows = _stat_rows(conn)
+    changed = seq - analyzed_seq if analyzed_seq is not None else None
+    if rows is not None and changed is not None and changed < max(rows * ANALYZE_CHANGE_RATIO, 1):
+        return {"skipped": "统计信息仍然有效", "changed_orders": changed, "analyze_seq": analyzed_seq}
+    writer.submit(_analyze).result()
+    metrics.inc("maintenance_analyzes")
+    return {"changed_orders": changed, "analyze_seq": seq, "orders_rows": _stat_rows(conn)}
+
+
+def _checkpoint(conn):
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if mode != "wal":
+        return {"skipped": f"journal_mode={mode}"}
+    busy, wal_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    metrics.inc("maintenance_wal_frames_checkpointed", max(checkpointed, 0))
+    return {"wal_frames": wal_frames, "checkpointed": checkpointed, "busy": bool(busy)}
+
+
+def _vacuum_step(conn, pages):
+    # sqlite3 模块对不返回列的语句只 step 一次，而 incremental_vacuum 每 step 一次归还一页
+    for _ in range(pages):
+        conn.execute("PRAGMA incremental_vacuum")
+
+
+def _incremental_vacuum(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    free = start = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return {"skipped": "auto_vacuum 不是 INCREMENTAL", "free_pages": free, "free_bytes": free * page_size}
+    for _ in range(VACUUM_MAX_STEPS):
+        if free == 0:
+            break
+        # 每步一个短事务，步与步之间订单写入可以插队
+        writer.submit(_vacuum_step, min(free, VACUUM_PAGES_PER_STEP)).result()
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    metrics.inc("maintenance_pages_freed", max(start - free, 0))
+    return {"pages_freed": start - free, "bytes_freed": (start - free) * page_size, "free_pages": free}
+
+
+def _integrity(conn):
+    if conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+        checks = [f"PRAGMA quick_check({INTEGRITY_MAX_ERRORS})"]  # WAL 下读者不挡写者，一次检查整个库
+    else:
+        tables = [row[0] for row in conn.execute(queries.MAINTENANCE_TABLES)]
+        checks = ['PRAGMA quick_check("{}")'.format(table.replace('"', '""')) for table in tables]
+    problems = []
+    for check in checks:
+        problems += [row[0] for row in conn.execute(check) if row[0] != "ok"]
+        if len(problems) >= INTEGRITY_MAX_ERRORS:
+            break
+    if not problems:
+        return {"ok": True, "checks": len(checks)}
+    problems = problems[:INTEGRITY_MAX_ERRORS]
+    log(f"⚠️ Integrity check failed: {'; '.join(problems)}")
+    metrics.inc("maintenance_integrity_failures")
+    return {"ok": False, "checks": len(checks), "problems": problems}
+
+
+TASKS = {
+    "statistics": _statistics,
+    "checkpoint": _checkpoint,
+    "incremental_vacuum": _incremental_vacuum,
+    "integrity": _integrity,
+}
+
+
+# ---------------------------------------------------------------- 执行与调度
+
+def _record(conn, task, run):
+    conn.execute(queries.MAINTENANCE_RECORD_RUN,
+                 [task, run["finished_at"], run["duration_ms"], run["result"], run["detail"]])
+
+
+def run_task(task):
+    """立即执行一项维护（阻塞，在线程中调用），返回运行记录"""
+    started = time.perf_counter()
+    conn = _connect()
+    try:
+        effect = TASKS[task](conn)
+        result = "skipped" if "skipped" in effect else "ok"
+    except sqlite3.Error as e:
+        log(f"⚠️ Maintenance {task} failed: {e}")
+        effect, result = {"error": str(e)}, "error"
+    finally:
+        conn.close()
+    duration = time.perf_counter() - started
+    run = {
+        "finished_at": time.time(),
+        "duration_ms": round(duration * 1000, 2),
+        "result": result,
+        "detail": json.dumps(effect, ensure_ascii=False),
+    }
+    _runs[task] = run
+    metrics.inc("maintenance_runs", task=task, result=result)
+    metrics.observe("maintenance_seconds", duration, task=task)
+    writer.submit(_record, task, run)
+    return run
+
+
+def _load_runs():
+    conn = _connect()
+    try:
+        for task, finished_at, duration_ms, result, detail in conn.execute(queries.MAINTENANCE_RUNS):
+            _runs[task] = {"finished_at": finished_at, "duration_ms": duration_ms, "result": result, "detail": detail}
+    finally:
+        conn.close()
+
+
+def _next_task(now):
+    """到期的维护项中拖得最久的一项，以及它是否已拖过两个周期"""
+    due = []
+    for task, interval in SCHEDULE.items():
+        # 从未运行过的算刚好到期，仍等空闲再执行
+        last = _runs[task]["finished_at"] if task in _runs else now - interval
+        if now - last >= interval:
+            due.append(((now - last) / interval, task))
+    if not due:
+        return None, False
+    lateness, task = max(due)
+    return task, lateness >= 2
+
+
+async def run_scheduler():
+    """后台维护循环（随 HTTP 服务的 lifespan 或 stdio 服务的 main 启动）"""
+    await asyncio.to_thread(_load_runs)
+    while True:
+        await asyncio.sleep(CHECK_SECONDS)
+        task, overdue = _next_task(time.time())
+        if task is None or (admission.idle_seconds() < IDLE_SECONDS and not overdue):
+            continue
+        try:
+            await asyncio.to_thread(run_task, task)
+        except Exception as e:
+            log(f"⚠️ Maintenance {task} failed: {e}")
+
+
+def status():
+    """每项维护最近一次运行的时间、耗时、结果和效果（/metrics 的 maintenance 段）"""
+    now = time.time()
+    report = {}
+    for task in sorted(set(SCHEDULE) | set(_runs)):
+        run = _runs.get(task)
+        entry = {"interval_seconds": SCHEDULE.get(task, 0)}
+        if run is not None:
+            entry.update(
+                last_run=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(run["finished_at"])),
+                seconds_ago=round(now - run["finished_at"]),
+                duration_ms=run["duration_ms"],
+                result=run["result"],
+                effect=json.loads(run["detail"]),
+            )
+        report[task] = entry
+    return report
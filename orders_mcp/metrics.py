@@ -0,0 +1,52 @@
+"""
+进程内指标 - 计数器与简单的耗时/大小统计（count / sum / max）
+
+HTTP 模式通过 GET /metrics 以 JSON 输出；单 worker 进程，无需跨进程聚合。
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_summaries = {}
+_started_at = time.time()
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}"
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.get(key)
+        if summary is None:
+            _summaries[key] = {"count": 1, "sum": value, "max": value}
+        else:
+            summary["count"] += 1
+            summary["sum"] += value
+            if value > summary["max"]:
+                summary["max"] = value
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        summaries = {k: dict(v) for k, v in _summaries.items()}
+    for summary in summaries.values():
+        summary["avg"] = summary["sum"] / summary["count"]
+    return {
+        "uptime_seconds": round(time.time() - _started_at, 1),
+        "counters": counters,
+        "summaries": summaries,
+    }
@@ -0,0 +1,151 @@
+"""
+返回体大小控制 - 字段投影（fields）、字节预算（max_bytes）与续传令牌（continuation_token）
+
+超出 max_bytes 时在整行边界截断：第一个 TextContent 仍是合法的 JSON 数组，
+第二个 TextContent 给出 continuation_token，客户端带上相同参数和该令牌即可取下一页。
+带 limit 的工具（list_orders、search_orders）令牌中还记着剩余条数，各页合计不超过首次请求的 limit。
+"""
+
+import base64
+import hashlib
+import json
+import os
+
+from mcp.types import TextContent
+
+from orders_mcp import metrics, tracing
+
+# 默认字节预算（0 表示不限制），调用方可用 max_bytes 参数覆盖
+DEFAULT_MAX_BYTES = int(os.getenv("DEFAULT_MAX_BYTES", "0"))
+
+# 不参与令牌校验的参数（翻页过程中允许变化）
+_PAGING_ARGS = {"continuation_token", "max_bytes", "fields", "offset"}
+
+
+def payload_schema(field_names):
+    """工具 inputSchema 中追加的分页/投影参数"""
+    return {
+        "fields": {
+            "type": "array",
+            "items": {"type": "string", "enum": list(field_names)},
+            "description": "Only return these fields (default: all). Use to keep responses small.",
+        },
+        "max_bytes": {
+            "type": "integer",
+            "description": "Maximum response size in bytes; longer results are cut at a row boundary and a continuation_token is returned",
+        },
+        "continuation_token": {
+            "type": "string",
+            "description": "Token from a previous truncated response; repeat the same arguments to get the next page",
+        },
+    }
+
+
+class PayloadError(ValueError):
+    """fields / continuation_token 参数错误"""
+
+
+def _args_hash(tool, args):
+    stable = {k: v for k, v in args.items() if k not in _PAGING_ARGS}
+    raw = json.dumps([tool, stable], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def encode_token(tool, args, offset, remaining=None):
+    data = {"t": tool, "o": offset, "h": _args_hash(tool, args)}
+    if remaining is not None:
+        data["r"] = remaining
+    raw = json.dumps(data, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_token(tool, args):
+    """校验并解码 continuation_token；没有令牌时返回 None"""
+    token = args.get("continuation_token")
+    if not token:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        data["o"] = int(data["o"])
+        if "r" in data:
+            data["r"] = int(data["r"])
+    except (ValueError, KeyError, TypeError):
+        raise PayloadError("无效的 continuation_token")
+    if data.get("t") != tool or data.get("h") != _args_hash(tool, args):
+        raise PayloadError("continuation_token 与当前参数不匹配，请使用与上一页相同的参数")
+    return data
+
+
+def resolve_offset(tool, args, default=0):
+    """有 continuation_token 时返回令牌中的偏移，否则返回 default"""
+    data = _decode_token(tool, args)
+    return default if data is None else data["o"]
+
+
+def resolve_limit(tool, args, default):
+    """有 continuation_token 时返回令牌中剩余的条数（各页合计不超过首次请求的 limit），否则返回 default"""
+    data = _decode_token(tool, args)
+    return default if data is None else data.get("r", default)
+
+
+def project(row, fields):
+    """按 fields 过滤一行（fields 为空时原样返回）"""
+    if not fields:
+        return row
+    return {k: v for k, v in row.items() if k in fields}
+
+
+def selected_fields(args, available):
+    """校验 fields 参数，返回 available 中被选中的字段（保持原有顺序）；未指定时返回 None"""
+    fields = args.get("fields")
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise PayloadError(f"未知字段: {unknown}，可选: {list(available)}")
+    metrics.inc("payload_fields_dropped", len(available) - len(set(fields)))
+    return [f for f in available if f in fields]
+
+
+def rows_response(tool, rows, args, offset=0, text=None, limit=None):
+    """
+    把结果行序列化为 TextContent；超出字节预算时截断并附带续传令牌。text 为 rows 预先序列化的结果（可选），
+    limit 为本页的行数上限（带 limit 的工具），令牌记下扣除本页后剩余的条数
+    """
+    max_bytes = args.get("max_bytes") or DEFAULT_MAX_BYTES
+    if text is None:
+        with tracing.span("serialize", rows=len(rows)):
+            text = json.dumps(rows, ensure_ascii=False)
+    size = len(text.encode("utf-8"))
+    if not max_bytes or size <= max_bytes:
+        metrics.observe("response_bytes", size, tool=tool)
+        return [TextContent(type="text", text=text)]
+
+    # 逐行累加，至少返回一行保证翻页能前进
+    used = 2  # []
+    count = 0
+    for row in rows:
+        row_size = len(json.dumps(row, ensure_ascii=False).encode("utf-8")) + (2 if count else 0)
+        if count and used + row_size > max_bytes:
+            break
+        used += row_size
+        count += 1
+    if count == len(rows):
+        # 只有一行且本身超出预算：没有可以截掉的
+        metrics.observe("response_bytes", size, tool=tool)
+        return [TextContent(type="text", text=text)]
+
+    text = json.dumps(rows[:count], ensure_ascii=False)
+    metrics.inc("payload_truncated", tool=tool)
+    metrics.inc("payload_truncated_bytes", size - len(text.encode("utf-8")), tool=tool)
+    metrics.observe("response_bytes", used, tool=tool)
+    remaining = None if limit is None else limit - count
+    next_page = {"truncated": True, "returned": count}
+    if remaining is None or remaining > 0:
+        next_page["continuation_token"] = encode_token(tool, args, offset + count, remaining)
+    return [
+        TextContent(type="text", text=text),
+        TextContent(type="text", text=json.dumps(next_page, ensure_ascii=False)),
+    ]
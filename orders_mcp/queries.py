@@ -0,0 +1,460 @@
+"""
+SQL 模板 - 工具用到的所有语句都在这里预先生成
+
+语句文本固定、参数全部绑定（包括 LIMIT/OFFSET），可变部分（聚合函数、排序方向、
+可选筛选条件）用预生成的变体表示，这样每条语句在每个连接上只需 prepare 一次，
+之后命中 sqlite3 的语句缓存。
+"""
+
+from functools import lru_cache
+
+AGGREGATES = ("sum", "avg", "count", "min", "max")
+SUMMARY_FIELDS = ("total_amount", "quantity")
+SORT_ORDERS = ("ASC", "DESC")
+
+# 订单以紧凑编码存于 order_facts（唯一一份，见 db.ORDERS_SQL）：日期为 1970-01-01 起的天数，
+# 状态为 statuses 表中的整数代码，金额、单价为整数分。orders 是换回 YYYY-MM-DD、状态名和元的视图，
+# 自由条件、技能模板照旧按文本列写；热路径模板直接读编码列，参数换算成整数后比较，只在返回的行上解码
+_EPOCH = 2440587.5  # 1970-01-01 的儒略日
+# 预置的状态，代码依次为 1..5（db.ORDERS_SQL 写入 statuses）
+STATUSES = ("待付款", "已付款", "已发货", "已完成", "已取消")
+_DAY_PARAM = f"(julianday(?) - {_EPOCH})"
+_STATUS_PARAM = "(SELECT code FROM statuses WHERE name = ?)"
+
+
+def order_date_of(day):
+    """天数 → YYYY-MM-DD 的 SQL 表达式"""
+    return f"date({day} + {_EPOCH})"
+
+
+def status_of(code):
+    """状态代码 → 状态名的 SQL 表达式：预置的状态直接展开成 CASE（逐行求值比查 statuses 快一倍），其余查表"""
+    names = " ".join(f"WHEN {c} THEN '{name}'" for c, name in enumerate(STATUSES, 1))
+    return f"CASE {code} {names} ELSE (SELECT name FROM statuses WHERE code = {code}) END"
+
+
+def encode_order(row):
+    """orders 视图的一行（new / o：文本日期与状态、以元计的金额）→ order_facts 前十列的 SQL 表达式"""
+    return f"""
+        {row}.order_id, {row}.customer_id, {row}.product_id, {row}.quantity,
+        CAST(round({row}.unit_price * 100) AS INTEGER), CAST(round({row}.total_amount * 100) AS INTEGER),
+        CAST(julianday({row}.order_date) - {_EPOCH} AS INTEGER), (SELECT code FROM statuses WHERE name = {row}.status),
+        {row}.shipping_address, {row}.notes
+    """
+
+
+# order_facts 的列（db.ORDERS_SQL）：订单本身的十列编码后在前，客户 / 产品属性在后
+ORDER_FACT_COLUMNS = """
+    order_id, customer_id, product_id, quantity, unit_price_cents, amount_cents, order_day, status_code,
+    shipping_address, notes, customer_name, region_id, phone, product_name, category
+"""
+
+
+def orders_view(source):
+    """
+    orders 视图（列与最初的 orders 表相同）读 source（某个库的 order_facts）的 SELECT；主库视图与各分片的
+    TEMP 视图分支共用。只在引用到的列上解码，只读金额、客户等列的查询仍走 order_facts 的覆盖索引
+    """
+    return f"""
+    SELECT order_id, customer_id, product_id, quantity, unit_price_cents / 100.0 AS unit_price,
+           amount_cents / 100.0 AS total_amount, {order_date_of("order_day")} AS order_date,
+           {status_of("status_code")} AS status, shipping_address, notes
+    FROM {source}
+"""
+
+# get_order_summary: (aggregate, field) → SQL
+ORDER_SUMMARY = {
+    (agg, field): f"SELECT {agg}({field}) AS result FROM orders"
+    for agg in AGGREGATES
+    for field in SUMMARY_FIELDS
+}
+
+# get_orders_by_customer: (group_by, order) → SQL
+_GROUP_FIELDS = {"customer_id": "c.customer_name", "region_id": "c.region_id"}
+ORDERS_BY_GROUP = {
+    (group_by, order): f"""
+        SELECT {field} AS grp, SUM(o.total_amount) AS total,
+               AVG(o.total_amount) AS avgAmt, COUNT(*) AS cnt
+        FROM orders o JOIN customers c ON o.customer_id = c.customer_id
+        GROUP BY {field}
+        ORDER BY total {order}
+        LIMIT ?
+    """
+    for group_by, field in _GROUP_FIELDS.items()
+    for order in SORT_ORDERS
+}
+
+# 列表、明细、日期范围、图表查询读 order_facts（订单 + 客户/产品属性，客户、产品改名时由触发器同步），
+# 单表索引扫描，不 JOIN customers / products
+_ORDER_DATE = f"{order_date_of('order_day')} AS order_date"
+_STATUS = f"{status_of('status_code')} AS status"
+_TOTAL_AMOUNT = "amount_cents / 100.0 AS total_amount"
+
+# 同一天的订单按订单号倒序：排序是全序，挂载归档分片后翻页也不会重复或遗漏
+_FACTS_ORDER = " ORDER BY order_day DESC, order_id DESC"
+
+
+def _facts_page(columns, where, limit):
+    """内层只取原始列排序分页，外层再解码：挂载归档分片后 order_facts 是 UNION ALL 视图，
+    内层能被展开成各分支按索引顺序的归并；date() 等解码表达式放在内层会阻止展开，变成整体排序"""
+    decoded = ", ".join({"amount_cents": _TOTAL_AMOUNT, "order_day": _ORDER_DATE, "status_code": _STATUS}.get(c, c)
+                        for c in columns)
+    return f"""
+    SELECT {decoded}
+    FROM (
+        SELECT {", ".join(columns)} FROM order_facts{where}{_FACTS_ORDER} LIMIT {limit} OFFSET ?
+    ){_FACTS_ORDER}
+"""
+
+
+# get_orders_by_date_range: 是否按状态筛选 → SQL
+_DATE_RANGE_COLUMNS = ("order_id", "customer_name", "amount_cents", "order_day", "status_code")
+_DATE_RANGE_WHERE = f" WHERE order_day BETWEEN {_DAY_PARAM} AND {_DAY_PARAM}"
+ORDERS_BY_DATE_RANGE = {
+    False: _facts_page(_DATE_RANGE_COLUMNS, _DATE_RANGE_WHERE, "-1"),
+    True: _facts_page(_DATE_RANGE_COLUMNS, _DATE_RANGE_WHERE + f" AND status_code = {_STATUS_PARAM}", "-1"),
+}
+
+# list_orders: (按状态筛选, 按客户筛选) → SQL
+_LIST_ORDERS_COLUMNS = ("order_id", "customer_name", "product_name", "quantity", "amount_cents", "order_day",
+                        "status_code")
+_LIST_ORDERS_FILTERS = {
+    (False, False): "",
+    (True, False): f" WHERE status_code = {_STATUS_PARAM}",
+    (False, True): " WHERE customer_id = ?",
+    (True, True): f" WHERE status_code = {_STATUS_PARAM} AND customer_id = ?",
+}
+LIST_ORDERS = {key: _facts_page(_LIST_ORDERS_COLUMNS, where, "?") for key, where in _LIST_ORDERS_FILTERS.items()}
+
+ORDER_DETAIL = f"""
+    SELECT order_id, customer_id, product_id, quantity, unit_price_cents / 100.0 AS unit_price, {_TOTAL_AMOUNT},
+           {_ORDER_DATE}, {_STATUS}, shipping_address, notes, customer_name, phone, product_name
+    FROM order_facts
+    WHERE order_id = ?
+"""
+
+# 写入显式写 main：挂载归档分片后 orders / order_facts 是只读的 TEMP 视图（orders_mcp/shards.py）。
+# 直接改存储表（main.orders 视图的 INSTEAD OF 触发器不计入 rowcount），只改状态一列
+UPDATE_ORDER_STATUS = f"UPDATE main.order_facts SET status_code = {_STATUS_PARAM} WHERE order_id = ?"
+
+ORDER_DATE = "SELECT order_date FROM orders WHERE order_id = ?"
+
+# 写工具的幂等键（orders_mcp/idempotency.py）：参数为 (键, 未过期的最早时间)
+IDEMPOTENCY_LOOKUP = "SELECT digest, result FROM idempotency_keys WHERE key = ? AND created_at >= ?"
+IDEMPOTENCY_RECORD = "INSERT OR REPLACE INTO idempotency_keys (key, digest, result, created_at) VALUES (?, ?, ?, ?)"
+IDEMPOTENCY_PRUNE = "DELETE FROM idempotency_keys WHERE created_at < ?"
+
+# 数据库维护（orders_mcp/maintenance.py）：每项维护最近一次运行的记录
+# 逐表完整性检查的对象（含 FTS5 的影子表）
+MAINTENANCE_TABLES = "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+MAINTENANCE_RUNS = "SELECT task, finished_at, duration_ms, result, detail FROM maintenance_runs"
+MAINTENANCE_RECORD_RUN = (
+    "INSERT OR REPLACE INTO maintenance_runs (task, finished_at, duration_ms, result, detail) VALUES (?, ?, ?, ?, ?)"
+)
+# 分析快照（orders_mcp/analytics.py）：快照之后第一条变更的 seq 与距今秒数（没有变更时没有行）
+ANALYTICS_FIRST_CHANGE = """
+    SELECT seq, (julianday('now') - julianday(changed_at)) * 86400 FROM order_changes
+    WHERE seq > ? ORDER BY seq LIMIT 1
+"""
+ANALYTICS_META = "SELECT built_at, built_day, change_seq, dimension_version FROM analytics_snapshot"
+ANALYTICS_SET_META = """
+    INSERT INTO analytics_snapshot (built_at, built_day, change_seq, dimension_version) VALUES (?, ?, ?, ?)
+"""
+# 上次 ANALYZE 时订单（order_facts）的行数（sqlite_stat1 的第一个数字）；还没有统计信息时没有行
+ORDERS_STAT_ROWS = "SELECT stat FROM sqlite_stat1 WHERE tbl = 'order_facts' LIMIT 1"
+
+# get_order_trend: (粒度, 按状态筛选) → SQL
+# 分组键是每个桶的起始日期（YYYY-MM-DD）。在 (order_day, ...) 或 (status_code, order_day, ...) 覆盖索引上
+# 做一次整数区间扫描、按天聚合（索引有序，不排序），日期换算只对每天的聚合行做一次，再合并成桶
+GRANULARITIES = ("day", "week", "month", "quarter")
+_DAY = order_date_of("day")
+_BUCKET_START = {
+    "day": _DAY,
+    "week": f"date(day + {_EPOCH}, '-6 days', 'weekday 1')",
+    "month": f"strftime('%Y-%m-01', day + {_EPOCH})",
+    "quarter": f"substr({_DAY}, 1, 5)"
+               f" || printf('%02d', (CAST(strftime('%m', day + {_EPOCH}) AS INTEGER) - 1) / 3 * 3 + 1) || '-01'",
+}
+ORDER_TREND = {
+    (granularity, with_status): f"""
+        SELECT {bucket} AS bucket, SUM(cnt) AS cnt, SUM(amount) / 100.0 AS amount, SUM(qty) AS qty
+        FROM (
+            SELECT order_day AS day, COUNT(*) AS cnt, SUM(amount_cents) AS amount, SUM(quantity) AS qty
+            FROM order_facts
+            WHERE order_day BETWEEN {_DAY_PARAM} AND {_DAY_PARAM}{f" AND status_code = {_STATUS_PARAM}" if with_status else ""}
+            GROUP BY order_day
+        )
+        GROUP BY bucket
+    """
+    for granularity, bucket in _BUCKET_START.items()
+    for with_status in (False, True)
+}
+
+CUSTOMERS = {
+    False: "SELECT * FROM customers",
+    True: "SELECT * FROM customers WHERE region_id = ?",
+}
+
+PRODUCTS = {
+    False: "SELECT * FROM products",
+    True: "SELECT * FROM products WHERE category = ?",
+}
+
+# 维度缓存（orders_mcp/dimensions.py）：整表载入，列顺序与记录字段一致
+DIM_CUSTOMERS = "SELECT customer_id, customer_name, region_id, contact, phone FROM customers"
+DIM_PRODUCTS = "SELECT product_id, product_name, category, unit_price FROM products"
+DIM_REGIONS = "SELECT region_id, region_name, city FROM regions"
+DIMENSION_VERSION = "SELECT version FROM dimension_version"
+
+# 搜索文本：各列以空格相连（搜索词不含空白，不会跨列命中）
+def _search_text(customer_name, product_name, shipping_address, notes):
+    return (f"lower(ifnull({customer_name}, '') || ' ' || ifnull({product_name}, '') || ' '"
+            f" || ifnull({shipping_address}, '') || ' ' || ifnull({notes}, ''))")
+
+
+# 一两个字的搜索词走 orders_grams（FTS5，无内容、detail=none，只存倒排的 rowid 列表）：
+# 每个订单的文档是搜索文本中所有单字和相邻两字，各以 UTF-8 十六进制作为一个词元（unicode61 分词器不会再切开），
+# 短词按同样的编码 MATCH。位置由 gram_positions（1..GRAM_MAX_CHARS）展开，触发器里不能用 WITH RECURSIVE
+GRAM_MAX_CHARS = 4096
+
+
+def grams_doc(customer_name, product_name, shipping_address, notes):
+    """orders_grams 文档的 SQL 表达式（触发器、回填和归档复制共用，参数为列表达式）"""
+    return f"""(
+        SELECT group_concat(hex(substr(t, n, 1)) || ' ' || hex(substr(t, n, 2)), ' ')
+        FROM (SELECT {_search_text(customer_name, product_name, shipping_address, notes)} AS t)
+        JOIN gram_positions ON n <= length(t)
+    )"""
+
+
+GRAM_POSITIONS_FILL = f"""
+    INSERT OR IGNORE INTO gram_positions (n)
+    WITH RECURSIVE p(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM p WHERE n < {GRAM_MAX_CHARS})
+    SELECT n FROM p
+"""
+# 从全文表的内容回填（与 orders_fts 所存的值一致，之后删除时按 orders_fts 的旧值生成 'delete' 文档）
+GRAMS_BACKFILL = f"""
+    INSERT INTO orders_grams (rowid, grams)
+    SELECT rowid, {grams_doc("customer_name", "product_name", "shipping_address", "notes")} FROM orders_fts
+"""
+
+# search_orders: (有 MATCH 表达式, 有短词, 库, 有 orders_grams 的库) → SQL
+# MATCH 走 trigram 索引并按 bm25 排序；不足三个字的词走 orders_grams。
+# 在 orders_grams 建立之前归档的分片没有这张表，这些分支仍以 JSON 数组整体绑定短词、在全文表内逐行 instr 过滤。
+# 每个库（main 与各归档分片，见 orders_mcp/shards.py）有自己的全文表，各为一个 UNION ALL 分支，
+# 参数按分支绑定
+_SEARCH_SHORT_TERMS = f"""
+    NOT EXISTS (
+        SELECT 1 FROM json_each(?) t
+        WHERE instr({_search_text("f.customer_name", "f.product_name", "f.shipping_address", "f.notes")}, t.value) = 0
+    )
+"""
+
+
+def _search_arm(schema, match, short, grams):
+    conditions = ["f.orders_fts MATCH ?"] if match else []
+    if short and grams:
+        conditions.append(f"f.rowid IN (SELECT rowid FROM {schema}.orders_grams WHERE orders_grams MATCH ?)")
+    elif short:
+        conditions.append(_SEARCH_SHORT_TERMS)
+    columns = "snippet(f.orders_fts, -1, '[', ']', '…', 12) AS snippet, f.rank AS rank" if match else "NULL AS snippet"
+    return f"""
+    SELECT o.order_id, f.customer_name, f.product_name, o.amount_cents / 100.0 AS total_amount,
+           {order_date_of("o.order_day")} AS order_date, {status_of("o.status_code")} AS status, {columns}
+    FROM {schema}.orders_fts f JOIN {schema}.order_facts o ON o.rowid = f.rowid
+    WHERE {" AND ".join(conditions)}
+"""
+
+
+@lru_cache(maxsize=64)
+def search_orders_sql(match, short, schemas=("main",), gram_schemas=("main",)):
+    order = "rank" if match else "order_date DESC"
+    arms = " UNION ALL ".join(_search_arm(schema, match, short, schema in gram_schemas) for schema in schemas)
+    return arms + f" ORDER BY {order} LIMIT ? OFFSET ?"
+
+# Top-N / 分位数（orders_mcp/sketches.py）
+_TOP_N_DIMENSIONS = {"customer": "customer_id", "product": "product_id"}
+_TOP_N_COLUMNS = {"total_amount": "amount", "count": "cnt", "quantity": "qty"}
+# 只返回客户 / 产品 ID，名称由维度缓存补上
+TOP_N_SKETCH = {
+    (dim, by): f"""
+        SELECT key, cnt, amount, qty FROM order_counters
+        WHERE dim = '{dim}'
+        ORDER BY {column} DESC, key
+        LIMIT ?
+    """
+    for dim in _TOP_N_DIMENSIONS
+    for by, column in _TOP_N_COLUMNS.items()
+}
+# 没有计数器表时的回退
+TOP_N_SCAN = {
+    (dim, by): f"""
+        SELECT {key} AS key, COUNT(*) AS cnt, SUM(amount_cents) / 100.0 AS amount, SUM(quantity) AS qty
+        FROM order_facts
+        GROUP BY {key}
+        ORDER BY {column} DESC, key
+        LIMIT ?
+    """
+    for dim, key in _TOP_N_DIMENSIONS.items()
+    for by, column in _TOP_N_COLUMNS.items()
+}
+QUANTILE_SKETCH = "SELECT bucket, cnt FROM quantile_sketch WHERE metric = ? AND cnt > 0 ORDER BY bucket"
+QUANTILE_COUNT = "SELECT COUNT(*) FROM order_facts"
+QUANTILE_EXACT = {
+    "total_amount": "SELECT amount_cents / 100.0 FROM order_facts ORDER BY amount_cents",
+    "quantity": "SELECT quantity FROM order_facts ORDER BY quantity",
+}
+
+# 快照（orders_mcp/snapshots.py）：已结束月份的 (月份, 客户, 状态) 聚合
+SNAPSHOT_FROZEN_THROUGH = "SELECT value FROM snapshot_meta WHERE key = 'frozen_through'"
+SNAPSHOT_SET_FROZEN_THROUGH = "INSERT OR REPLACE INTO snapshot_meta (key, value) VALUES ('frozen_through', ?)"
+# 快照已处理到的变更日志位置（orders_mcp/changes.py）
+SNAPSHOT_CHANGE_CURSOR = "SELECT value FROM snapshot_meta WHERE key = 'change_seq'"
+SNAPSHOT_SET_CHANGE_CURSOR = "INSERT OR REPLACE INTO snapshot_meta (key, value) VALUES ('change_seq', ?)"
+SNAPSHOT_CLEAR = "DELETE FROM order_snapshots"
+SNAPSHOT_DELETE_RANGE = "DELETE FROM order_snapshots WHERE period >= ? AND period < ?"
+# 在读连接上聚合（挂载归档分片时 order_facts 含全部订单），结果由写连接 SNAPSHOT_INSERT 写入
+SNAPSHOT_AGGREGATE = f"""
+    SELECT strftime('%Y-%m', order_day + {_EPOCH}), customer_id, {status_of("status_code")},
+           COUNT(*), SUM(amount_cents) / 100.0, SUM(quantity),
+           MIN(amount_cents) / 100.0, MAX(amount_cents) / 100.0, MIN(quantity), MAX(quantity)
+    FROM order_facts
+    WHERE order_day >= {_DAY_PARAM} AND order_day < {_DAY_PARAM}
+    GROUP BY 1, 2, status_code
+"""
+SNAPSHOT_INSERT = "INSERT OR REPLACE INTO order_snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+# 快照 + 实时扫描。参数依次为 frozen_through、快照之后改动过的已冻结月份（JSON 数组，YYYY-MM），各出现两次：
+# frozen_through 之前且没有改动过的月份读快照；frozen_through 之后的订单和改动过的月份
+# （每个月一次 order_day 索引区间扫描）实时扫描
+_SNAPSHOT_VALID = "period < substr(?, 1, 7) AND period NOT IN (SELECT value FROM json_each(?))"
+_CHANGED_MONTHS = (
+    f"json_each(?) m JOIN order_facts o ON o.order_day >= julianday(m.value || '-01') - {_EPOCH}"
+    f" AND o.order_day < julianday(m.value || '-01', '+1 month') - {_EPOCH}"
+)
+_SNAPSHOT_TOTALS = f"""
+    SELECT cnt, amount, qty, min_amount, max_amount, min_qty, max_qty FROM order_snapshots WHERE {_SNAPSHOT_VALID}
+    UNION ALL
+    SELECT COUNT(*), SUM(amount_cents) / 100.0, SUM(quantity),
+           MIN(amount_cents) / 100.0, MAX(amount_cents) / 100.0, MIN(quantity), MAX(quantity)
+    FROM order_facts WHERE order_day >= {_DAY_PARAM}
+    UNION ALL
+    SELECT COUNT(*), SUM(o.amount_cents) / 100.0, SUM(o.quantity),
+           MIN(o.amount_cents) / 100.0, MAX(o.amount_cents) / 100.0, MIN(o.quantity), MAX(o.quantity)
+    FROM {_CHANGED_MONTHS}
+"""
+ORDER_SUMMARY_SNAPSHOT = f"""
+    SELECT SUM(cnt), SUM(amount), SUM(qty), MIN(min_amount), MAX(max_amount), MIN(min_qty), MAX(max_qty)
+    FROM ({_SNAPSHOT_TOTALS})
+"""
+# 每个客户的 (金额, 订单数)；按客户名 / 区域归并、排序在内存中用维度缓存完成（orders_mcp/dimensions.py）
+ORDERS_BY_CUSTOMER_SNAPSHOT = f"""
+    SELECT customer_id, SUM(amount) AS total, SUM(cnt) AS cnt
+    FROM (
+        SELECT customer_id, cnt, amount FROM order_snapshots WHERE {_SNAPSHOT_VALID}
+        UNION ALL
+        SELECT customer_id, COUNT(*), SUM(amount_cents) / 100.0 FROM order_facts
+        WHERE order_day >= {_DAY_PARAM} GROUP BY customer_id
+        UNION ALL
+        SELECT o.customer_id, COUNT(*), SUM(o.amount_cents) / 100.0 FROM {_CHANGED_MONTHS} GROUP BY o.customer_id
+    )
+    GROUP BY customer_id
+"""
+GROUP_BY_FIELDS = tuple(_GROUP_FIELDS)
+
+CUSTOMER_CHART = """
+    SELECT customer_name, SUM(amount_cents) / 100.0 AS total, COUNT(*) AS cnt
+    FROM order_facts
+    WHERE customer_name IS NOT NULL
+    GROUP BY customer_name
+    ORDER BY total DESC
+    LIMIT ?
+"""
+
+
+# 归档分片（orders_mcp/shards.py）。归档范围：[起始, 结束) 内的订单
+_ARCHIVE_RANGE = f"{{o}}order_day >= {_DAY_PARAM} AND {{o}}order_day < {_DAY_PARAM}"
+SHARD_REGISTRY = "SELECT period, start_date, end_date, path FROM main.order_shards WHERE state = 'archived' ORDER BY start_date"
+SHARD_PATH = "SELECT path FROM main.order_shards WHERE period = ?"
+SHARD_ORDER_MONTHS = f"""
+    SELECT DISTINCT strftime('%Y-%m', order_day + {_EPOCH}) FROM main.order_facts WHERE order_day < {_DAY_PARAM}
+"""
+SHARD_DDL = """
+    SELECT sql FROM main.sqlite_master
+    WHERE sql IS NOT NULL AND (type = 'table' AND name IN ('order_facts', 'orders_fts', 'orders_grams')
+                               OR type = 'index' AND tbl_name = 'order_facts')
+    ORDER BY type = 'index'
+"""
+SHARD_BEGIN_ARCHIVE = """
+    INSERT INTO main.order_shards (period, start_date, end_date, path, state) VALUES (?, ?, ?, ?, 'archiving')
+    ON CONFLICT (period) DO UPDATE SET state = 'archiving'
+"""
+# 按 rowid 顺序复制，同一天订单的先后与归档前一致
+SHARD_COPY_ORDERS = f"""
+    INSERT INTO archive.order_facts SELECT * FROM main.order_facts WHERE {_ARCHIVE_RANGE.format(o="")} ORDER BY rowid
+"""
+# 分片中的全文索引行以分片 order_facts 的 rowid 为键
+SHARD_COPY_FTS = f"""
+    INSERT INTO archive.orders_fts (rowid, order_id, customer_name, product_name, shipping_address, notes)
+    SELECT a.rowid, f.order_id, f.customer_name, f.product_name, f.shipping_address, f.notes
+    FROM main.order_facts o
+    JOIN main.orders_fts f ON f.rowid = o.rowid
+    JOIN archive.order_facts a ON a.order_id = o.order_id
+    WHERE {_ARCHIVE_RANGE.format(o="o.")}
+"""
+SHARD_COPY_GRAMS = f"""
+    INSERT INTO archive.orders_grams (rowid, grams)
+    SELECT a.rowid, {grams_doc("f.customer_name", "f.product_name", "f.shipping_address", "f.notes")}
+    FROM main.order_facts o
+    JOIN main.orders_fts f ON f.rowid = o.rowid
+    JOIN archive.order_facts a ON a.order_id = o.order_id
+    WHERE {_ARCHIVE_RANGE.format(o="o.")}
+"""
+# 追加归档到 orders_grams 建立之前的分片时，先为分片中已有的订单补建
+SHARD_BACKFILL_GRAMS = f"""
+    INSERT INTO archive.orders_grams (rowid, grams)
+    SELECT rowid, {grams_doc("customer_name", "product_name", "shipping_address", "notes")} FROM archive.orders_fts
+"""
+SHARD_DELETE_ORDERS = "DELETE FROM main.order_facts WHERE " + _ARCHIVE_RANGE.format(o="")
+# 旧格式分片（orders 为文本表）的转换，legacy 为旧文件、archive 为新文件：订单保留 rowid 编码写入，
+# 全文索引行原样复制（旧文件没有全文表时从新写入的订单生成）
+SHARD_LEGACY_INVALID_DATES = "SELECT COUNT(*) FROM legacy.orders WHERE date(order_date) IS NOT order_date"
+SHARD_LEGACY_STATUSES = """
+    INSERT INTO main.statuses (name)
+    SELECT DISTINCT status FROM legacy.orders WHERE status NOT IN (SELECT name FROM main.statuses)
+"""
+SHARD_LEGACY_ORDERS = f"""
+    INSERT INTO archive.order_facts (rowid, {ORDER_FACT_COLUMNS})
+    SELECT o.rowid, {encode_order("o")}, c.customer_name, c.region_id, c.phone, p.product_name, p.category
+    FROM legacy.orders o
+    LEFT JOIN main.customers c ON c.customer_id = o.customer_id
+    LEFT JOIN main.products p ON p.product_id = o.product_id
+    ORDER BY o.rowid
+"""
+SHARD_LEGACY_FTS = """
+    INSERT INTO archive.orders_fts (rowid, order_id, customer_name, product_name, shipping_address, notes)
+    SELECT rowid, order_id, customer_name, product_name, shipping_address, notes FROM {source}
+"""
+SHARD_MOVE = "UPDATE main.order_shards SET path = ? WHERE period = ?"
+SHARD_FINISH_ARCHIVE = """
+    UPDATE main.order_shards SET state = 'archived', path = ?, orders = orders + ?, archived_at = datetime('now')
+    WHERE period = ?
+"""
+
+# 变更日志（orders_mcp/changes.py）：AUTOINCREMENT 的最大号即最新 seq（旧行清理后仍保留）
+CHANGE_LOG_HEAD = "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'order_changes'), 0)"
+CHANGE_LOG_SINCE = """
+    SELECT seq, op, order_id, customer_id, order_date, old_order_date, status, old_status, changed_at
+    FROM order_changes WHERE seq > ? ORDER BY seq LIMIT ?
+"""
+
+
+def all_statements():
+    """所有固定模板（用于预热和基准测试）"""
+    statements = []
+    for group in (ORDER_SUMMARY, ORDERS_BY_GROUP, ORDERS_BY_DATE_RANGE, LIST_ORDERS, CUSTOMERS, PRODUCTS,
+                  ORDER_TREND):
+        statements.extend(group.values())
+    statements.extend([ORDER_DETAIL, UPDATE_ORDER_STATUS, ORDER_DATE, CUSTOMER_CHART, ORDER_SUMMARY_SNAPSHOT,
+                       ORDERS_BY_CUSTOMER_SNAPSHOT, DIM_CUSTOMERS, DIM_PRODUCTS, DIM_REGIONS, DIMENSION_VERSION])
+    return statements
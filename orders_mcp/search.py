@@ -0,0 +1,49 @@
+"""
+订单全文检索 - orders_fts（FTS5 trigram）上的查询解析与执行
+
+查询按空白/逗号切词，多个词之间是 AND。trigram 按子串匹配，前缀、中缀都能命中，
+中文不需要分词：三个字及以上的词走全文索引并按 bm25 排序；一两个字的词（如“美团”）
+trigram 索引覆盖不到，改查 orders_grams（每个订单出现过的单字和相邻两字，见 queries.grams_doc），
+同样是倒排索引查找，不逐行扫描。
+归档分片各带一份全文表，与主库的合并为一条 UNION ALL 查询后统一排序分页。
+"""
+
+import json
+import re
+
+from orders_mcp import budget, metrics, queries, shards
+
+_SPLIT = re.compile(r"[\s,，、;；]+")
+MIN_INDEXED_CHARS = 3
+
+
+def parse_query(text):
+    """返回 (MATCH 表达式或 None, 短词列表)"""
+    terms = [t.strip('"*') for t in _SPLIT.split(text or "")]
+    terms = [t for t in terms if t]
+    indexed = [t for t in terms if len(t) >= MIN_INDEXED_CHARS]
+    # 与 SQL 的 lower() 一致，只转换 ASCII 字母
+    short = ["".join(c.lower() if c.isascii() else c for c in t) for t in terms if len(t) < MIN_INDEXED_CHARS]
+    match = " AND ".join('"' + t.replace('"', '""') + '"' for t in indexed) or None
+    return match, short
+
+
+def grams_match(short):
+    """短词 → orders_grams 的 MATCH 表达式（词元为 UTF-8 十六进制，与 queries.grams_doc 中 hex() 的结果相同）"""
+    return " AND ".join('"' + t.encode("utf-8").hex().upper() + '"' for t in short)
+
+
+def search_orders(conn, text, limit, offset):
+    match, short = parse_query(text)
+    if not match and not short:
+        return None
+    schemas, gram_schemas = shards.search_schemas(conn), shards.gram_schemas(conn)
+    params = []
+    for schema in schemas:
+        if match:
+            params.append(match)
+        if short:
+            params.append(grams_match(short) if schema in gram_schemas else json.dumps(short, ensure_ascii=False))
+    sql = queries.search_orders_sql(bool(match), bool(short), schemas, gram_schemas)
+    metrics.inc("search_queries", mode="index" if not short else ("index+grams" if match else "grams"))
+    return budget.fetch_rows(conn.execute(sql, params + [limit, offset]))
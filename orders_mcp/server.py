@@ -0,0 +1,98 @@
+"""
+MCP Server 对象 - stdio 与 HTTP/SSE 传输共用
+"""
+
+import asyncio
+import contextvars
+
+from mcp.server import Server, NotificationOptions
+from mcp.shared.exceptions import McpError
+from mcp.types import CallToolRequest, ErrorData, LoggingLevel, Tool
+
+from orders_mcp import admission, skills, tracing
+from orders_mcp.config import DB_PATH
+from orders_mcp.tools import BUILTIN_TOOL_NAMES, all_tool_defs, call_tool
+
+mcp = Server("sqlite-orders-mcp")
+
+
+@mcp.list_tools()
+async def list_tools() -> list[Tool]:
+    """返回工具列表（兼容 MCP 协议，包含 title 供 Copilot Studio 使用）"""
+    skills.remember_session(mcp)
+    return [
+        Tool(name=t["name"], title=t.get("title", t["name"]), description=t["description"], inputSchema=t["inputSchema"])
+        for t in all_tool_defs()
+    ]
+
+
+@mcp.set_logging_level()
+async def set_logging_level(level: LoggingLevel) -> None:
+    """声明 logging 能力：订阅的订单变更以 notifications/message 推送（不区分级别）"""
+
+
+_rejection = contextvars.ContextVar("admission_rejection", default=None)
+
+
+def _client_id():
+    """当前请求的客户端标识（HTTP 传输取请求头，stdio 只有一个客户端）"""
+    request = mcp.request_context.request
+    if request is None:
+        return "stdio"
+    return admission.client_id(request.headers, request.client.host if request.client else None)
+
+
+def _session_id():
+    """Streamable HTTP 取 Mcp-Session-Id 头，旧版 SSE 取 /messages 的 session_id 参数"""
+    request = mcp.request_context.request
+    if request is None:
+        return None
+    return request.headers.get("mcp-session-id") or request.query_params.get("session_id")
+
+
+def _notifier(context):
+    """向当前会话推送订单变更（/sse 的事件流、/mcp 本次请求的响应流或 stdio）"""
+    async def notify(event):
+        await context.session.send_log_message(
+            "info", event, logger="order_changes", related_request_id=context.request_id
+        )
+    return notify
+
+
+async def _call_tool(name, arguments):
+    context = mcp.request_context
+    client = _client_id()
+    with tracing.start_trace(
+        "mcp tools/call", transport="stdio" if context.request is None else "mcp-http", tool=name, client=client,
+        **{"rpc.jsonrpc.request_id": str(context.request_id), "mcp.session.id": _session_id()},
+    ):
+        try:
+            return await call_tool(name, arguments, client=client, notify=_notifier(context))
+        except admission.Overloaded as e:
+            _rejection.set(e)
+            raise
+
+
+mcp.call_tool()(_call_tool)
+_sdk_call_tool = mcp.request_handlers[CallToolRequest]
+
+
+async def _call_tool_request(req):
+    """SDK 会把工具抛出的异常包装成 isError 结果；准入拒绝改为 JSON-RPC error（带 retry_after）"""
+    result = await _sdk_call_tool(req)
+    if (rejected := _rejection.get()) is not None:
+        raise McpError(ErrorData(**rejected.error_data()))
+    return result
+
+
+mcp.request_handlers[CallToolRequest] = _call_tool_request
+
+
+def initialization_options():
+    return mcp.create_initialization_options(NotificationOptions(tools_changed=True))
+
+
+def start_skill_watcher():
+    """加载 skills/ 并启动热加载任务（需在事件循环中调用）"""
+    skills.reload_skills(DB_PATH, BUILTIN_TOOL_NAMES)
+    return asyncio.create_task(skills.watch_skills(DB_PATH, BUILTIN_TOOL_NAMES))
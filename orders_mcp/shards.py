@@ -0,0 +1,343 @@
+"""
+按时间分片的订单归档 - 已结束的年份（或季度）整体移到独立的分片库
+
+shards/orders_<周期>.db 存放该周期的 order_facts（紧凑编码的订单，见 db.ORDERS_SQL）和全文索引，
+由 archive_orders.py 在线归档。
+主库为 WAL 模式，跨文件提交不是原子的，所以分成两步：先持有主库写锁，把该周期的订单（连同分片里已有的）
+复制到一个新的分片文件并提交；再在一个只写主库的事务里删除这些订单、把 order_shards 的登记指向新文件。
+中途崩溃只会留下一个未登记的分片文件（下次归档时删除），订单不会丢失或重复。归档后的分片只读。
+
+查询层：每个连接以只读方式 ATTACH 已登记的分片并开启 mmap，再建与主库同名的 TEMP 视图
+orders / order_facts（主库 UNION ALL 各分片，分片的 orders 分支同样解码）。TEMP 对象优先于 main，
+工具、技能模板和自由条件的 SQL 不用改；写入语句显式写 main。视图中每个分片分支带上该周期的天数上下界，
+SQLite 把它与查询的日期条件下推后合并成一个索引区间：与条件不相交的分片只做一次空的索引定位，
+不读数据页；按日期倒序 + LIMIT 的列表由各分支按索引顺序归并，不整体排序。
+分片中的客户、产品属性不再随改名更新，视图改为从主库维度表实时取（全文索引保留归档时的名称）。
+
+草图（order_counters / quantile_sketch）和月度快照覆盖全部订单：归档删除时 sketch_ad 触发器
+看到 order_shards 中 state = 'archiving' 的周期便不扣减。
+
+紧凑编码之前归档的分片（orders 为文本表）在启动时由 migrate 转换一次，同样写新文件后切换登记。
+"""
+
+import os
+import shutil
+import sqlite3
+from datetime import date
+from pathlib import Path
+
+from orders_mcp import metrics, queries
+from orders_mcp.config import SHARD_DIR
+from orders_mcp.log import log
+
+GRANULARITIES = ("year", "quarter")
+SHARD_PERIOD = os.getenv("SHARD_PERIOD", "year")
+SHARD_MMAP_BYTES = int(os.getenv("SHARD_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+_EPOCH = date(1970, 1, 1)
+# 分片中 order_facts 的客户 / 产品属性列 → 从主库维度表取值的表达式
+_LIVE_ATTRIBUTES = {
+    "customer_name": "(SELECT customer_name FROM main.customers WHERE customer_id = s.customer_id)",
+    "region_id": "(SELECT region_id FROM main.customers WHERE customer_id = s.customer_id)",
+    "phone": "(SELECT phone FROM main.customers WHERE customer_id = s.customer_id)",
+    "product_name": "(SELECT product_name FROM main.products WHERE product_id = s.product_id)",
+    "category": "(SELECT category FROM main.products WHERE product_id = s.product_id)",
+}
+
+# 由 db.ensure_schema() 执行（须在 sketches.SCHEMA_SQL 之前，sketch_ad 触发器引用这张表）
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS order_shards (
+        period TEXT PRIMARY KEY,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        path TEXT NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        state TEXT NOT NULL,
+        archived_at TEXT
+    );
+"""
+
+
+def period_of(day, granularity=SHARD_PERIOD):
+    """日期（YYYY-MM-DD 或 date）所在的周期名：2024 或 2024Q1"""
+    day = date.fromisoformat(str(day)[:10])
+    if granularity == "quarter":
+        return f"{day.year}Q{(day.month - 1) // 3 + 1}"
+    return str(day.year)
+
+
+def bounds(period):
+    """周期 → (起始日期, 结束日期)，左闭右开"""
+    year, _, quarter = period.partition("Q")
+    year = int(year)
+    if not quarter:
+        return date(year, 1, 1), date(year + 1, 1, 1)
+    month = (int(quarter) - 1) * 3 + 1
+    end = date(year + 1, 1, 1) if month == 10 else date(year, month + 3, 1)
+    return date(year, month, 1), end
+
+
+def schema_name(period):
+    return f"shard_{period.lower()}"
+
+
+def shard_path(period):
+    return SHARD_DIR / f"orders_{period}.db"
+
+
+def registered_path(conn, period):
+    """order_shards 中 period 登记的分片文件，没有登记时为 None"""
+    row = conn.execute(queries.SHARD_PATH, [period]).fetchone()
+    return SHARD_DIR / row[0] if row else None
+
+
+def _day(value):
+    return (date.fromisoformat(value) - _EPOCH).days
+
+
+# ---------------------------------------------------------------- 查询层
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _create_views(conn, registry):
+    orders_arms = ["SELECT * FROM main.orders"]
+    facts_arms = ["SELECT * FROM main.order_facts"]
+    facts_columns = _columns(conn, "main", "order_facts")
+    for period, start, end, _path in registry:
+        schema = schema_name(period)
+        lower, upper = _day(start), _day(end)
+        orders_arms.append(
+            queries.orders_view(f"{schema}.order_facts") + f" WHERE order_day >= {lower} AND order_day < {upper}"
+        )
+        columns = ", ".join(_LIVE_ATTRIBUTES.get(c, f"s.{c}") for c in facts_columns)
+        facts_arms.append(
+            f"SELECT {columns} FROM {schema}.order_facts s WHERE s.order_day >= {lower} AND s.order_day < {upper}"
+        )
+    conn.execute("CREATE TEMP VIEW orders AS " + " UNION ALL ".join(orders_arms))
+    conn.execute("CREATE TEMP VIEW order_facts AS " + " UNION ALL ".join(facts_arms))
+
+
+def _attach(conn, registry):
+    conn.execute("DROP VIEW IF EXISTS temp.orders")
+    conn.execute("DROP VIEW IF EXISTS temp.order_facts")
+    wanted = {schema_name(period): path for period, _start, _end, path in registry}
+    previous = {schema_name(period): path for period, _start, _end, path in getattr(conn, "shard_registry", ())}
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    for schema in set(attached):
+        # 追加归档会把登记切到新文件：旧文件先卸下
+        if schema.startswith("shard_") and wanted.get(schema) != previous.get(schema):
+            conn.execute(f"DETACH DATABASE {schema}")
+            attached.discard(schema)
+    search_schemas, gram_schemas = ["main"], ["main"]
+    for schema, path in wanted.items():
+        if schema not in attached:
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", [(SHARD_DIR / path).resolve().as_uri() + "?mode=ro"])
+            conn.execute(f"PRAGMA {schema}.mmap_size = {SHARD_MMAP_BYTES}")
+        tables = {row[0] for row in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE name LIKE 'orders_%'")}
+        if "orders_fts" in tables:
+            search_schemas.append(schema)
+        if "orders_grams" in tables:
+            gram_schemas.append(schema)
+    if registry:
+        _create_views(conn, registry)
+    conn.shard_registry = registry
+    conn.search_schemas = tuple(search_schemas)
+    conn.gram_schemas = tuple(gram_schemas)
+    metrics.inc("shard_attaches")
+
+
+def sync(conn):
+    """分片登记变化时重新 ATTACH 并重建视图；每次工具调用开始时调用，没有其他连接提交过写入时只读一次 data_version"""
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if getattr(conn, "shard_data_version", None) == data_version:
+        return
+    try:
+        registry = tuple(tuple(row) for row in conn.execute(queries.SHARD_REGISTRY))
+    except sqlite3.OperationalError:
+        registry = ()  # ensure_schema 之前（没有 order_shards 表）
+    if registry != getattr(conn, "shard_registry", ()):
+        try:
+            _attach(conn, registry)
+        except sqlite3.OperationalError as e:
+            # 连接上还有未结束的语句时不能 DETACH / 重建视图，下次调用再试
+            log(f"⚠️ Shard attach deferred: {e}")
+            return
+    conn.shard_data_version = data_version
+
+
+def search_schemas(conn):
+    """有全文索引的库：main 加上已挂载的分片"""
+    return getattr(conn, "search_schemas", ("main",))
+
+
+def gram_schemas(conn):
+    """有短词 n-gram 索引（orders_grams）的库；在它建立之前归档的分片没有"""
+    return getattr(conn, "gram_schemas", ("main",))
+
+
+# ---------------------------------------------------------------- 归档
+
+def closed_periods(conn, before, granularity=SHARD_PERIOD):
+    """主库中有订单、且在 before 之前已结束的周期"""
+    months = [row[0] for row in conn.execute(queries.SHARD_ORDER_MONTHS, [before.isoformat()])]
+    periods = {period_of(month + "-01", granularity) for month in months}
+    return sorted(p for p in periods if bounds(p)[1] <= before)
+
+
+def _create_shard(conn, path):
+    """
+    按主库 order_facts / 全文索引的建表与索引语句建分片（不含触发器，已存在则跳过）；
+    返回分片中已有订单是否需要补建 orders_grams（分片早于 orders_grams 建立）
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    shard = sqlite3.connect(path)
+    existing = {row[0] for row in shard.execute("SELECT name FROM sqlite_master")}
+    with shard:
+        for (sql,) in conn.execute(queries.SHARD_DDL):
+            shard.execute(sql.replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS ", 1)
+                          .replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1)
+                          .replace("CREATE VIRTUAL TABLE ", "CREATE VIRTUAL TABLE IF NOT EXISTS ", 1))
+    shard.close()
+    return "orders_fts" in existing and "orders_grams" not in existing
+
+
+def _staging_path(period, current):
+    """
+    本次归档写入的分片文件：与当前登记的文件交替使用两个名字。
+    同名的残留文件（上次归档中断，或已被替换、不再登记的旧分片）先删除
+    """
+    path = shard_path(period)
+    if current is not None and path.name == current.name:
+        path = SHARD_DIR / f"orders_{period}.1.db"
+    path.unlink(missing_ok=True)
+    return path
+
+
+def _copy(database, path, start, end, backfill_grams):
+    """
+    在另一条只读主库的连接上把 [start, end) 的订单复制到分片 path 并提交（只写分片，单文件提交）；
+    返回复制的订单数。调用方持有主库写锁，复制期间主库中这些订单不会变
+    """
+    copier = sqlite3.connect(Path(database).resolve().as_uri() + "?mode=ro", uri=True, isolation_level=None)
+    try:
+        tables = {row[0] for row in copier.execute("SELECT name FROM sqlite_master WHERE name LIKE 'orders_%'")}
+        has_fts, has_grams = "orders_fts" in tables, "orders_grams" in tables
+        copier.execute("ATTACH DATABASE ? AS archive", [str(path)])
+        copier.execute("BEGIN")
+        try:
+            moved = copier.execute(queries.SHARD_COPY_ORDERS, [start, end]).rowcount
+            if has_grams and backfill_grams:
+                copier.execute(queries.SHARD_BACKFILL_GRAMS)
+            if has_fts:
+                copier.execute(queries.SHARD_COPY_FTS, [start, end])
+            if has_grams:
+                copier.execute(queries.SHARD_COPY_GRAMS, [start, end])
+            copier.execute("COMMIT")
+        except BaseException:
+            copier.execute("ROLLBACK")
+            raise
+        copier.execute("ANALYZE archive")
+        return moved
+    finally:
+        copier.close()
+
+
+def archive(conn, period):
+    """把主库中 period 的订单移到分片，返回移动的订单数。conn 为普通连接（不带 TEMP 视图），isolation_level=None"""
+    start, end = (d.isoformat() for d in bounds(period))
+    current = registered_path(conn, period)
+    path = _staging_path(period, current)
+    if current is not None:
+        shutil.copyfile(current, path)  # 已登记的分片只读，直接复制文件后追加
+    backfill_grams = _create_shard(conn, path)
+    database = conn.execute("PRAGMA database_list").fetchone()[2]
+
+    # 写锁一直持有到主库提交：复制与删除之间不会有其他写入改动这些订单
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        moved = _copy(database, path, start, end, backfill_grams)
+        conn.execute(queries.SHARD_BEGIN_ARCHIVE, [period, start, end, path.name])
+        conn.execute(queries.SHARD_DELETE_ORDERS, [start, end])
+        conn.execute(queries.SHARD_FINISH_ARCHIVE, [path.name, moved, period])
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        path.unlink(missing_ok=True)
+        raise
+    if current is not None:
+        # 已挂载旧文件的连接在下次 sync 时切到新文件，在此之前仍能读已打开的旧文件
+        current.unlink(missing_ok=True)
+    return moved
+
+
+# ---------------------------------------------------------------- 旧格式分片
+
+def _legacy(path):
+    """分片文件是否为紧凑编码之前的格式（orders 为文本表）"""
+    shard = sqlite3.connect(path.resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        return shard.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'orders'").fetchone() is not None
+    finally:
+        shard.close()
+
+
+def _convert(database, legacy, path):
+    """在另一条只读主库的连接上把旧分片 legacy 的订单与全文索引编码写入新分片 path 并提交"""
+    copier = sqlite3.connect(Path(database).resolve().as_uri() + "?mode=ro", uri=True, isolation_level=None)
+    try:
+        copier.execute("ATTACH DATABASE ? AS archive", [str(path)])
+        copier.execute("ATTACH DATABASE ? AS legacy", [legacy.resolve().as_uri() + "?mode=ro"])
+        tables = {row[0] for row in copier.execute("SELECT name FROM archive.sqlite_master")}
+        legacy_tables = {row[0] for row in copier.execute("SELECT name FROM legacy.sqlite_master")}
+        copier.execute("BEGIN")
+        try:
+            copier.execute(queries.SHARD_LEGACY_ORDERS)
+            if "orders_fts" in tables:
+                source = "legacy.orders_fts" if "orders_fts" in legacy_tables else "archive.order_facts"
+                copier.execute(queries.SHARD_LEGACY_FTS.format(source=source))
+            if "orders_grams" in tables:
+                copier.execute(queries.SHARD_BACKFILL_GRAMS)
+            copier.execute("COMMIT")
+        except BaseException:
+            copier.execute("ROLLBACK")
+            raise
+        copier.execute("ANALYZE archive")
+    finally:
+        copier.close()
+
+
+def migrate(conn):
+    """
+    把旧格式的已登记分片转换为紧凑编码（db.ensure_schema 在主库转换之后调用），返回转换的分片数。
+    与归档相同：写到交替名字的新文件，再把登记指向它、删除旧文件；中途失败时旧文件与登记不变
+    """
+    database = conn.execute("PRAGMA database_list").fetchone()[2]
+    converted = 0
+    for period, _start, _end, name in conn.execute(queries.SHARD_REGISTRY).fetchall():
+        current = SHARD_DIR / name
+        if not current.exists() or not _legacy(current):
+            continue
+        conn.execute("ATTACH DATABASE ? AS legacy", [current.resolve().as_uri() + "?mode=ro"])
+        try:
+            invalid = conn.execute(queries.SHARD_LEGACY_INVALID_DATES).fetchone()[0]
+            if invalid:
+                raise ValueError(f"分片 {name} 中 {invalid} 条订单的 order_date 不是 YYYY-MM-DD，无法编码为天数")
+            with conn:
+                conn.execute(queries.SHARD_LEGACY_STATUSES)  # 编码时按主库的状态表取代码
+        finally:
+            conn.execute("DETACH DATABASE legacy")
+        path = _staging_path(period, current)
+        _create_shard(conn, path)
+        try:
+            _convert(database, current, path)
+            with conn:
+                conn.execute(queries.SHARD_MOVE, [path.name, period])
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        current.unlink(missing_ok=True)
+        converted += 1
+        log(f"🔄 shard {period} migrated to compact encoding ({path.name})")
+    return converted
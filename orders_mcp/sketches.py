@@ -0,0 +1,176 @@
+"""
+Top-N 与分位数草图 - 由触发器随订单增删改增量维护
+
+- order_counters：每个客户 / 产品一行 (订单数, 金额, 数量)。客户、产品是有界的维度表，
+  逐键计数比 Space-Saving 之类的近似 heavy-hitters 更省事，而且没有误差
+- quantile_sketch：total_amount / quantity 的对数分桶直方图（DDSketch）。
+  桶 i 覆盖 (γ^(i-1), γ^i]，取 2γ^i/(γ+1) 作为估计值，任意分位数的相对误差 ≤ ALPHA；
+  桶数只与取值范围有关（金额 1 ~ 1e8 约 920 个桶），与订单量无关。支持删除，改状态不触发
+
+触发器在订单存储表 order_facts 上，金额由整数分换算（与 orders 视图的 total_amount 相同）。
+get_top_n 只读计数器（本身就是精确值）；分位数的 exact 模式直接扫描订单，用于核对或需要精确值的场景。
+"""
+
+import math
+import sqlite3
+
+from orders_mcp import metrics, queries
+
+ALPHA = 0.01
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+ZERO_BUCKET = -(2 ** 31)  # 值 <= 0 的订单
+MODES = ("approx", "exact")
+DIMENSIONS = ("customer", "product")
+RANK_BY = ("total_amount", "count", "quantity")
+QUANTILE_METRICS = ("total_amount", "quantity")
+
+
+def _bucket(expr):
+    return (f"(CASE WHEN {expr} > 0 THEN CAST(ceil(ln({expr}) / {math.log(GAMMA)!r}) AS INTEGER)"
+            f" ELSE {ZERO_BUCKET} END)")
+
+
+def _amount(row):
+    return f"({row}.amount_cents / 100.0)"
+
+
+def _apply(row, sign):
+    return f"""
+        INSERT INTO order_counters (dim, key, cnt, amount, qty) VALUES
+            ('customer', {row}.customer_id, {sign}, {sign} * {_amount(row)}, {sign} * {row}.quantity),
+            ('product', {row}.product_id, {sign}, {sign} * {_amount(row)}, {sign} * {row}.quantity)
+        ON CONFLICT (dim, key) DO UPDATE SET
+            cnt = cnt + excluded.cnt, amount = amount + excluded.amount, qty = qty + excluded.qty;
+        INSERT INTO quantile_sketch (metric, bucket, cnt) VALUES
+            ('total_amount', {_bucket(_amount(row))}, {sign}),
+            ('quantity', {_bucket(row + '.quantity')}, {sign})
+        ON CONFLICT (metric, bucket) DO UPDATE SET cnt = cnt + excluded.cnt;
+    """
+
+
+_CLEANUP = f"""
+        DELETE FROM order_counters
+        WHERE (dim, key) IN (('customer', old.customer_id), ('product', old.product_id)) AND cnt <= 0;
+        DELETE FROM quantile_sketch
+        WHERE (metric, bucket) IN (('total_amount', {_bucket(_amount('old'))}),
+                                   ('quantity', {_bucket('old.quantity')})) AND cnt <= 0;
+"""
+
+# 由 db.ensure_schema() 执行；首句在 SQLite 未编译数学函数时直接失败，整段回滚
+SCHEMA_SQL = f"""
+    SELECT ln(1);
+    BEGIN;
+
+    CREATE TABLE IF NOT EXISTS order_counters (
+        dim TEXT NOT NULL,
+        key TEXT NOT NULL,
+        cnt INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        qty INTEGER NOT NULL,
+        PRIMARY KEY (dim, key)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS quantile_sketch (
+        metric TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        cnt INTEGER NOT NULL,
+        PRIMARY KEY (metric, bucket)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS sketch_ai AFTER INSERT ON order_facts BEGIN
+        {_apply('new', '+1')}
+    END;
+
+    -- 归档（orders_mcp/shards.py）删除的订单仍计入草图；旧版本的触发器没有这个判断，每次启动按当前定义重建
+    DROP TRIGGER IF EXISTS sketch_ad;
+    CREATE TRIGGER sketch_ad AFTER DELETE ON order_facts
+    WHEN NOT EXISTS (
+        SELECT 1 FROM order_shards
+        WHERE state = 'archiving' AND {queries.order_date_of("old.order_day")} >= start_date
+          AND {queries.order_date_of("old.order_day")} < end_date
+    ) BEGIN
+        {_apply('old', '-1')}
+        {_CLEANUP}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS sketch_au
+    AFTER UPDATE OF customer_id, product_id, amount_cents, quantity ON order_facts BEGIN
+        {_apply('old', '-1')}
+        {_apply('new', '+1')}
+        {_CLEANUP}
+    END;
+
+    INSERT INTO order_counters
+    SELECT 'customer', customer_id, COUNT(*), SUM(total_amount), SUM(quantity) FROM orders
+    WHERE NOT EXISTS (SELECT 1 FROM order_counters WHERE dim = 'customer')
+    GROUP BY customer_id;
+
+    INSERT INTO order_counters
+    SELECT 'product', product_id, COUNT(*), SUM(total_amount), SUM(quantity) FROM orders
+    WHERE NOT EXISTS (SELECT 1 FROM order_counters WHERE dim = 'product')
+    GROUP BY product_id;
+
+    INSERT INTO quantile_sketch
+    SELECT 'total_amount', {_bucket('total_amount')} AS b, COUNT(*) FROM orders
+    WHERE NOT EXISTS (SELECT 1 FROM quantile_sketch WHERE metric = 'total_amount')
+    GROUP BY b;
+
+    INSERT INTO quantile_sketch
+    SELECT 'quantity', {_bucket('quantity')} AS b, COUNT(*) FROM orders
+    WHERE NOT EXISTS (SELECT 1 FROM quantile_sketch WHERE metric = 'quantity')
+    GROUP BY b;
+
+    COMMIT;
+"""
+
+
+def _bucket_value(bucket):
+    if bucket == ZERO_BUCKET:
+        return 0
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+
+def _ranks(percentiles, n):
+    """百分位 → 0 基排名（最近秩，向下取整）"""
+    return {p: int(p / 100 * (n - 1)) for p in percentiles}
+
+
+def quantiles(conn, metric, percentiles, mode="approx"):
+    """返回 (订单数, {百分位: 值})"""
+    metrics.inc("sketch_queries", kind="quantile", mode=mode)
+    if mode == "exact":
+        n = conn.execute(queries.QUANTILE_COUNT).fetchone()[0]
+        wanted = _ranks(percentiles, n)
+        by_rank = {}
+        for index, (value,) in enumerate(conn.execute(queries.QUANTILE_EXACT[metric])):
+            by_rank[index] = value
+            if index >= max(wanted.values(), default=0):
+                break
+        return n, {p: by_rank.get(rank) for p, rank in wanted.items()}
+
+    buckets = conn.execute(queries.QUANTILE_SKETCH, [metric]).fetchall()
+    n = sum(cnt for _bucket_id, cnt in buckets)
+    result = {}
+    for p, rank in sorted(_ranks(percentiles, n).items(), key=lambda item: item[1]):
+        seen = 0
+        for bucket, cnt in buckets:
+            seen += cnt
+            if seen > rank:
+                result[p] = round(_bucket_value(bucket), 2)
+                break
+        else:
+            result[p] = None
+    return n, result
+
+
+def top_n(conn, dims, dimension, by, limit):
+    """返回 [(名称, 订单数, 金额, 数量)]；名称来自维度缓存，查不到时用 ID"""
+    try:
+        rows = conn.execute(queries.TOP_N_SKETCH[(dimension, by)], [limit]).fetchall()
+        metrics.inc("sketch_queries", kind="top_n", mode="counters")
+    except sqlite3.OperationalError:
+        # 计数器表不存在（SQLite 未编译数学函数，草图整体未建）：扫描订单表，结果相同
+        rows = conn.execute(queries.TOP_N_SCAN[(dimension, by)], [limit]).fetchall()
+        metrics.inc("sketch_queries", kind="top_n", mode="scan")
+    name = dims.customer_name if dimension == "customer" else dims.product_name
+    return [(name(key), cnt, amount, qty) for key, cnt, amount, qty in rows]
@@ -0,0 +1,252 @@
+"""
+SQL 模板工具（Skill）- 从 skills/ 目录加载声明式 SQL 模板，支持热加载
+
+每个 *.yaml 文件定义一个只读 Tool：
+    name / title / description   工具元信息
+    sql                          带命名参数（:param）的 SELECT 语句
+    parameters                   参数 JSON Schema（name → schema）
+    required                     必填参数列表
+    max_rows                     最多返回行数（默认 200）
+    require_index                为 true 时，查询计划出现全表扫描则拒绝加载
+
+加载时在只读连接上预编译校验，执行时在工作线程的连接上同样装上只读 authorizer。
+"""
+
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import weakref
+
+import yaml
+from mcp.types import TextContent
+
+from orders_mcp.config import SKILLS_DIR
+from orders_mcp.log import log
+
+# ============ 配置 ============
+POLL_INTERVAL = float(os.getenv("SKILLS_POLL_INTERVAL", "2"))
+DEFAULT_MAX_ROWS = 200
+
+# 编译模板时允许的操作（其余一律拒绝，保证模板只读）
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+_PARAM_RE = re.compile(r"(?<!:):([A-Za-z_]\w*)")
+_NAME_RE = re.compile(r"^[A-Za-z][A-Za-z0-9_]{0,63}$")
+
+# 当前生效的模板（整体替换，保证原子性；执行中的请求持有旧对象不受影响）
+_registry = {}
+_fingerprint = None
+# 调用过 tools/list 的会话，模板变化时推送 tools/list_changed
+_sessions = weakref.WeakSet()
+
+
+class SkillError(Exception):
+    """模板定义或校验错误"""
+
+
+def _read_only_authorizer(action, arg1, arg2, db_name, trigger):
+    if action in _ALLOWED_ACTIONS:
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+def _open_validation_connection(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.set_authorizer(_read_only_authorizer)
+    return conn
+
+
+def compile_skill(data, conn, reserved_names=()):
+    """校验并预编译一个模板，返回工具定义 dict"""
+    if not isinstance(data, dict):
+        raise SkillError("模板必须是 YAML 对象")
+
+    name = data.get("name")
+    if not isinstance(name, str) or not _NAME_RE.match(name):
+        raise SkillError(f"无效工具名: {name!r}")
+    if name in reserved_names:
+        raise SkillError(f"工具名与内置工具冲突: {name}")
+
+    sql = (data.get("sql") or "").strip().rstrip(";")
+    if not sql:
+        raise SkillError(f"{name}: 缺少 sql")
+
+    parameters = data.get("parameters") or {}
+    if not isinstance(parameters, dict):
+        raise SkillError(f"{name}: parameters 必须是 name → schema 映射")
+    required = list(data.get("required") or [])
+    unknown = [p for p in required if p not in parameters]
+    if unknown:
+        raise SkillError(f"{name}: required 中的参数未声明: {unknown}")
+    used = set(_PARAM_RE.findall(sql))
+    undeclared = used - set(parameters)
+    if undeclared:
+        raise SkillError(f"{name}: SQL 使用了未声明的参数: {sorted(undeclared)}")
+
+    # 预编译：语法、表/列是否存在、是否只读都在 prepare 阶段由 SQLite 检查
+    try:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", {p: None for p in parameters}).fetchall()
+    except sqlite3.Error as e:
+        raise SkillError(f"{name}: SQL 编译失败: {e}")
+
+    details = [row[3] for row in plan]
+    full_scans = [d for d in details if d.startswith("SCAN ") and "USING" not in d]
+    if full_scans and data.get("require_index"):
+        raise SkillError(f"{name}: 查询计划包含全表扫描: {full_scans}")
+
+    max_rows = int(data.get("max_rows", DEFAULT_MAX_ROWS))
+    if max_rows <= 0:
+        raise SkillError(f"{name}: max_rows 必须大于 0")
+
+    return {
+        "name": name,
+        "title": data.get("title", name),
+        "description": data.get("description", name),
+        "inputSchema": {
+            "type": "object",
+            "properties": parameters,
+            "required": required,
+        },
+        "sql": sql,
+        "defaults": {p: s["default"] for p, s in parameters.items() if isinstance(s, dict) and "default" in s},
+        "max_rows": max_rows,
+        "plan": details,
+        "full_scans": full_scans,
+    }
+
+
+def _scan_dir():
+    """目录指纹：文件名 + 修改时间 + 大小"""
+    if not SKILLS_DIR.is_dir():
+        return ()
+    entries = []
+    for path in sorted(SKILLS_DIR.glob("*.y*ml")):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((path.name, st.st_mtime_ns, st.st_size))
+    return tuple(entries)
+
+
+def reload_skills(db_path, reserved_names=()):
+    """重新加载 skills/ 目录；工具集合有变化时返回 True
+
+    单个文件出错时保留该工具的上一个有效版本，避免编辑器写到一半的文件让工具消失。
+    """
+    global _registry, _fingerprint
+
+    fingerprint = _scan_dir()
+    if fingerprint == _fingerprint:
+        return False
+
+    old_by_file = {s["file"]: s for s in _registry.values()}
+    loaded = {}
+    conn = _open_validation_connection(db_path)
+    try:
+        for stamp in fingerprint:
+            file_name = stamp[0]
+            skill = old_by_file.get(file_name)
+            if skill is not None and skill["stamp"] == stamp:
+                loaded[skill["name"]] = skill
+                continue
+            try:
+                data = yaml.safe_load((SKILLS_DIR / file_name).read_text(encoding="utf-8"))
+                skill = compile_skill(data, conn, reserved_names)
+            except (OSError, yaml.YAMLError, SkillError, TypeError, ValueError) as e:
+                log(f"⚠️  Skill 加载失败 {file_name}: {e}")
+                skill = old_by_file.get(file_name)
+                if skill is None:
+                    continue
+            else:
+                skill["file"] = file_name
+                skill["stamp"] = stamp
+                if skill["full_scans"]:
+                    log(f"⚠️  Skill {skill['name']} 未使用索引: {skill['full_scans']}")
+            if skill["name"] in loaded:
+                log(f"⚠️  Skill 重名，忽略 {file_name}: {skill['name']}")
+                continue
+            loaded[skill["name"]] = skill
+    finally:
+        conn.close()
+
+    changed = _tool_signature(loaded) != _tool_signature(_registry)
+    _registry = loaded
+    _fingerprint = fingerprint
+    if changed:
+        log(f"🔄 Skills 已加载: {sorted(loaded)}")
+    return changed
+
+
+def _tool_signature(registry):
+    return sorted(
+        json.dumps({k: s[k] for k in ("name", "title", "description", "inputSchema")}, sort_keys=True)
+        for s in registry.values()
+    )
+
+
+def list_skill_defs():
+    """当前模板的工具定义（与 TOOLS_DEF 同结构）"""
+    return [
+        {k: s[k] for k in ("name", "title", "description", "inputSchema")}
+        for s in _registry.values()
+    ]
+
+
+def get_skill(name):
+    return _registry.get(name)
+
+
+def run_skill(skill, args, conn):
+    """执行模板，返回行（dict 列表）"""
+    params = {p: None for p in skill["inputSchema"]["properties"]}
+    params.update(skill["defaults"])
+    params.update({k: v for k, v in (args or {}).items() if k in params})
+    missing = [p for p in skill["inputSchema"]["required"] if params.get(p) is None]
+    if missing:
+        raise ValueError(f"缺少参数: {missing}")
+
+    cur = conn.execute(skill["sql"], params)
+    columns = [d[0] for d in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchmany(skill["max_rows"])]
+
+
+async def call_skill(skill, args, get_db_connection):
+    # 执行连接可写，且带有校验连接没有的 TEMP 视图和挂载的分片：执行期间同样只允许读
+    # （设置 authorizer 会使该连接已缓存的语句重新编译一次）
+    conn = get_db_connection()
+    conn.set_authorizer(_read_only_authorizer)
+    try:
+        rows = run_skill(skill, args, conn)
+    finally:
+        conn.set_authorizer(None)
+    return [TextContent(type="text", text=json.dumps(rows, ensure_ascii=False))]
+
+
+# ============ tools/list_changed 通知 ============
+def remember_session(server):
+    """记录当前请求所属会话（在 list_tools 中调用）"""
+    try:
+        _sessions.add(server.request_context.session)
+    except LookupError:
+        pass
+
+
+async def notify_tools_changed():
+    for session in list(_sessions):
+        try:
+            await session.send_tool_list_changed()
+        except Exception:
+            _sessions.discard(session)
+
+
+async def watch_skills(db_path, reserved_names=()):
+    """后台轮询 skills/ 目录，变化时热加载并通知客户端"""
+    while True:
+        await asyncio.sleep(POLL_INTERVAL)
+        try:
+            if reload_skills(db_path, reserved_names):
+                await notify_tools_changed()
+        except Exception as e:
+            log(f"⚠️  Skills 热加载出错: {e}")
@@ -0,0 +1,164 @@
+"""
+慢查询日志 - 超过 SLOW_QUERY_MS 的 SQL 连同执行计划写入滚动 JSONL 文件
+
+get_db_connection() 返回的连接使用 LoggedConnection：每条语句从 execute 到取完结果计时，
+超过阈值（或被查询预算中止）时记录：
+    工具名、规范化 SQL（字面量替换为 ?）、脱敏参数（字符串只保留长度）、耗时、返回行数、
+    VM 步数（扫描量的近似，来自查询预算的 progress handler）、EXPLAIN QUERY PLAN
+文件按 SLOW_LOG_MAX_BYTES 滚动，保留 SLOW_LOG_BACKUPS 个旧文件；read_entries() 供管理工具查询。
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from orders_mcp import metrics, tracing
+from orders_mcp.config import LOG_DIR
+from orders_mcp.log import JsonlLog
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_LOG_PATH = LOG_DIR / "slow_queries.jsonl"
+SLOW_LOG_MAX_BYTES = int(os.getenv("SLOW_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+SLOW_LOG_BACKUPS = int(os.getenv("SLOW_LOG_BACKUPS", "3"))
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+_local = threading.local()
+_log = JsonlLog(SLOW_LOG_PATH, SLOW_LOG_MAX_BYTES, SLOW_LOG_BACKUPS)
+
+
+def set_context(tool, steps=None):
+    """当前线程正在执行的工具；steps 为返回已执行 VM 步数的函数（可选）"""
+    _local.tool = tool
+    _local.steps = steps
+
+
+def clear_context():
+    _local.tool = None
+    _local.steps = None
+
+
+def _current_steps():
+    steps = getattr(_local, "steps", None)
+    return steps() if steps else 0
+
+
+def normalize_sql(sql):
+    return _LITERALS.sub("?", _WHITESPACE.sub(" ", sql).strip())
+
+
+def _redact_value(value):
+    if isinstance(value, str):
+        return f"<text:{len(value)}>"
+    if isinstance(value, bytes):
+        return f"<blob:{len(value)}>"
+    return value
+
+
+def redact(params):
+    if isinstance(params, dict):
+        return {k: _redact_value(v) for k, v in params.items()}
+    return [_redact_value(v) for v in params or ()]
+
+
+def _query_plan(conn, sql, params):
+    try:
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error:
+        return None
+    return [row[3] for row in rows]
+
+
+def record(conn, sql, params, duration_ms, rows, steps, error=None):
+    tool = getattr(_local, "tool", None)
+    entry = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "tool": tool,
+        "trace_id": tracing.current_trace_id(),
+        "sql": normalize_sql(sql),
+        "params": redact(params),
+        "duration_ms": round(duration_ms, 1),
+        "rows_returned": rows,
+        "vm_steps": steps,
+        "plan": _query_plan(conn, sql, params),
+    }
+    if error:
+        entry["error"] = error
+    _log.write(entry)
+    metrics.inc("slow_queries", tool=tool)
+
+
+class LoggedCursor(sqlite3.Cursor):
+    _started = None
+
+    def execute(self, sql, parameters=()):
+        self._sql, self._params, self._rows = sql, parameters, 0
+        self._steps_at_start = _current_steps()
+        self._started = time.perf_counter()
+        self._started_ns = time.time_ns()
+        try:
+            super().execute(sql, parameters)
+        except sqlite3.Error as e:
+            self._finish(0, str(e))
+            raise
+        if self.description is None:
+            self._finish(max(self.rowcount, 0))
+        return self
+
+    def _fetch(self, fetch, *args):
+        try:
+            result = fetch(*args)
+        except sqlite3.Error as e:
+            self._finish(self._rows, str(e))
+            raise
+        return result
+
+    def __next__(self):
+        try:
+            row = self._fetch(super().__next__)
+        except StopIteration:
+            self._finish(self._rows)
+            raise
+        self._rows += 1
+        return row
+
+    def fetchone(self):
+        row = self._fetch(super().fetchone)
+        self._finish(self._rows + (row is not None))
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(super().fetchmany, self.arraysize if size is None else size)
+        self._finish(self._rows + len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(super().fetchall)
+        self._finish(self._rows + len(rows))
+        return rows
+
+    def _finish(self, rows, error=None):
+        self._rows = rows
+        if self._started is None:
+            return
+        duration_ms = (time.perf_counter() - self._started) * 1000
+        self._started = None
+        tracing.record_span("db.query", self._started_ns, self._started_ns + int(duration_ms * 1e6), error,
+                            **{"db.system": "sqlite", "db.statement": normalize_sql(self._sql), "db.rows": rows})
+        if duration_ms >= SLOW_QUERY_MS or error:
+            record(self.connection, self._sql, self._params, duration_ms, rows,
+                   _current_steps() - self._steps_at_start, error)
+
+
+class LoggedConnection(sqlite3.Connection):
+    def execute(self, sql, parameters=()):
+        return self.cursor(LoggedCursor).execute(sql, parameters)
+
+
+def read_entries(limit=20, tool=None, min_ms=0):
+    """最近的慢查询（新 → 旧），包括已滚动的旧文件"""
+    return _log.read(limit, lambda e: (not tool or e.get("tool") == tool) and e.get("duration_ms", 0) >= min_ms)
@@ -0,0 +1,189 @@
+"""
+已结束月份的聚合快照 - order_snapshots 表
+
+order_date < frozen_through 的订单按 (月份, 客户, 状态) 冻结为一行聚合，
+get_order_summary / get_orders_by_customer 只需合并快照和实时扫描。季度等更粗的周期由月份快照相加得到。
+
+快照记录它对应的变更日志位置（snapshot_meta 中的 change_seq）。读路径从不写入：
+快照之后改动过的已冻结月份（变更日志中 change_seq 之后的变更涉及的月份）不读快照、改为实时扫描，
+其余月份的快照仍然准确，结果与全表扫描一致。需要更新时（跨月、有改动过的月份、积压的变更较多）
+request_refresh() 把 refresh() 交给单写线程（writer.py）执行，同一时间至多一个：
+- 冻结新结束的月份（只扫描这些月份），重算改动过的月份，推进 change_seq
+- 变更日志有缺口时整体重建；在此之前读路径全部实时扫描
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import date
+
+from orders_mcp import changes, metrics, queries, shards, slowlog, writer
+from orders_mcp.config import DB_PATH
+from orders_mcp.log import log
+
+# change_seq 之后的变更超过 REFRESH_AFTER_CHANGES 条时即使都在当前月也推进一次（读路径每次都要读这些变更）；
+# 超过 MAX_DELTA_CHANGES 条时不再逐条分析，直接全部实时扫描
+REFRESH_AFTER_CHANGES = 1000
+MAX_DELTA_CHANGES = 10000
+# 不读快照时的 frozen_through：早于任何订单（订单日期按天数比较，空串换算不出天数）
+EARLIEST = "0000-01-01"
+
+_pending = None  # 排队或执行中的 refresh（Future）
+_lock = threading.Lock()
+_reader = None  # 写线程上的读连接（挂载归档分片，orders 为全部订单）
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def frozen_through(conn):
+    row = conn.execute(queries.SNAPSHOT_FROZEN_THROUGH).fetchone()
+    return row[0] if row else None
+
+
+def _change_cursor(conn):
+    row = conn.execute(queries.SNAPSHOT_CHANGE_CURSOR).fetchone()
+    return int(row[0]) if row else None
+
+
+def _changed_months(rows, boundary):
+    """变更涉及的已冻结（早于 boundary）月份起始日；有无法解析的日期时返回 None"""
+    months = set()
+    for order_date in changes.changed_dates(rows):
+        if order_date >= boundary:
+            continue
+        try:
+            months.add(_month_start(date.fromisoformat(order_date[:10])))
+        except ValueError:
+            return None
+    return months
+
+
+def refresh(conn, reader=None, today=None):
+    """
+    冻结到当前月之前的所有月份，并重算变更日志中改动过的已冻结月份；返回 frozen_through（YYYY-MM-DD）。
+    从 reader（默认 conn）读取、在 conn 上写入，事务由调用方负责（写线程的批事务，或 with conn）
+    """
+    reader = reader or conn
+    boundary = _month_start(today or date.today()).isoformat()
+    current = frozen_through(reader)
+    cursor = _change_cursor(reader)
+    rows, gap = changes.read(reader, cursor) if cursor is not None else ([], True)
+    if current == boundary and not rows and not gap:
+        return boundary
+
+    months = _changed_months(rows, current or "")
+    if gap or months is None or current is None or current > boundary:
+        # 首次建立、时钟回拨或变更日志有缺口：全部重建
+        conn.execute(queries.SNAPSHOT_CLEAR)
+        cursor = changes.head(reader)  # 写线程持有写锁，与重建读到的订单一致
+        ranges = [(EARLIEST, boundary)]
+        metrics.inc("snapshot_rebuilds")
+    else:
+        ranges = []
+        for start in months:
+            end = _next_month(start)
+            conn.execute(queries.SNAPSHOT_DELETE_RANGE, [start.strftime("%Y-%m"), end.strftime("%Y-%m")])
+            ranges.append((start.isoformat(), end.isoformat()))
+        metrics.inc("snapshot_invalidations", len(months))
+        if rows:
+            cursor = rows[-1][changes.SEQ]
+        ranges.append((current, boundary))
+    frozen = 0
+    for start, end in ranges:
+        aggregates = reader.execute(queries.SNAPSHOT_AGGREGATE, [start, end]).fetchall()
+        conn.executemany(queries.SNAPSHOT_INSERT, aggregates)
+        frozen += len(aggregates)
+    conn.execute(queries.SNAPSHOT_SET_FROZEN_THROUGH, [boundary])
+    conn.execute(queries.SNAPSHOT_SET_CHANGE_CURSOR, [cursor])
+    metrics.inc("snapshot_rows_frozen", frozen)
+    return boundary
+
+
+def _refresh_job(conn):
+    global _reader
+    if _reader is None:
+        _reader = sqlite3.connect(DB_PATH, factory=slowlog.LoggedConnection)
+    shards.sync(_reader)
+    return refresh(conn, _reader)
+
+
+def _refresh_done(future):
+    if future.exception() is not None:
+        log(f"⚠️ Snapshot refresh failed: {future.exception()}")
+        metrics.inc("snapshot_refresh_failures")
+
+
+def request_refresh():
+    """在单写线程上更新快照，返回 Future（已有一个在排队或执行时返回它）"""
+    global _pending
+    with _lock:
+        if _pending is None or _pending.done():
+            _pending = writer.submit(_refresh_job)
+            _pending.add_done_callback(_refresh_done)
+        return _pending
+
+
+def _view(conn):
+    """
+    读路径可用的快照：(frozen_through, 改动过的已冻结月份 JSON 数组)，即查询模板的参数。
+    快照不存在或变更日志有缺口时为 (EARLIEST, "[]")：不读快照，全部实时扫描
+    """
+    current, cursor = frozen_through(conn), _change_cursor(conn)
+    rows, gap = changes.read(conn, cursor, MAX_DELTA_CHANGES + 1) if cursor is not None else ([], True)
+    months = None
+    if current is not None and not gap and len(rows) <= MAX_DELTA_CHANGES:
+        months = _changed_months(rows, current)
+    if months is None:
+        request_refresh()
+        metrics.inc("snapshot_live_scans")
+        return EARLIEST, "[]"
+    if months or len(rows) > REFRESH_AFTER_CHANGES or current != _month_start(date.today()).isoformat():
+        request_refresh()
+    return current, json.dumps(sorted(m.strftime("%Y-%m") for m in months))
+
+
+def order_summary(conn, agg, field):
+    """全部订单上的 agg(field)，与 queries.ORDER_SUMMARY 结果一致"""
+    current, months = _view(conn)
+    metrics.inc("snapshot_queries", tool="get_order_summary")
+    cnt, amount, qty, min_amount, max_amount, min_qty, max_qty = conn.execute(
+        queries.ORDER_SUMMARY_SNAPSHOT, [current, months, current, months]
+    ).fetchone()
+    is_amount = field == "total_amount"
+    if agg == "count":
+        return cnt
+    if agg == "min":
+        return min_amount if is_amount else min_qty
+    if agg == "max":
+        return max_amount if is_amount else max_qty
+    total = amount if is_amount else qty
+    if agg == "avg":
+        return total / cnt if cnt else None
+    # 快照分段求和的浮点误差不应出现在金额里
+    return round(total, 2) if is_amount and total is not None else total
+
+
+def orders_by_group(conn, dims, group_by, order, limit):
+    """按客户名或区域分组的 [(分组, 总额, 平均, 订单数)]；快照 + 实时扫描按客户求和，归并用维度缓存"""
+    if group_by not in queries.GROUP_BY_FIELDS or order not in queries.SORT_ORDERS:
+        return None
+    current, months = _view(conn)
+    metrics.inc("snapshot_queries", tool="get_orders_by_customer")
+    groups = {}
+    params = [current, months, current, months]
+    for customer_id, total, cnt in conn.execute(queries.ORDERS_BY_CUSTOMER_SNAPSHOT, params):
+        customer = dims.customers.get(customer_id)
+        if customer is None:
+            continue  # 与原 JOIN 一致：忽略没有客户记录的订单
+        key = customer.customer_name if group_by == "customer_id" else customer.region_id
+        group = groups.setdefault(key, [0, 0])
+        group[0] += total
+        group[1] += cnt
+    ranked = sorted(groups.items(), key=lambda item: item[1][0], reverse=order == "DESC")
+    return [(key, total, total / cnt, cnt) for key, (total, cnt) in ranked[:limit]]
@@ -0,0 +1,637 @@
+"""
+工具定义与实现 - 所有传输方式共用同一份 TOOLS_DEF 与 call_tool
+"""
+
+import asyncio
+import json
+from datetime import date
+from typing import Any
+
+from mcp.types import TextContent
+
+from orders_mcp import admission, analytics, budget, changes, coalesce, dimensions, idempotency, profiler, queries, search, sketches, skills, slowlog, snapshots, tracing, trend, writer
+from orders_mcp.config import ADMIN_TOOLS
+from orders_mcp.db import STATUSES, get_db_connection, dict_from_row
+from orders_mcp.payload import payload_schema, project, resolve_limit, resolve_offset, rows_response, selected_fields
+
+# 可投影字段：英文字段名（fields 参数）→ 返回中的键
+LIST_ORDER_FIELDS = {
+    "order_id": "订单ID", "customer_name": "客户", "product_name": "产品", "quantity": "数量",
+    "total_amount": "金额", "order_date": "日期", "status": "状态",
+}
+DATE_RANGE_FIELDS = {
+    "order_id": "订单ID", "customer_name": "客户", "total_amount": "金额", "order_date": "日期", "status": "状态",
+}
+SEARCH_FIELDS = {
+    "order_id": "订单ID", "customer_name": "客户", "product_name": "产品", "total_amount": "金额",
+    "order_date": "日期", "status": "状态", "snippet": "匹配",
+}
+CUSTOMER_FIELDS = dimensions.CUSTOMER_FIELDS
+PRODUCT_FIELDS = dimensions.PRODUCT_FIELDS
+
+# 写工具的幂等键参数（orders_mcp/idempotency.py）
+IDEMPOTENCY_KEY_PARAM = {
+    "type": "string",
+    "description": f"Optional client-generated unique key (e.g. a UUID), reused unchanged on every retry of the same request. A retry with the same key and arguments within {idempotency.TTL_SECONDS / 3600:g} hours returns the original result without writing again; reusing a key with different arguments is rejected.",
+}
+
+# 报表工具可接受的分析快照滞后（orders_mcp/analytics.py）
+FRESHNESS_PARAM = {
+    "type": "number",
+    "description": f"Maximum acceptable data staleness in seconds (default {analytics.MAX_STALENESS_SECONDS:g}). The report is computed on an isolated analytics snapshot when it is at most this far behind the live data, otherwise on live data; 0 forces live data. When the snapshot is used, an extra content item reports its as-of time.",
+}
+
+# 工具定义（带 title 用于 Copilot Studio）
+TOOLS_DEF = [
+    {
+        "name": "get_order_summary",
+        "title": "Get Order Summary",
+        "description": "Calculate aggregate statistics on orders: total amount, average amount, order count, min or max value. Use this for questions like 'total sales this month', 'average order value', 'how many orders'.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "aggregate": {"type": "string", "enum": ["sum", "avg", "count", "min", "max"], "description": "Aggregation function to apply"},
+                "field": {"type": "string", "description": "Field to aggregate: 'total_amount' or 'quantity'"},
+                "condition": {"type": "string", "description": "Optional SQL WHERE clause, e.g. \"status='已完成'\" or \"order_date >= '2026-01-01'\""},
+                "max_staleness_seconds": FRESHNESS_PARAM
+            },
+            "required": ["aggregate", "field"]
+        }
+    },
+    {
+        "name": "get_orders_by_customer",
+        "title": "Get Orders by Customer",
+        "description": "Group orders by customer or region and return totals, averages, and counts. Use this for 'top 10 customers by sales', 'orders per region', 'which customer has the most orders'.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "group_by": {"type": "string", "enum": ["customer_id", "region_id"], "description": "Group by customer or region"},
+                "order": {"type": "string", "enum": ["ASC", "DESC"], "default": "DESC"},
+                "limit": {"type": "integer", "default": 10},
+                "max_staleness_seconds": FRESHNESS_PARAM
+            },
+            "required": ["group_by"]
+        }
+    },
+    {
+        "name": "get_top_n",
+        "title": "Get Top Customers or Products",
+        "description": "Top N customers or products ranked by total amount, order count or quantity. Exact results, answered from incrementally maintained counters without scanning orders. Use this for 'top 10 customers', 'best-selling products', 'which product has the most orders'.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "dimension": {"type": "string", "enum": ["customer", "product"], "default": "customer"},
+                "by": {"type": "string", "enum": ["total_amount", "count", "quantity"], "default": "total_amount"},
+                "limit": {"type": "integer", "default": 10}
+            }
+        }
+    },
+    {
+        "name": "get_order_percentiles",
+        "title": "Get Order Percentiles",
+        "description": "Percentiles (median, p90, p95, p99, ...) of order amount or quantity. The default approx mode reads a quantile sketch in constant time and reports its relative error bound; exact mode sorts all orders. Use this for 'median order size', '95th percentile order amount', 'typical order value'.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "metric": {"type": "string", "enum": ["total_amount", "quantity"], "default": "total_amount"},
+                "percentiles": {"type": "array", "items": {"type": "number", "minimum": 0, "maximum": 100}, "default": [50, 90, 95, 99]},
+                "mode": {"type": "string", "enum": ["approx", "exact"], "default": "approx"},
+                "max_staleness_seconds": {**FRESHNESS_PARAM, "description": "exact mode only. " + FRESHNESS_PARAM["description"]}
+            }
+        }
+    },
+    {
+        "name": "get_orders_by_date_range",
+        "title": "Get Orders by Date Range",
+        "description": "Retrieve orders within a specific date range, optionally filtered by status. Use this for 'orders in February', 'orders between Jan 1 and Feb 15', 'completed orders last month'.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "start_date": {"type": "string", "description": "Start date in YYYY-MM-DD format"},
+                "end_date": {"type": "string", "description": "End date in YYYY-MM-DD format"},
+                "status": {"type": "string", "description": "Optional order status filter"},
+                **payload_schema(DATE_RANGE_FIELDS),
+            },
+            "required": ["start_date", "end_date"]
+        }
+    },
+    {
+        "name": "get_order_trend",
+        "title": "Get Order Trend",
+        "description": "Time series of orders bucketed by day, week, month or quarter, with order count, amount and quantity per period, a moving average and period-over-period (or year-over-year) change. Use this for 'monthly sales trend', 'compare this quarter with last quarter', 'weekly orders over the last 3 months', 'last year Q4 vs this year'. Prefer this over fetching raw orders and summing them.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "granularity": {"type": "string", "enum": ["day", "week", "month", "quarter"], "default": "month"},
+                "start_date": {"type": "string", "description": "Start date in YYYY-MM-DD format (default: 12 periods before end_date)"},
+                "end_date": {"type": "string", "description": "End date in YYYY-MM-DD format (default: today)"},
+                "metric": {"type": "string", "enum": ["total_amount", "quantity", "count"], "default": "total_amount", "description": "Value used for the moving average and changes"},
+                "status": {"type": "string", "enum": list(STATUSES), "description": "Optional order status filter"},
+                "window": {"type": "integer", "default": 3, "description": "Moving average window in periods (0 or 1 disables it)"},
+                "compare": {"type": "string", "enum": ["previous", "year"], "default": "previous", "description": "Compare each period with the previous period or the same period one year earlier"}
+            }
+        }
+    },
+    {
+        "name": "list_orders",
+        "title": "List Orders",
+        "description": "List orders with optional filters by status or customer. Use this for 'show latest orders', 'show all shipped orders', 'show orders from a specific customer', 'show me the latest 5 orders'.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "status": {"type": "string", "description": "Filter by status: 待付款, 已付款, 已发货, 已完成, 已取消"},
+                "customer_id": {"type": "string", "description": "Filter by customer ID"},
+                "limit": {"type": "integer", "default": 20},
+                "offset": {"type": "integer", "default": 0},
+                **payload_schema(LIST_ORDER_FIELDS),
+            }
+        }
+    },
+    {
+        "name": "search_orders",
+        "title": "Search Orders",
+        "description": "Full-text search over orders by customer name, product name, shipping address and notes. Matches any part of a word, so partial Chinese names work (e.g. '阿里' finds 阿里巴巴, '深圳' finds addresses in 深圳). Multiple words must all match. Results are ranked by relevance. Use this when the user gives a fuzzy name, a fragment of an address or note, or you don't know the exact customer/product ID.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Search text; separate multiple words with spaces"},
+                "limit": {"type": "integer", "default": 20},
+                "offset": {"type": "integer", "default": 0},
+                **payload_schema(SEARCH_FIELDS),
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "get_order_detail",
+        "title": "Get Order Detail",
+        "description": "Get full details of a single order by order ID, including customer info, product, quantity, amount, and status. Use this for 'show order OR20250001', 'details for order X'.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "order_id": {"type": "string", "description": "The order ID, e.g. OR20250001"}
+            },
+            "required": ["order_id"]
+        }
+    },
+    {
+        "name": "update_order_status",
+        "title": "Update Order Status",
+        "description": "Update the status of an existing order. Valid statuses: 待付款 (pending payment), 已付款 (paid), 已发货 (shipped), 已完成 (completed), 已取消 (cancelled). Use this for 'change order X to shipped', 'mark order as completed'. Pass an idempotency_key so retries after a timeout are not applied twice.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "order_id": {"type": "string", "description": "The order ID to update"},
+                "new_status": {"type": "string", "description": "New status: 待付款, 已付款, 已发货, 已完成, or 已取消"},
+                "idempotency_key": IDEMPOTENCY_KEY_PARAM
+            },
+            "required": ["order_id", "new_status"]
+        }
+    },
+    {
+        "name": "subscribe_order_changes",
+        "title": "Subscribe to Order Changes",
+        "description": "Receive order changes (inserts, status updates, deletes) after a cursor instead of polling list_orders or get_order_detail. Over MCP sessions (/sse, /mcp, stdio) each matching change is pushed as a notifications/message (logger 'order_changes') until 'seconds' elapse or 'limit' changes are sent; other transports long-poll and return the first batch. Always resume with the returned cursor; 'reset' means changes were pruned and the caller should re-read orders.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "cursor": {"type": "integer", "description": "Deliver changes after this sequence number (from a previous call); omit to start from now"},
+                "order_id": {"type": "string", "description": "Only changes to this order"},
+                "customer_id": {"type": "string", "description": "Only changes to this customer's orders"},
+                "status": {"type": "string", "description": "Only changes whose new status is this value"},
+                "ops": {"type": "array", "items": {"type": "string", "enum": list(changes.OPS)}, "description": "Only these operations (default: all)"},
+                "seconds": {"type": "number", "default": 30, "description": "How long to stream (push) or wait for the first change (long-poll)"},
+                "limit": {"type": "integer", "default": 100, "description": "Maximum number of changes to deliver"}
+            }
+        }
+    },
+    {
+        "name": "get_customers",
+        "title": "Get Customers",
+        "description": "Retrieve the list of customers, optionally filtered by region. Use this for 'show all customers', 'customers in East China region', 'list customers'.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "region_id": {"type": "string", "description": "Optional region ID to filter customers, e.g. R001"},
+                **payload_schema(CUSTOMER_FIELDS),
+            }
+        }
+    },
+    {
+        "name": "get_products",
+        "title": "Get Products",
+        "description": "Retrieve the list of products, optionally filtered by category. Use this for 'show all products', 'list hardware products', 'what products do we have'.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "category": {"type": "string", "description": "Optional category filter: 硬件 (hardware), 软件 (software), 服务 (service)"},
+                **payload_schema(PRODUCT_FIELDS),
+            }
+        }
+    },
+    {
+        "name": "generate_customer_chart",
+        "title": "Generate Customer Order Chart",
+        "description": "IMPORTANT: Use this tool when user explicitly asks for 'chart', 'graph', 'visualize', 'visual representation', or 'show me a chart/graph'. Generate a visual chart (bar/pie/line) showing order statistics by customer. Returns a chart image URL that can be viewed in a browser. DO NOT use this for simple data queries - only when visualization is explicitly requested.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "chart_type": {
+                    "type": "string",
+                    "enum": ["bar", "pie", "line"],
+                    "default": "bar",
+                    "description": "Type of chart: bar (comparison), pie (proportion), line (trend)"
+                },
+                "limit": {
+                    "type": "integer",
+                    "default": 10,
+                    "description": "Number of top customers to show"
+                },
+                "max_staleness_seconds": FRESHNESS_PARAM
+            }
+        }
+    },
+]
+
+
+# 管理工具：只在 ADMIN_TOOLS=true 时暴露（HTTP 另有带令牌的 /admin/* 端点）
+ADMIN_TOOLS_DEF = [
+    {
+        "name": "get_slow_requests",
+        "title": "Get Slow Requests",
+        "description": "Admin: list recent slow tool calls (newest first) with trace id, JSON-RPC id, session id and per-stage timings (admission wait, handler, db.query, serialize, render).",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "tool": {"type": "string", "description": "Only calls of this tool"},
+                "min_ms": {"type": "number", "default": 0, "description": "Only calls slower than this (milliseconds)"},
+                "limit": {"type": "integer", "default": 20, "description": "Maximum number of entries"},
+            }
+        }
+    },
+    {
+        "name": "get_slow_queries",
+        "title": "Get Slow Queries",
+        "description": "Admin: list recent slow SQL queries (newest first) with tool name, normalized SQL, redacted parameters, duration, rows returned, VM steps and EXPLAIN QUERY PLAN output.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "tool": {"type": "string", "description": "Only queries issued by this tool"},
+                "min_ms": {"type": "number", "default": 0, "description": "Only queries slower than this (milliseconds)"},
+                "limit": {"type": "integer", "default": 20, "description": "Maximum number of entries"},
+            }
+        }
+    },
+]
+
+
+def all_tool_defs():
+    """内置工具 + skills/ 目录中的 SQL 模板工具"""
+    return TOOLS_DEF + (ADMIN_TOOLS_DEF if ADMIN_TOOLS else []) + skills.list_skill_defs()
+
+
+async def call_tool(name: str, arguments: Any, client: str = "local", notify=None) -> list[TextContent]:
+    """
+    经准入控制后在工作线程中执行工具；被拒绝时抛出 admission.Overloaded，由各传输方式转换为错误响应。
+    notify：向当前 MCP 会话推送通知的协程函数（只有会话传输提供），供订阅类工具使用
+    """
+    arguments = arguments or {}
+    handler = HANDLERS.get(name) or (ADMIN_HANDLERS.get(name) if ADMIN_TOOLS else None)
+    skill = None if handler is not None else skills.get_skill(name)
+    if handler is None and skill is None:
+        return [TextContent(type="text", text=f"未知工具: {name}")]
+    with tracing.span("dispatch", tool=name):
+        if name in STREAM_TOOLS:
+            # 长时间等待变更：在事件循环中执行，不占用准入槽位和工作线程（并发数由订阅上限控制）
+            tracing.mark_long_running()
+            return await handler(arguments, notify)
+        # 限速在合并之前：等待别人同一调用结果的 follower 也要消耗自己的令牌
+        admission.check_rate(client, name)
+        if name in WRITE_TOOLS:
+            if not arguments.get("idempotency_key"):
+                return await _execute(name, handler, skill, arguments)
+            # 同一幂等键、同样参数的并发重试只执行一次；之后的重试由幂等键表返回原结果
+            return await coalesce.run_once(
+                coalesce.flight_key(name, arguments),
+                lambda: _execute(name, handler, skill, arguments),
+            )
+        # 并发的相同只读调用合并为一次执行（只有 leader 占用准入槽位）
+        return await coalesce.run_once(
+            coalesce.flight_key(name, arguments),
+            lambda: _execute(name, handler, skill, arguments),
+        )
+
+
+async def _execute(name, handler, skill, arguments):
+    async with admission.admit(name, arguments, skill) as run:
+        guard = budget.Guard(name, budget.limits_for(name, admission.tool_class(name, arguments, skill)))
+        # progress handler 未能及时中止时（或调用被取消），从事件循环侧 interrupt()
+        backstop = asyncio.get_running_loop().call_later(
+            guard.limits.wall_ms / 1000 + budget.INTERRUPT_GRACE_SECONDS, guard.interrupt
+        )
+        try:
+            with tracing.span("handler", tool=name):
+                if handler is not None:
+                    return await run(profiler.timed, name, guard.run, handler, arguments)
+                return await run(profiler.timed, name, guard.run, skills.call_skill, skill, arguments, get_db_connection)
+        except asyncio.CancelledError:
+            guard.interrupt("cancelled")
+            raise
+        except budget.QueryBudgetExceeded as e:
+            return [TextContent(type="text", text=e.to_json())]
+        except Exception as e:
+            return [TextContent(type="text", text=f"错误: {str(e)}")]
+        finally:
+            backstop.cancel()
+
+
+async def get_order_summary(args):
+    agg = args.get("aggregate", "sum")
+    field = args.get("field", "total_amount")
+    condition = args.get("condition", "")
+    
+    sql = queries.ORDER_SUMMARY.get((agg, field))
+    if sql is None:
+        if field not in queries.SUMMARY_FIELDS:
+            return [TextContent(type="text", text=f"无效字段: {field}")]
+        return [TextContent(type="text", text=f"无效聚合: {agg}")]
+    conn, lag = analytics.connection(args, "get_order_summary")
+    if condition:
+        sql += f" WHERE {condition}"
+        value = conn.execute(sql).fetchone()[0]
+    else:
+        # 无条件时：已结束月份读快照，只实时扫描当前月
+        value = snapshots.order_summary(conn, agg, field)
+    
+    result = value if value else 0
+    return analytics.annotate([TextContent(type="text", text=f"{agg.upper()}({field}) = {result}")], lag)
+
+
+async def get_orders_by_customer(args):
+    group_by = args.get("group_by", "customer_id")
+    order = args.get("order", "DESC")
+    limit = args.get("limit", 10)
+    
+    if group_by not in queries.GROUP_BY_FIELDS or str(order).upper() not in queries.SORT_ORDERS:
+        return [TextContent(type="text", text=f"无效参数: group_by={group_by}, order={order}")]
+    
+    # 维度缓存始终取自主库（快照之后新增的客户也能归并）
+    dims = dimensions.current(get_db_connection())
+    conn, lag = analytics.connection(args, "get_orders_by_customer")
+    rows = snapshots.orders_by_group(conn, dims, group_by, str(order).upper(), limit)
+    
+    result = [{"分组": r[0], "总额": round(r[1],2), "平均": round(r[2],2), "订单数": r[3]} for r in rows]
+    return analytics.annotate([TextContent(type="text", text=json.dumps(result, ensure_ascii=False))], lag)
+
+
+async def get_top_n(args):
+    dimension = args.get("dimension", "customer")
+    by = args.get("by", "total_amount")
+    limit = args.get("limit", 10)
+    if dimension not in sketches.DIMENSIONS or by not in sketches.RANK_BY:
+        return [TextContent(type="text", text=f"无效参数: dimension={dimension}, by={by}")]
+    
+    # 计数器是精确值，查询很轻，直接读主库
+    conn = get_db_connection()
+    rows = sketches.top_n(conn, dimensions.current(conn), dimension, by, limit)
+    
+    result = {
+        "维度": dimension, "排序": by,
+        "结果": [{"名称": r[0], "订单数": r[1], "金额": round(r[2], 2), "数量": r[3]} for r in rows],
+    }
+    return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False))]
+
+
+async def get_order_percentiles(args):
+    metric = args.get("metric", "total_amount")
+    mode = args.get("mode", "approx")
+    percentiles = args.get("percentiles") or [50, 90, 95, 99]
+    if metric not in sketches.QUANTILE_METRICS or mode not in sketches.MODES:
+        return [TextContent(type="text", text=f"无效参数: metric={metric}, mode={mode}")]
+    if any(not 0 <= float(p) <= 100 for p in percentiles):
+        return [TextContent(type="text", text=f"百分位必须在 0-100 之间: {percentiles}")]
+    
+    conn, lag = analytics.connection(args, "get_order_percentiles") if mode == "exact" else (get_db_connection(), None)
+    n, values = sketches.quantiles(conn, metric, [float(p) for p in percentiles], mode)
+    
+    result = {
+        "指标": metric, "模式": mode, "订单数": n,
+        "相对误差上界": sketches.ALPHA if mode == "approx" else 0,
+        "分位数": {f"p{p:g}": v for p, v in values.items()},
+    }
+    return analytics.annotate([TextContent(type="text", text=json.dumps(result, ensure_ascii=False))], lag)
+
+
+async def get_orders_by_date_range(args):
+    start = args.get("start_date")
+    end = args.get("end_date")
+    status = args.get("status")
+    fields = selected_fields(args, DATE_RANGE_FIELDS) or DATE_RANGE_FIELDS
+    offset = resolve_offset("get_orders_by_date_range", args)
+    
+    params = [start, end]
+    if status:
+        params.append(status)
+    params.append(offset)
+    
+    rows = budget.fetch_rows(get_db_connection().execute(queries.ORDERS_BY_DATE_RANGE[bool(status)], params))
+    
+    result = [{DATE_RANGE_FIELDS[f]: r[f] for f in fields} for r in rows]
+    return rows_response("get_orders_by_date_range", result, args, offset)
+
+
+async def get_order_trend(args):
+    granularity = args.get("granularity", "month")
+    metric = args.get("metric", "total_amount")
+    compare = args.get("compare", "previous")
+    if granularity not in queries.GRANULARITIES:
+        return [TextContent(type="text", text=f"无效粒度: {granularity}，可选: {list(queries.GRANULARITIES)}")]
+    if metric not in trend.METRICS or compare not in trend.COMPARES:
+        return [TextContent(type="text", text=f"无效参数: metric={metric}, compare={compare}")]
+    status = args.get("status") or None
+    if status is not None and status not in STATUSES:
+        return [TextContent(type="text", text=f"无效状态: {list(STATUSES)}")]
+    
+    try:
+        end = date.fromisoformat(args["end_date"]) if args.get("end_date") else date.today()
+        if args.get("start_date"):
+            start = date.fromisoformat(args["start_date"])
+        else:
+            start = trend.shift_periods(granularity, trend.bucket_start(granularity, end), 1 - trend.DEFAULT_PERIODS)
+    except ValueError:
+        return [TextContent(type="text", text="无效日期，格式应为 YYYY-MM-DD")]
+    if start > end:
+        return [TextContent(type="text", text=f"开始日期晚于结束日期: {start} > {end}")]
+    
+    result = trend.order_trend(
+        get_db_connection(), granularity, start, end, metric=metric, status=status,
+        window=int(args.get("window", 3)), compare=compare,
+    )
+    return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False))]
+
+
+async def list_orders(args):
+    status = args.get("status")
+    customer_id = args.get("customer_id")
+    fields = selected_fields(args, LIST_ORDER_FIELDS) or LIST_ORDER_FIELDS
+    offset = resolve_offset("list_orders", args, args.get("offset", 0))
+    limit = resolve_limit("list_orders", args, args.get("limit", 20))
+    
+    params = []
+    if status:
+        params.append(status)
+    if customer_id:
+        params.append(customer_id)
+    params.extend([limit, offset])
+    
+    sql = queries.LIST_ORDERS[(bool(status), bool(customer_id))]
+    rows = budget.fetch_rows(get_db_connection().execute(sql, params))
+    
+    result = [{LIST_ORDER_FIELDS[f]: r[f] for f in fields} for r in rows]
+    return rows_response("list_orders", result, args, offset, limit=limit)
+
+
+async def search_orders(args):
+    fields = selected_fields(args, SEARCH_FIELDS) or SEARCH_FIELDS
+    offset = resolve_offset("search_orders", args, args.get("offset", 0))
+    limit = resolve_limit("search_orders", args, args.get("limit", 20))
+    
+    rows = search.search_orders(get_db_connection(), args.get("query", ""), limit, offset)
+    if rows is None:
+        return [TextContent(type="text", text="请提供搜索关键词")]
+    
+    result = [{SEARCH_FIELDS[f]: r[f] for f in fields} for r in rows]
+    return rows_response("search_orders", result, args, offset, limit=limit)
+
+
+async def get_order_detail(args):
+    order_id = args.get("order_id")
+    
+    row = get_db_connection().execute(queries.ORDER_DETAIL, [order_id]).fetchone()
+    
+    if not row:
+        return [TextContent(type="text", text=f"未找到订单: {order_id}")]
+    
+    return [TextContent(type="text", text=json.dumps(dict_from_row(row), ensure_ascii=False))]
+
+
+def _update_status(conn, order_id, new_status, key=None, digest=None):
+    """
+    写线程中执行（orders_mcp/writer.py）：返回结果文本，没有更新任何订单时返回 None。
+    带幂等键时先查同一事务里是否已有记录（并发到达的重试），更新成功后在同一事务里记录
+    """
+    if key and (replay := idempotency.lookup(conn, key, digest, "update_order_status")) is not None:
+        return replay
+    if not conn.execute(queries.UPDATE_ORDER_STATUS, [new_status, order_id]).rowcount:
+        return None
+    result = f"✅ 已更新: {order_id} → {new_status}"
+    if key:
+        idempotency.record(conn, key, digest, result)
+    return result
+
+
+async def update_order_status(args):
+    order_id = args.get("order_id")
+    new_status = args.get("new_status")
+    
+    valid = ["待付款", "已付款", "已发货", "已完成", "已取消"]
+    if new_status not in valid:
+        return [TextContent(type="text", text=f"无效状态: {valid}")]
+    
+    key = args.get("idempotency_key")
+    digest = idempotency.request_digest("update_order_status", args) if key else None
+    # 重试：直接返回原结果，不进写队列
+    if key and (replay := idempotency.lookup(get_db_connection(), key, digest, "update_order_status")) is not None:
+        return [TextContent(type="text", text=replay)]
+    
+    # 与同时到达的其他写入合并为一次提交，返回时已落盘
+    result = await writer.write(_update_status, order_id, new_status, key, digest)
+    
+    if result is None and get_db_connection().execute(queries.ORDER_DATE, [order_id]).fetchone():
+        return [TextContent(type="text", text=f"订单已归档，不能修改: {order_id}")]
+    if result is None:
+        return [TextContent(type="text", text=f"未找到订单: {order_id}")]
+    return [TextContent(type="text", text=result)]
+
+
+async def subscribe_order_changes(args, notify=None):
+    """从 cursor 之后推送（有会话时）或长轮询返回订单变更；快照、趋势缓存从同一份变更日志失效"""
+    filters = {field: {args[field]} for field in ("order_id", "customer_id", "status") if args.get(field)}
+    if args.get("ops"):
+        filters["op"] = set(args["ops"])
+    cursor = args.get("cursor")
+    result = await changes.subscribe(
+        get_db_connection, None if cursor is None else int(cursor), filters,
+        int(args.get("limit", 100)), args.get("seconds", 30), notify,
+    )
+    return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False))]
+
+
+async def get_customers(args):
+    """直接从维度缓存返回；未投影、未翻页时使用预先序列化的 JSON"""
+    fields = selected_fields(args, CUSTOMER_FIELDS)
+    offset = resolve_offset("get_customers", args)
+    
+    rows, text = dimensions.current(get_db_connection()).customer_list(args.get("region_id") or None)
+    
+    if fields is None and not offset:
+        return rows_response("get_customers", rows, args, offset, text)
+    result = [project(r, fields) for r in rows[offset:]]
+    return rows_response("get_customers", result, args, offset)
+
+
+async def get_products(args):
+    """直接从维度缓存返回；未投影、未翻页时使用预先序列化的 JSON"""
+    fields = selected_fields(args, PRODUCT_FIELDS)
+    offset = resolve_offset("get_products", args)
+
+    rows, text = dimensions.current(get_db_connection()).product_list(args.get("category") or None)
+
+    if fields is None and not offset:
+        return rows_response("get_products", rows, args, offset, text)
+    result = [project(r, fields) for r in rows[offset:]]
+    return rows_response("get_products", result, args, offset)
+
+
+async def generate_customer_chart(args):
+    """生成客户订单统计图表（延迟加载：只有调用图表工具时才导入渲染相关模块）"""
+    from orders_mcp import charts
+    return await charts.generate_customer_chart(args)
+
+
+async def get_slow_queries(args):
+    entries = slowlog.read_entries(int(args.get("limit", 20)), args.get("tool"), float(args.get("min_ms", 0)))
+    return [TextContent(type="text", text=json.dumps(entries, ensure_ascii=False))]
+
+
+async def get_slow_requests(args):
+    entries = tracing.read_slow_requests(int(args.get("limit", 20)), args.get("tool"), float(args.get("min_ms", 0)))
+    return [TextContent(type="text", text=json.dumps(entries, ensure_ascii=False))]
+
+
+HANDLERS = {
+    "get_order_summary": get_order_summary,
+    "get_orders_by_customer": get_orders_by_customer,
+    "get_top_n": get_top_n,
+    "get_order_percentiles": get_order_percentiles,
+    "get_orders_by_date_range": get_orders_by_date_range,
+    "get_order_trend": get_order_trend,
+    "list_orders": list_orders,
+    "search_orders": search_orders,
+    "get_order_detail": get_order_detail,
+    "update_order_status": update_order_status,
+    "subscribe_order_changes": subscribe_order_changes,
+    "get_customers": get_customers,
+    "get_products": get_products,
+    "generate_customer_chart": generate_customer_chart,
+}
+ADMIN_HANDLERS = {
+    "get_slow_queries": get_slow_queries,
+    "get_slow_requests": get_slow_requests,
+}
+# 管理工具未启用时名字也保留，skills 不能占用
+BUILTIN_TOOL_NAMES = set(HANDLERS) | set(ADMIN_HANDLERS)
+# 有副作用的工具：不参与请求合并
+WRITE_TOOLS = {"update_order_status"}
+# 长时间运行、在事件循环中执行的工具：不经准入排队，不参与请求合并
+STREAM_TOOLS = {"subscribe_order_changes"}
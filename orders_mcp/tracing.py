@@ -0,0 +1,253 @@
+"""
+请求追踪 - 传输 → 分发 → 准入排队 → 处理函数 → SQL / 序列化 / 图表渲染 各阶段一个 span
+
+每个传输入口（POST /、REST、MCP SDK 的 tools/call）用 start_trace() 开一条追踪，带 JSON-RPC id 与会话 id；
+内部各阶段用 span() / record_span() 挂在当前 span 下（ContextVar 传播，工作线程由 admission 复制上下文）。
+追踪结束时交给导出线程（序列化与写文件不占用事件循环；队列积压超过 TRACE_EXPORT_QUEUE 条时丢弃并计数）：
+- 以 OTLP/JSON（ExportTraceServiceRequest）格式追加到 logs/traces.jsonl，一行一条追踪，
+  可用 otel-collector 的 filelog / otlpjsonfile 接收器导入 Jaeger、Tempo 等
+- 总耗时超过 SLOW_REQUEST_MS 的请求把各阶段耗时写入 logs/slow_requests.jsonl，直接看时间花在数据库、
+  序列化还是渲染上
+
+TRACE_SAMPLE_RATE 控制采样比例（0 关闭追踪；慢请求日志只覆盖被采样的请求）。
+"""
+
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from orders_mcp import metrics
+from orders_mcp.config import LOG_DIR
+from orders_mcp.log import JsonlLog, log
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+TRACE_EXPORT_QUEUE = int(os.getenv("TRACE_EXPORT_QUEUE", "10000"))
+TRACE_LOG_PATH = LOG_DIR / "traces.jsonl"
+SLOW_REQUEST_LOG_PATH = LOG_DIR / "slow_requests.jsonl"
+SERVICE_NAME = "sqlite-orders-mcp"
+
+_LOG_MAX_BYTES = int(os.getenv("TRACE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+_trace_log = JsonlLog(TRACE_LOG_PATH, _LOG_MAX_BYTES, 3)
+_slow_log = JsonlLog(SLOW_REQUEST_LOG_PATH, _LOG_MAX_BYTES, 3)
+
+_SPAN_KIND_INTERNAL = 1
+_SPAN_KIND_SERVER = 2
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+_current = ContextVar("trace_span", default=None)
+_exports = queue.Queue(TRACE_EXPORT_QUEUE)
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace, parent_id, name, attributes, start_ns=None):
+        self.trace = trace
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update((k, v) for k, v in attributes.items() if v is not None)
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """未采样时的占位 span"""
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+class _Trace:
+    __slots__ = ("trace_id", "spans", "long_running")
+
+    def __init__(self):
+        self.trace_id = random.getrandbits(128).to_bytes(16, "big").hex()
+        self.spans = []
+        self.long_running = False
+
+
+def _finish(span, token):
+    span.end_ns = time.time_ns()
+    span.trace.spans.append(span)
+    _current.reset(token)
+
+
+@contextmanager
+def _run(span):
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _finish(span, token)
+
+
+@contextmanager
+def start_trace(name, **attributes):
+    """传输入口：新开一条追踪（已在追踪中时退化为子 span）"""
+    if _current.get() is not None:
+        with span(name, **attributes) as s:
+            yield s
+        return
+    if TRACE_SAMPLE_RATE <= 0 or random.random() >= TRACE_SAMPLE_RATE:
+        yield NOOP
+        return
+    root = Span(_Trace(), None, name, attributes)
+    try:
+        with _run(root):
+            yield root
+    finally:
+        _export(root)
+
+
+@contextmanager
+def span(name, **attributes):
+    parent = _current.get()
+    if parent is None:
+        yield NOOP
+        return
+    with _run(Span(parent.trace, parent.span_id, name, attributes)) as s:
+        yield s
+
+
+def record_span(name, start_ns, end_ns, error=None, **attributes):
+    """补记一个已结束的子 span（如 SQL 语句：从 execute 到取完结果）"""
+    parent = _current.get()
+    if parent is None:
+        return
+    s = Span(parent.trace, parent.span_id, name, attributes, start_ns)
+    s.end_ns = end_ns
+    s.error = error
+    parent.trace.spans.append(s)
+
+
+def current_trace_id():
+    parent = _current.get()
+    return parent.trace.trace_id if parent is not None else None
+
+
+def mark_long_running():
+    """当前请求按设计长时间等待（如订阅变更）：照常导出追踪，但不计入慢请求"""
+    parent = _current.get()
+    if parent is not None:
+        parent.trace.long_running = True
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(s):
+    span = {
+        "traceId": s.trace.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": _SPAN_KIND_SERVER if s.parent_id is None else _SPAN_KIND_INTERNAL,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status": {"code": _STATUS_ERROR, "message": s.error} if s.error else {"code": _STATUS_OK},
+    }
+    if s.parent_id:
+        span["parentSpanId"] = s.parent_id
+    return span
+
+
+def stage_breakdown(trace):
+    """各阶段（span 名）的总耗时与次数；阶段之间有嵌套，例如 handler 包含 db.query"""
+    stages = {}
+    for s in trace.spans:
+        if s.parent_id is None:
+            continue
+        stage = stages.setdefault(s.name, {"ms": 0.0, "count": 0})
+        stage["ms"] += s.duration_ms
+        stage["count"] += 1
+    for stage in stages.values():
+        stage["ms"] = round(stage["ms"], 2)
+    return stages
+
+
+def _write(root):
+    trace = root.trace
+    _trace_log.write({"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "orders_mcp"}, "spans": [_otlp_span(s) for s in trace.spans]}],
+    }]})
+    metrics.inc("traces_exported")
+    if root.duration_ms < SLOW_REQUEST_MS or trace.long_running:
+        return
+    _slow_log.write({
+        "ts": datetime.fromtimestamp(root.start_ns / 1e9, timezone.utc).isoformat(timespec="milliseconds"),
+        "trace_id": trace.trace_id,
+        "name": root.name,
+        **root.attributes,
+        "duration_ms": round(root.duration_ms, 2),
+        "error": root.error,
+        "stages": stage_breakdown(trace),
+    })
+    metrics.inc("slow_requests", tool=root.attributes.get("tool"))
+
+
+def _export_loop():
+    while True:
+        root = _exports.get()
+        try:
+            _write(root)
+        except Exception as e:  # 写日志失败不影响后续的追踪
+            log(f"⚠️ Trace export failed: {e}")
+        finally:
+            _exports.task_done()
+
+
+def _export(root):
+    """结束的追踪放进导出队列（不阻塞调用方），队列满时丢弃"""
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = threading.Thread(target=_export_loop, name="trace-export", daemon=True)
+                _exporter.start()
+    try:
+        _exports.put_nowait(root)
+    except queue.Full:
+        metrics.inc("traces_dropped")
+
+
+def flush():
+    """等已结束的追踪全部写入（关闭服务时、读日志之前；阻塞，在线程中调用）"""
+    if _exporter is not None:
+        _exports.join()
+
+
+def read_slow_requests(limit=20, tool=None, min_ms=0):
+    """最近的慢请求（新 → 旧）及其阶段耗时"""
+    return _slow_log.read(limit, lambda e: (not tool or e.get("tool") == tool) and e.get("duration_ms", 0) >= min_ms)
@@ -0,0 +1,220 @@
+"""
+订单趋势 - 按日/周/月/季度分桶，附移动平均与环比/同比
+
+SQL 只做一次 order_date 索引范围扫描并按桶起始日分组，空桶在这里补零。
+已结束的完整周期不会再变化，按 (粒度, 状态, 桶起始日) 缓存（LRU，至多 TREND_CACHE_MAX_BUCKETS 个桶；
+状态只接受 db.STATUSES 中的值，键空间有界）；
+旧订单被修改时（任何写入路径），每次计算前从变更日志读到并只丢弃涉及的桶（orders_mcp/changes.py）。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from orders_mcp import changes, metrics, queries
+
+METRICS = {"count": 0, "total_amount": 1, "quantity": 2}  # 指标 → (cnt, amount, qty) 下标
+COMPARES = ("previous", "year")
+DEFAULT_PERIODS = 12
+MAX_BUCKETS = int(os.getenv("TREND_MAX_BUCKETS", "1000"))
+CACHE_MAX_BUCKETS = int(os.getenv("TREND_CACHE_MAX_BUCKETS", "20000"))
+
+_cache = OrderedDict()  # (granularity, status, bucket_start) → (cnt, amount, qty)，最近使用的在末尾
+_cursor = None  # 缓存已处理到的变更 seq
+_lock = threading.Lock()
+
+
+def _add_months(day, months):
+    m = day.month - 1 + months
+    year, month = day.year + m // 12, m % 12 + 1
+    # 只有按日分桶会落在 29-31 日，跨月时取当月最后一天
+    last = (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    return date(year, month, min(day.day, last))
+
+
+def bucket_start(granularity, day):
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+
+
+def next_bucket(granularity, start):
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(days=7)
+    return _add_months(start, 1 if granularity == "month" else 3)
+
+
+def shift_periods(granularity, start, periods):
+    """start 前后移动若干个桶（periods 可为负）"""
+    if granularity == "day":
+        return start + timedelta(days=periods)
+    if granularity == "week":
+        return start + timedelta(days=7 * periods)
+    return _add_months(start, periods * (1 if granularity == "month" else 3))
+
+
+def year_ago(granularity, start):
+    if granularity == "week":
+        return start - timedelta(days=364)
+    return _add_months(start, -12)
+
+
+def bucket_label(granularity, start):
+    if granularity == "day":
+        return start.isoformat()
+    if granularity == "week":
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == "month":
+        return start.strftime("%Y-%m")
+    return f"{start.year}-Q{(start.month - 1) // 3 + 1}"
+
+
+def _buckets(granularity, start, end):
+    """[start, end] 覆盖的桶：(桶起始日, 查询下界, 查询上界, 是否完整)"""
+    buckets = []
+    bs = bucket_start(granularity, start)
+    while bs <= end:
+        be = next_bucket(granularity, bs) - timedelta(days=1)
+        buckets.append((bs, max(bs, start), min(be, end), bs >= start and be <= end))
+        if len(buckets) > MAX_BUCKETS:
+            raise ValueError(f"时间范围过大：超过 {MAX_BUCKETS} 个{granularity}桶，请缩小范围或使用更粗的粒度")
+        bs = be + timedelta(days=1)
+    return buckets
+
+
+def _fetch(conn, granularity, status, lo, hi):
+    params = [lo.isoformat(), hi.isoformat()]
+    if status:
+        params.append(status)
+    rows = conn.execute(queries.ORDER_TREND[(granularity, bool(status))], params).fetchall()
+    return {r[0]: (r[1], r[2] or 0, r[3] or 0) for r in rows}
+
+
+def _catch_up(conn):
+    """丢弃游标之后的变更涉及的桶，返回新游标；首次调用从最新位置开始（此时缓存为空）"""
+    global _cursor
+    cursor = _cursor
+    if cursor is None:
+        cursor = changes.head(conn)
+        with _lock:
+            _cache.clear()
+            _cursor = cursor
+        return cursor
+    rows, gap = changes.read(conn, cursor)
+    if not rows:
+        return cursor
+    with _lock:
+        if gap:
+            _cache.clear()
+        else:
+            for order_date in changes.changed_dates(rows):
+                _invalidate_date(order_date)
+        _cursor = max(_cursor, rows[-1][changes.SEQ])
+        return _cursor
+
+
+def bucket_values(conn, granularity, start, end, status=None, today=None):
+    """每个桶的 (cnt, amount, qty)；已结束的完整桶走缓存，其余按连续区间各扫一次"""
+    cursor = _catch_up(conn)
+    open_start = bucket_start(granularity, today or date.today())
+    buckets = _buckets(granularity, start, end)
+    values = {}
+    runs = []
+    hits = 0
+    for index, (bs, _lo, _hi, complete) in enumerate(buckets):
+        cached = _cached((granularity, status or "", bs)) if complete and bs < open_start else None
+        if cached is not None:
+            values[bs] = cached
+            hits += 1
+        elif runs and runs[-1][1] == index - 1:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index])
+
+    for first, last in runs:
+        rows = _fetch(conn, granularity, status, buckets[first][1], buckets[last][2])
+        for bs, _lo, _hi, complete in buckets[first:last + 1]:
+            value = rows.get(bs.isoformat(), (0, 0, 0))
+            values[bs] = value
+            if complete and bs < open_start:
+                with _lock:
+                    # 期间有其他线程处理了新变更：这次读到的值可能早于那些变更，不缓存
+                    if _cursor == cursor:
+                        _cache[(granularity, status or "", bs)] = value
+                        if len(_cache) > CACHE_MAX_BUCKETS:
+                            _cache.popitem(last=False)
+
+    metrics.inc("trend_cache_hits", hits, granularity=granularity)
+    metrics.inc("trend_cache_misses", len(buckets) - hits, granularity=granularity)
+    return [(bs, complete and bs < open_start, values[bs]) for bs, _lo, _hi, complete in buckets]
+
+
+def _cached(key):
+    with _lock:
+        value = _cache.get(key)
+        if value is not None:
+            _cache.move_to_end(key)
+        return value
+
+
+def _invalidate_date(order_date):
+    """订单日期所在的各粒度桶失效（任意状态筛选）；调用方持有 _lock"""
+    try:
+        day = date.fromisoformat(str(order_date)[:10])
+    except ValueError:
+        return  # 无法解析的日期不落在任何桶里
+    for key in [k for k in _cache if k[2] == bucket_start(k[0], day)]:
+        del _cache[key]
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+
+def _change(value, base):
+    if base is None:
+        return None, None
+    delta = round(value - base, 2)
+    return delta, (round(delta / base * 100, 1) if base else None)
+
+
+def order_trend(conn, granularity, start, end, metric="total_amount", status=None,
+                window=3, compare="previous", today=None):
+    """趋势序列：每个桶的订单数/金额/数量，metric 的移动平均与环比（或同比）"""
+    index = METRICS[metric]
+    series = bucket_values(conn, granularity, start, end, status, today)
+
+    previous = {}
+    if compare == "year":
+        first, last = series[0][0], series[-1][0]
+        prior_end = next_bucket(granularity, year_ago(granularity, last)) - timedelta(days=1)
+        for bs, _complete, value in bucket_values(conn, granularity, year_ago(granularity, first),
+                                                  prior_end, status, today):
+            previous[bs] = value[index]
+
+    result = []
+    recent = []
+    for i, (bs, complete, (cnt, amount, qty)) in enumerate(series):
+        value = (cnt, amount, qty)[index]
+        recent.append(value)
+        row = {"周期": bucket_label(granularity, bs), "订单数": cnt, "金额": round(amount, 2), "数量": qty}
+        if not complete:
+            row["完整"] = False
+        if window and window > 1:
+            row["移动平均"] = round(sum(recent[-window:]) / window, 2) if len(recent) >= window else None
+        if compare == "year":
+            row["同比"], row["同比%"] = _change(value, previous.get(year_ago(granularity, bs)))
+        else:
+            base = series[i - 1][2][index] if i else None
+            row["环比"], row["环比%"] = _change(value, base)
+        result.append(row)
+    return result
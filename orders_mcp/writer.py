@@ -0,0 +1,137 @@
+"""
+单写线程 + 组提交 - 所有订单写入经同一个连接串行执行，并发的写入合并成一次提交
+
+写工具把写入函数 job(conn, *args) 交给 submit()：写线程每次取出队列中已有的全部写入
+（至多 GROUP_COMMIT_MAX_BATCH 个），在一个 BEGIN IMMEDIATE … COMMIT 事务里依次执行，
+一次 fsync 覆盖整批。上一次提交落盘期间到达的写入就是下一批，窗口即提交本身的耗时：
+并发越高批越大，空闲时单个写入不额外等待。GROUP_COMMIT_WINDOW_MS > 0 时取到第一个写入后
+再多等这么久凑批（写入稀疏但 fsync 很慢的磁盘上可能划算，bench_writes.py 实测本地默认 0 最好）。
+
+- 批内每个写入在自己的 SAVEPOINT 中执行：某个写入出错只回滚它自己，调用方收到它的异常，同批其他写入照常提交
+- COMMIT 返回后才把结果交给各调用方，结果即落盘确认；COMMIT 失败时整批都收到异常
+- 进程内只有这一个写连接，写入之间不再争抢数据库锁；外部进程的写入由 busy timeout 等待
+- 数据库为 WAL 模式（db.ensure_schema 设置），长时间的读事务不挡 COMMIT
+
+写连接是普通连接（不挂载分片、没有 TEMP 视图），写入语句显式写 main（orders 视图或 order_facts）。
+"""
+
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from orders_mcp import metrics
+from orders_mcp.config import DB_PATH
+from orders_mcp.log import log
+
+GROUP_COMMIT_WINDOW_SECONDS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "0")) / 1000
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "256"))
+BUSY_TIMEOUT_SECONDS = 30
+
+_queue = queue.SimpleQueue()
+_thread = None
+_lock = threading.Lock()
+
+
+def _collect(first):
+    """first 加上队列中已有的（以及窗口内到达的）写入，凑成一批"""
+    batch = [first]
+    deadline = time.monotonic() + GROUP_COMMIT_WINDOW_SECONDS
+    while len(batch) < GROUP_COMMIT_MAX_BATCH:
+        try:
+            batch.append(_queue.get_nowait())
+            continue
+        except queue.Empty:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _commit(conn, batch):
+    """一个事务里执行整批写入，返回 [(future, 结果, 异常)]"""
+    outcomes = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if len(batch) == 1:
+            # 只有一个写入：出错时整个事务回滚即可，省去 SAVEPOINT
+            future, job, args = batch[0]
+            try:
+                result = job(conn, *args)
+            except Exception as e:
+                conn.execute("ROLLBACK")
+                return [(future, None, e)]
+            conn.execute("COMMIT")
+            return [(future, result, None)]
+        for future, job, args in batch:
+            conn.execute("SAVEPOINT job")
+            try:
+                result = job(conn, *args)
+            except Exception as e:
+                conn.execute("ROLLBACK TO job")
+                outcomes.append((future, None, e))
+            else:
+                outcomes.append((future, result, None))
+            conn.execute("RELEASE job")
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    return outcomes
+
+
+def _run():
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+    while True:
+        batch = _collect(_queue.get())
+        batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+        if not batch:
+            continue
+        started = time.perf_counter()
+        try:
+            outcomes = _commit(conn, batch)
+        except Exception as e:
+            log(f"⚠️ Group commit failed ({len(batch)} writes): {e}")
+            metrics.inc("group_commit_failures")
+            for future, _job, _args in batch:
+                future.set_exception(e)
+            continue
+        metrics.inc("group_commits")
+        metrics.observe("group_commit_batch_size", len(batch))
+        metrics.observe("group_commit_seconds", time.perf_counter() - started)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def _ensure_started():
+    global _thread
+    if _thread is None:
+        with _lock:
+            if _thread is None:
+                _thread = threading.Thread(target=_run, name="writer", daemon=True)
+                _thread.start()
+
+
+def submit(job, *args):
+    """排队执行 job(conn, *args)；返回 concurrent.futures.Future，整批提交落盘后得到 job 的返回值"""
+    _ensure_started()
+    future = Future()
+    _queue.put((future, job, args))
+    return future
+
+
+async def write(job, *args):
+    """submit() 的协程版本（可在任意线程的事件循环中 await）"""
+    return await asyncio.wrap_future(submit(job, *args))
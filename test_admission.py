@@ -0,0 +1,50 @@
+"""
+测试准入限速：令牌在请求合并之前扣减，超限的客户端不能借别人正在执行的同一调用绕过限速
+"""
+
+import asyncio
+
+import pytest
+from mcp.types import TextContent
+
+from orders_mcp import admission, metrics, tools
+
+
+@pytest.fixture
+def slow_products(monkeypatch, database):
+    """get_products 改为执行 0.3 秒，让并发的相同调用合并到同一次执行上"""
+    calls = []
+
+    async def handler(args):
+        calls.append(args)
+        await asyncio.sleep(0.3)
+        return [TextContent(type="text", text="products")]
+
+    monkeypatch.setitem(tools.HANDLERS, "get_products", handler)
+    monkeypatch.setattr(admission, "CLIENT_RATE", 0.01)
+    monkeypatch.setattr(admission, "CLIENT_BURST", 1)
+    return calls
+
+
+def _followers():
+    return metrics.snapshot()["counters"].get("coalesce_followers{tool=get_products}", 0)
+
+
+def test_followers_are_rate_limited(slow_products):
+    async def main():
+        leader = asyncio.ensure_future(tools.call_tool("get_products", {}, client="ta-leader"))
+        await asyncio.sleep(0.05)
+        # 令牌已用完的客户端：不等 leader 的结果，立即拒绝
+        await tools.call_tool("get_customers", {}, client="ta-limited")
+        with pytest.raises(admission.Overloaded) as rejected:
+            await tools.call_tool("get_products", {}, client="ta-limited")
+        # 还有令牌的客户端照常合并
+        follower = await tools.call_tool("get_products", {}, client="ta-other")
+        return rejected.value, await leader, follower
+
+    followers = _followers()
+    rejected, leader, follower = asyncio.run(main())
+    assert rejected.reason == "client_rate" and rejected.retry_after > 0
+    assert leader[0].text == follower[0].text == "products"
+    assert len(slow_products) == 1
+    assert _followers() == followers + 1
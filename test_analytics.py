@@ -0,0 +1,104 @@
+"""
+测试分析快照：满足滞后要求时读快照并附上数据截至时间，过旧时退回主库并在后台重建，
+重建后包含新的写入，并发的重建依次进行，冻结的月度快照包含已归档的订单
+"""
+
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from orders_mcp import analytics, metrics, shards, tools, writer
+from orders_mcp.config import ANALYTICS_DB_PATH
+
+
+def _insert(conn, order_id, order_date):
+    conn.execute(
+        "INSERT INTO main.orders VALUES (?, 'C001', 'P001', 1, 1.0, 1.0, ?, '待付款', NULL, NULL)",
+        [order_id, order_date],
+    )
+
+
+def _call(name, args):
+    return [item.text for item in asyncio.run(tools.call_tool(name, args, client="test"))]
+
+
+def _count(**args):
+    texts = _call("get_order_summary", {"aggregate": "count", "field": "total_amount", **args})
+    return int(texts[0].rsplit("=", 1)[1]), texts[1:]
+
+
+def _counter(name, **labels):
+    key = name + ("{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}" if labels else "")
+    return metrics.snapshot()["counters"].get(key, 0)
+
+
+@pytest.fixture
+def snapshot(database):
+    analytics.build()
+    yield
+    # 等后台重建结束，不让它跨到下一个测试（或会话结束删除临时目录之后）
+    if analytics._builder is not None:
+        analytics._builder.join(30)
+    analytics._last_attempt = float("-inf")
+
+
+def test_fresh_snapshot_serves_reports(snapshot):
+    before = _counter("analytics_queries", tool="get_order_summary")
+    live, note = _count(max_staleness_seconds=0)
+    assert note == []
+    routed, note = _count()
+    assert routed == live
+    assert json.loads(note[0])["数据来源"] == "分析快照"
+    assert _counter("analytics_queries", tool="get_order_summary") == before + 1
+
+
+def test_stale_snapshot_falls_back_and_rebuild_sees_the_write(snapshot):
+    frozen, _ = _count()
+    writer.submit(_insert, "TG_1", "2025-06-01").result(5)
+    # 快照之后的第一条变更记为一小时前：滞后超过 max_staleness_seconds
+    writer.submit(lambda conn: conn.execute(
+        "UPDATE main.order_changes SET changed_at = datetime('now', '-1 hour') WHERE seq > ?",
+        [analytics._state["change_seq"]],
+    )).result(5)
+
+    before = _counter("analytics_fallbacks", reason="stale", tool="get_order_summary")
+    live, note = _count()
+    assert note == [] and live == frozen + 1
+    assert _counter("analytics_fallbacks", reason="stale", tool="get_order_summary") == before + 1
+    # 同时在后台重建（滞后超过 ANALYTICS_REFRESH_SECONDS）
+    analytics._builder.join(30)
+    routed, note = _count()
+    assert note and routed == live
+
+
+def test_frozen_months_include_archived_orders(snapshot, database):
+    archiver = sqlite3.connect(database, isolation_level=None, timeout=30)
+    try:
+        _insert(archiver, "TG_A1", "2012-03-05")
+        _insert(archiver, "TG_A2", "2012-03-20")
+        shards.archive(archiver, "2012")
+    finally:
+        archiver.close()
+
+    analytics.build()
+    copy = sqlite3.connect(ANALYTICS_DB_PATH)
+    try:
+        frozen = copy.execute("SELECT SUM(cnt) FROM order_snapshots WHERE period = '2012-03'").fetchone()[0]
+    finally:
+        copy.close()
+    assert frozen >= 2
+    live, _ = _count(condition="order_date >= '2012-03-01' AND order_date < '2012-04-01'", max_staleness_seconds=0)
+    assert frozen == live
+
+
+def test_concurrent_builds_do_not_collide(snapshot):
+    generation = analytics._state["generation"]
+    with ThreadPoolExecutor(3) as pool:
+        states = list(pool.map(lambda _: analytics.build(), range(3)))
+    assert sorted(state["generation"] for state in states) == [generation + 1, generation + 2, generation + 3]
+    routed, note = _count()
+    assert note and routed == _count(max_staleness_seconds=0)[0]
+
@@ -0,0 +1,90 @@
+"""
+测试查询预算：超出 VM 步数或墙钟时间的查询被 progress handler 中止，超出行数上限的结果被拒绝，
+都返回带缩小查询建议的结构化错误（QUERY_BUDGETS 覆盖为很小的预算）
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from orders_mcp import budget, metrics, tools, writer
+
+# 三张订单表的笛卡尔积：几百万行，远超下面的预算
+EXPENSIVE = "total_amount > (SELECT COUNT(*) FROM orders a, orders b, orders c)"
+
+
+@pytest.fixture
+def budgets(monkeypatch, database):
+    def override(spec):
+        monkeypatch.setattr(budget, "TOOL_OVERRIDES", budget._parse_overrides(spec))
+    return override
+
+
+def _call(name, args):
+    return asyncio.run(tools.call_tool(name, args, client="test"))[0].text
+
+
+def _killed(tool, reason):
+    return metrics.snapshot()["counters"].get(f"queries_killed{{reason={reason},tool={tool}}}", 0)
+
+
+def test_overrides_fall_back_to_class_limits(budgets):
+    budgets("list_orders=1000//5, get_order_summary=2000/20000")
+    heavy = budget.CLASS_LIMITS["heavy"]
+    assert budget.limits_for("list_orders", "normal") == budget.Limits(1000, budget.CLASS_LIMITS["normal"].steps, 5)
+    assert budget.limits_for("get_order_summary", "heavy") == budget.Limits(2000, 20000, heavy.max_rows)
+    assert budget.limits_for("get_products", "cheap") == budget.CLASS_LIMITS["cheap"]
+
+
+def test_step_budget_interrupts_query(budgets):
+    budgets("get_order_summary=60000/200000")
+    killed = _killed("get_order_summary", "steps")
+    error = json.loads(_call("get_order_summary", {"aggregate": "count", "field": "quantity", "condition": EXPENSIVE}))
+    assert error == {
+        "error": "query_budget_exceeded",
+        "tool": "get_order_summary",
+        "reason": "steps",
+        "budget": {"wall_ms": 60000, "steps": 200000, "max_rows": budget.CLASS_LIMITS["heavy"].max_rows},
+        "suggestion": budget.SUGGESTIONS["get_order_summary"],
+    }
+    assert _killed("get_order_summary", "steps") == killed + 1
+
+
+def test_wall_clock_budget_interrupts_query(budgets):
+    budgets("get_order_summary=50")
+    started = time.monotonic()
+    error = json.loads(_call("get_order_summary", {"aggregate": "sum", "field": "total_amount", "condition": EXPENSIVE}))
+    assert time.monotonic() - started < 2
+    assert (error["reason"], error["budget"]["wall_ms"]) == ("time", 50)
+    assert error["suggestion"] == budget.SUGGESTIONS["get_order_summary"]
+
+    # 预算恢复后同一连接照常查询（progress handler 已卸下）
+    budgets("")
+    assert _call("get_order_summary", {"aggregate": "count", "field": "quantity", "condition": "1 = 1"}).startswith("COUNT(quantity) = ")
+
+
+def test_row_limit_rejects_large_results(budgets):
+    budgets("list_orders=5000//5")
+    error = json.loads(_call("list_orders", {"limit": 50}))
+    assert (error["reason"], error["budget"]["max_rows"]) == ("rows", 5)
+    assert error["suggestion"] == budget.SUGGESTIONS["list_orders"]
+    assert _killed("list_orders", "rows") >= 1
+
+    rows = json.loads(_call("list_orders", {"limit": 5}))
+    assert len(rows) == 5
+
+
+@pytest.mark.parametrize("name, args", [
+    ("list_orders", {"limit": 50}),
+    ("get_orders_by_date_range", {"start_date": "2025-01-01", "end_date": "2026-12-31"}),
+    ("search_orders", {"query": "企业", "limit": 50}),
+])
+def test_rejected_rows_release_the_read_lock(budgets, name, args):
+    budgets(f"{name}=5000//5")
+    assert json.loads(_call(name, args))["reason"] == "rows"
+    # 被拒绝的语句已关闭，工作线程的连接不再持有读锁：写线程立即可以提交
+    started = time.monotonic()
+    writer.submit(lambda w: w.execute("UPDATE main.orders SET notes = notes WHERE order_id = 'OR20250001'")).result(5)
+    assert time.monotonic() - started < 1
@@ -0,0 +1,116 @@
+"""
+测试订单变更日志：触发器记录每次增删改，清理触发器只保留最近的变更，
+订阅从游标继续，长轮询与推送都按 seq 顺序投递（写入经单写线程）
+"""
+
+import asyncio
+
+from orders_mcp import changes, writer
+from orders_mcp.db import get_db_connection
+
+
+def _insert(conn, order_id, status="待付款"):
+    conn.execute(
+        "INSERT INTO main.orders VALUES (?, 'C002', 'P002', 1, 9.5, 9.5, '2025-08-08', ?, NULL, NULL)",
+        [order_id, status],
+    )
+
+
+def _set_status(conn, order_id, status):
+    conn.execute("UPDATE main.orders SET status = ? WHERE order_id = ?", [status, order_id])
+
+
+def _delete(conn, order_id):
+    conn.execute("DELETE FROM main.orders WHERE order_id = ?", [order_id])
+
+
+def _events(conn, cursor):
+    rows, gap = changes.read(conn, cursor)
+    assert not gap
+    return [changes.event(row) for row in rows]
+
+
+def test_triggers_record_every_write(conn):
+    cursor = changes.head(conn)
+    writer.submit(_insert, "TE_1").result(10)
+    writer.submit(_set_status, "TE_1", "已付款").result(10)
+    writer.submit(_delete, "TE_1").result(10)
+
+    events = _events(conn, cursor)
+    assert [e["seq"] for e in events] == [cursor + 1, cursor + 2, cursor + 3]
+    assert [(e["op"], e["order_id"], e["status"], e["old_status"]) for e in events] == [
+        ("insert", "TE_1", "待付款", None),
+        ("update", "TE_1", "已付款", "待付款"),
+        ("delete", "TE_1", None, "已付款"),
+    ]
+    assert events[0]["order_date"] == "2025-08-08" and events[0]["customer_id"] == "C002"
+
+
+def test_prune_trigger_keeps_recent_changes(conn):
+    cursor = changes.head(conn)
+
+    def bulk(w, n):
+        w.executemany(
+            "INSERT INTO main.orders VALUES (?, 'C002', 'P002', 1, 1.0, 1.0, '2025-08-09', '待付款', NULL, NULL)",
+            [(f"TE_B{i}",) for i in range(n)],
+        )
+        w.execute("DELETE FROM main.orders WHERE order_id LIKE 'TE_B%'")
+
+    writer.submit(bulk, changes.CHANGE_LOG_MAX_ROWS).result(30)
+    head = changes.head(conn)
+    oldest, count = conn.execute("SELECT MIN(seq), COUNT(*) FROM order_changes").fetchone()
+    assert head - cursor == 2 * changes.CHANGE_LOG_MAX_ROWS
+    assert changes.CHANGE_LOG_MAX_ROWS <= count < changes.CHANGE_LOG_MAX_ROWS + 1000
+    assert oldest == head - count + 1  # 删除的都是最旧的，余下的 seq 连续
+    # 游标之后的变更已被清理：读取时报告缺口，订阅方收到 reset
+    assert changes.read(conn, cursor)[1] is True
+    result = asyncio.run(changes.subscribe(get_db_connection, cursor, seconds=0))
+    assert result["reset"] is True and result["cursor"] == head
+
+
+def test_long_poll_resumes_from_cursor(conn):
+    cursor = changes.head(conn)
+    writer.submit(_insert, "TE_L1").result(10)
+    writer.submit(_insert, "TE_L2").result(10)
+    writer.submit(_set_status, "TE_L1", "已发货").result(10)
+
+    first = asyncio.run(changes.subscribe(get_db_connection, cursor, limit=2, seconds=1))
+    assert [(e["op"], e["order_id"]) for e in first["events"]] == [("insert", "TE_L1"), ("insert", "TE_L2")]
+    assert first["cursor"] == cursor + 2
+    second = asyncio.run(changes.subscribe(get_db_connection, first["cursor"], seconds=1))
+    assert [(e["op"], e["order_id"], e["status"]) for e in second["events"]] == [("update", "TE_L1", "已发货")]
+
+    # 游标之后还没有变更：等到下一次写入
+    async def wait_for_next():
+        waiting = asyncio.create_task(changes.subscribe(get_db_connection, second["cursor"], seconds=5))
+        await asyncio.sleep(0.3)
+        await writer.write(_delete, "TE_L2")
+        return await waiting
+
+    third = asyncio.run(wait_for_next())
+    assert [(e["op"], e["order_id"]) for e in third["events"]] == [("delete", "TE_L2")]
+
+
+def test_push_delivers_ordered_events(conn):
+    cursor = changes.head(conn)
+    received = []
+
+    async def notify(event):
+        received.append(event)
+
+    async def main():
+        subscription = asyncio.create_task(changes.subscribe(
+            get_db_connection, cursor, {"order_id": {"TE_P1"}}, limit=3, seconds=5, notify=notify,
+        ))
+        await asyncio.sleep(0.3)
+        await writer.write(_insert, "TE_P1")
+        await writer.write(_insert, "TE_P2")  # 不匹配筛选条件
+        await writer.write(_set_status, "TE_P1", "已完成")
+        await writer.write(_delete, "TE_P1")
+        return await subscription
+
+    result = asyncio.run(main())
+    assert [(e["op"], e["status"]) for e in received] == [("insert", "待付款"), ("update", "已完成"), ("delete", None)]
+    seqs = [e["seq"] for e in received]
+    assert seqs == sorted(seqs) and seqs[0] > cursor
+    assert result == {"cursor": seqs[-1], "pushed": 3}
@@ -0,0 +1,85 @@
+"""
+测试写工具的幂等键：同一键同样参数的重试返回原结果且不再写入，换了参数的拒绝，过期的键重新执行
+"""
+
+import asyncio
+
+import pytest
+
+from orders_mcp import changes, idempotency, metrics, tools, writer
+
+
+def _insert(conn, order_id):
+    conn.execute(
+        "INSERT INTO main.orders VALUES (?, 'C001', 'P001', 1, 1.0, 1.0, '2025-07-01', '待付款', NULL, NULL)",
+        [order_id],
+    )
+
+
+def _update(order_id, status, key):
+    args = {"order_id": order_id, "new_status": status, "idempotency_key": key}
+    return asyncio.run(tools.call_tool("update_order_status", args, client="test"))[0].text
+
+
+def _status(conn, order_id):
+    return conn.execute("SELECT status FROM orders WHERE order_id = ?", [order_id]).fetchone()[0]
+
+
+def _group_commits():
+    return metrics.snapshot()["counters"].get("group_commits", 0)
+
+
+def test_retry_replays_original_result(conn):
+    writer.submit(_insert, "TI_1").result(10)
+    first = _update("TI_1", "已付款", "ti-key-1")
+    assert first == "✅ 已更新: TI_1 → 已付款"
+
+    # 其间订单被改成别的状态：重试不会把它改回去，也不进写线程
+    writer.submit(lambda w: w.execute("UPDATE main.orders SET status = '已发货' WHERE order_id = 'TI_1'")).result(10)
+    cursor, commits = changes.head(conn), _group_commits()
+    assert _update("TI_1", "已付款", "ti-key-1") == first
+    assert changes.head(conn) == cursor
+    assert _group_commits() == commits
+    assert _status(conn, "TI_1") == "已发货"
+
+
+def test_reused_key_with_other_arguments_is_rejected(conn):
+    writer.submit(_insert, "TI_2").result(10)
+    assert _update("TI_2", "已付款", "ti-key-2").startswith("✅")
+
+    cursor = changes.head(conn)
+    text = _update("TI_2", "已取消", "ti-key-2")
+    assert text.startswith("错误: ") and "ti-key-2" in text
+    assert changes.head(conn) == cursor
+    assert _status(conn, "TI_2") == "已付款"
+
+    args = {"order_id": "TI_2", "new_status": "已取消", "idempotency_key": "ti-key-2"}
+    digest = idempotency.request_digest("update_order_status", args)
+    with pytest.raises(idempotency.KeyConflict):
+        idempotency.lookup(conn, "ti-key-2", digest, "update_order_status")
+
+
+def test_expired_key_runs_again_and_is_pruned(conn):
+    writer.submit(_insert, "TI_3").result(10)
+    assert _update("TI_3", "已付款", "ti-key-3").startswith("✅")
+    writer.submit(lambda w: w.execute("UPDATE main.orders SET status = '待付款' WHERE order_id = 'TI_3'")).result(10)
+
+    # 把记录的时间推到 TTL 之前：重试按新请求执行
+    expired = int(idempotency.TTL_SECONDS) + 60
+    writer.submit(lambda w: w.execute(
+        "UPDATE idempotency_keys SET created_at = created_at - ? WHERE key = 'ti-key-3'", [expired],
+    )).result(10)
+    cursor = changes.head(conn)
+    assert _update("TI_3", "已付款", "ti-key-3").startswith("✅")
+    assert changes.head(conn) == cursor + 1
+    assert _status(conn, "TI_3") == "已付款"
+
+    # 写入时顺带清理过期的键
+    writer.submit(lambda w: w.execute(
+        "UPDATE idempotency_keys SET created_at = created_at - ? WHERE key = 'ti-key-3'", [expired],
+    )).result(10)
+    idempotency._last_prune = 0.0
+    writer.submit(_insert, "TI_4").result(10)
+    assert _update("TI_4", "已付款", "ti-key-4").startswith("✅")
+    keys = {row[0] for row in conn.execute("SELECT key FROM idempotency_keys WHERE key LIKE 'ti-key-%'")}
+    assert "ti-key-3" not in keys and "ti-key-4" in keys
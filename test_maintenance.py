@@ -0,0 +1,28 @@
+"""
+测试完整性检查：回滚日志模式下逐表检查（每张表一个短读事务），WAL 模式下一次检查整个库
+"""
+
+import json
+import sqlite3
+
+from orders_mcp import maintenance
+
+
+def test_wal_checks_whole_database(conn):
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    run = maintenance.run_task("integrity")
+    assert run["result"] == "ok"
+    assert json.loads(run["detail"]) == {"ok": True, "checks": 1}
+
+
+def test_rollback_journal_checks_table_by_table(tmp_path):
+    path = tmp_path / "rollback.db"
+    rollback = sqlite3.connect(path, isolation_level=None)
+    rollback.execute("CREATE TABLE t (x PRIMARY KEY)")
+    rollback.execute("CREATE TABLE u (y)")
+    rollback.execute("INSERT INTO t VALUES (1), (2)")
+    try:
+        assert rollback.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+        assert maintenance._integrity(rollback) == {"ok": True, "checks": 2}
+    finally:
+        rollback.close()
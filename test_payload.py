@@ -0,0 +1,52 @@
+"""
+测试续传令牌：按字节预算翻页时各页合计正好是首次请求的 limit，拼起来与一次取回的结果相同
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from orders_mcp import payload, tools
+
+
+def _call(name, args):
+    return [content.text for content in asyncio.run(tools.call_tool(name, args, client="test"))]
+
+
+def _pages(name, args):
+    rows, token, pages = [], None, 0
+    while True:
+        texts = _call(name, {**args, "continuation_token": token} if token else args)
+        rows.extend(json.loads(texts[0]))
+        pages += 1
+        token = json.loads(texts[1]).get("continuation_token") if len(texts) > 1 else None
+        if token is None:
+            return rows, pages
+
+
+@pytest.mark.parametrize("name, args", [
+    ("list_orders", {"limit": 7, "status": "已完成"}),
+    ("search_orders", {"query": "企业", "limit": 5}),
+])
+def test_pages_stop_at_the_requested_limit(database, name, args):
+    (full,) = _call(name, args)
+    expected = json.loads(full)
+    assert len(expected) == args["limit"]
+
+    rows, pages = _pages(name, {**args, "max_bytes": 300})
+    assert pages > 1
+    assert rows == expected
+
+
+def test_last_page_has_no_token(database):
+    texts = _call("list_orders", {"limit": 2, "max_bytes": 10})
+    assert len(json.loads(texts[0])) == 1
+    token = json.loads(texts[1])["continuation_token"]
+    texts = _call("list_orders", {"limit": 2, "max_bytes": 10, "continuation_token": token})
+    assert len(json.loads(texts[0])) == 1 and len(texts) == 1
+
+    # 剩余条数用完时不再给出令牌
+    rows = [{"id": 1}, {"id": 2}]
+    next_page = json.loads(payload.rows_response("list_orders", rows, {"max_bytes": 10}, limit=1)[1].text)
+    assert next_page == {"truncated": True, "returned": 1}
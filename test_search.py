@@ -0,0 +1,76 @@
+"""
+测试 search_orders 的短词路径：一两个字的词走 orders_grams 倒排索引，不扫描全文表或订单表，
+且触发器随订单、客户名的修改和删除维护索引
+"""
+
+import re
+
+from orders_mcp import queries, search, shards
+
+
+def _plan(conn, text):
+    match, short = search.parse_query(text)
+    sql = queries.search_orders_sql(bool(match), bool(short))
+    params = ([match] if match else []) + ([search.grams_match(short)] if short else []) + [20, 0]
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def _full_scans(plan):
+    """SCAN 行中不带约束的：普通表扫描，或没有 MATCH / rowid 约束（idxStr 为空）的虚拟表扫描"""
+    return [line for line in plan if line.startswith("SCAN") and not re.search(r"VIRTUAL TABLE INDEX \d+:\S", line)]
+
+
+def _order_ids(conn, text):
+    return {row["order_id"] for row in search.search_orders(conn, text, 1000, 0)}
+
+
+def test_short_terms_use_gram_index(conn):
+    for text in ("美", "美团", "阿里 京", "华为技术 深"):
+        plan = _plan(conn, text)
+        assert any("orders_grams" in line for line in plan), plan
+        assert _full_scans(plan) == [], (text, plan)
+
+
+def test_fallback_filter_is_a_full_scan(conn):
+    """没有 orders_grams 的分支（旧分片）逐行过滤，检测方法能识别出来"""
+    sql = queries.search_orders_sql(False, True, ("main",), ())
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, ['["美"]', 20, 0])]
+    assert _full_scans(plan)
+
+
+def test_short_terms_match_substring_filter(conn):
+    """索引结果与逐行子串过滤一致"""
+    for term in ("阿", "京", "1", "号", "团"):
+        expected = set()
+        for schema in shards.search_schemas(conn):  # 主库与已挂载的分片（全文索引行以各库 order_facts 的 rowid 为键）
+            expected |= {row[0] for row in conn.execute(
+                f"SELECT o.order_id FROM {schema}.orders_fts f JOIN {schema}.order_facts o ON o.rowid = f.rowid"
+                " WHERE instr(lower(ifnull(f.customer_name, '') || ' ' || ifnull(f.product_name, '') || ' '"
+                " || ifnull(f.shipping_address, '') || ' ' || ifnull(f.notes, '')), ?) > 0", [term])}
+        assert _order_ids(conn, term) == expected, term
+
+
+def test_gram_index_follows_writes(conn):
+    with conn:
+        conn.execute("INSERT INTO customers (customer_id, customer_name, region_id) VALUES ('CT_S1', '青鸟', 'R001')")
+        conn.execute(
+            "INSERT INTO main.orders VALUES ('TS_S1', 'CT_S1', 'P001', 1, 10.0, 10.0, '2025-05-01', '待付款', '测试路', '备注Qz')"
+        )
+    assert _order_ids(conn, "qz") == {"TS_S1"}
+    assert _order_ids(conn, "青鸟") == {"TS_S1"}
+
+    with conn:
+        conn.execute("UPDATE main.orders SET notes = '备注Wy' WHERE order_id = 'TS_S1'")
+    assert _order_ids(conn, "qz") == set()
+    assert _order_ids(conn, "wy") == {"TS_S1"}
+
+    with conn:
+        conn.execute("UPDATE customers SET customer_name = '白鹭' WHERE customer_id = 'CT_S1'")
+    assert _order_ids(conn, "青鸟") == set()
+    assert _order_ids(conn, "白鹭") == {"TS_S1"}
+
+    with conn:
+        conn.execute("DELETE FROM main.orders WHERE order_id = 'TS_S1'")
+        conn.execute("DELETE FROM customers WHERE customer_id = 'CT_S1'")
+    assert _order_ids(conn, "wy") == set()
+    assert _order_ids(conn, "白鹭") == set()
@@ -0,0 +1,175 @@
+"""
+测试按时间分片归档：归档是原子的，中断留下的分片文件不影响重试，同一周期可追加归档，
+TEMP 视图合并主库与分片，已归档订单不能修改，旧格式分片启动时转换为紧凑编码
+"""
+
+import asyncio
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from orders_mcp import shards, tools
+
+BASE_DIR = Path(__file__).resolve().parent
+
+
+def _insert(conn, order_id, order_date):
+    conn.execute(
+        "INSERT INTO orders VALUES (?, 'C001', 'P001', 2, 50.0, 100.0, ?, '已完成', '测试路1号', NULL)",
+        [order_id, order_date],
+    )
+
+
+@pytest.fixture
+def archiver(database):
+    """归档用的普通连接（与 archive_orders.py 相同：isolation_level=None，不带 TEMP 视图）"""
+    conn = sqlite3.connect(database, isolation_level=None, timeout=30)
+    yield conn
+    conn.close()
+
+
+def _ids(conn, schema, table, prefix):
+    return {row[0] for row in conn.execute(f"SELECT order_id FROM {schema}.{table} WHERE order_id LIKE ?", [prefix + "%"])}
+
+
+def _shard_ids(conn, period, table, prefix):
+    path = shards.registered_path(conn, period)
+    if path is None:
+        return set()
+    shard = sqlite3.connect(path)
+    try:
+        return _ids(shard, "main", table, prefix)
+    finally:
+        shard.close()
+
+
+def _call(name, args):
+    return asyncio.run(tools.call_tool(name, args, client="test"))[0].text
+
+
+def test_archive_moves_period_and_appends_later_orders(archiver):
+    _insert(archiver, "TA_1", "2018-03-01")
+    _insert(archiver, "TA_2", "2018-11-30")
+    _insert(archiver, "TA_3", "2019-01-01")
+
+    assert shards.archive(archiver, "2018") == 2
+    assert _ids(archiver, "main", "orders", "TA_") == {"TA_3"}
+    assert _ids(archiver, "main", "order_facts", "TA_") == {"TA_3"}
+    assert _shard_ids(archiver, "2018", "order_facts", "TA_") == {"TA_1", "TA_2"}
+
+    # 补录的订单并入已有分片
+    from orders_mcp.db import get_db_connection
+
+    reader = get_db_connection()
+    shards.sync(reader)
+    first = shards.registered_path(archiver, "2018")
+    _insert(archiver, "TA_4", "2018-06-15")
+    assert shards.archive(archiver, "2018") == 1
+    assert shards.registered_path(archiver, "2018") != first and not first.exists()
+    assert _shard_ids(archiver, "2018", "order_facts", "TA_") == {"TA_1", "TA_2", "TA_4"}
+    # 已挂载旧分片的连接切到新文件
+    shards.sync(reader)
+    assert _ids(reader, "temp", "orders", "TA_") == {"TA_1", "TA_2", "TA_3", "TA_4"}
+    state, count = archiver.execute("SELECT state, orders FROM order_shards WHERE period = '2018'").fetchone()
+    assert (state, count) == ("archived", 3)
+
+
+def test_failed_archive_changes_nothing(archiver):
+    _insert(archiver, "TB_1", "2017-05-01")
+    _insert(archiver, "TB_2", "2017-08-01")
+    # 分片已提交、主库删除时失败：主库事务回滚，新分片文件删除，登记不变
+    archiver.execute("""
+        CREATE TEMP TRIGGER fail_archive BEFORE DELETE ON main.order_facts WHEN old.order_id = 'TB_2'
+        BEGIN SELECT RAISE(ABORT, 'boom'); END
+    """)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        shards.archive(archiver, "2017")
+    assert _ids(archiver, "main", "orders", "TB_") == {"TB_1", "TB_2"}
+    assert _ids(archiver, "main", "order_facts", "TB_") == {"TB_1", "TB_2"}
+    assert not shards.shard_path("2017").exists()
+    assert archiver.execute("SELECT 1 FROM order_shards WHERE period = '2017'").fetchone() is None
+
+
+def test_archive_replaces_leftover_shard_file(archiver):
+    _insert(archiver, "TF_1", "2014-05-01")
+    _insert(archiver, "TF_2", "2014-08-01")
+    # 上次归档在主库提交前中断，留下未登记的分片文件（其中已有同号订单）
+    shards._create_shard(archiver, shards.shard_path("2014"))
+    archiver.execute("ATTACH DATABASE ? AS archive", [str(shards.shard_path("2014"))])
+    archiver.execute("INSERT INTO archive.order_facts SELECT * FROM main.order_facts WHERE order_id = 'TF_2'")
+    archiver.execute("DETACH DATABASE archive")
+
+    assert shards.archive(archiver, "2014") == 2
+    assert _ids(archiver, "main", "orders", "TF_") == set()
+    assert _shard_ids(archiver, "2014", "order_facts", "TF_") == {"TF_1", "TF_2"}
+
+
+def test_views_union_main_and_shards(archiver):
+    _insert(archiver, "TC_1", "2016-02-01")
+    _insert(archiver, "TC_2", "2016-09-01")
+    shards.archive(archiver, "2016")
+    _insert(archiver, "TC_3", "2025-07-01")
+
+    detail = _call("get_order_detail", {"order_id": "TC_1"})
+    assert "TC_1" in detail and "2016-02-01" in detail
+    listed = _call("get_orders_by_date_range", {"start_date": "2016-01-01", "end_date": "2016-12-31"})
+    assert "TC_1" in listed and "TC_2" in listed
+
+    from orders_mcp.db import get_db_connection
+
+    conn = get_db_connection()
+    shards.sync(conn)
+    assert _ids(conn, "temp", "orders", "TC_") == {"TC_1", "TC_2", "TC_3"}
+    assert _ids(conn, "temp", "order_facts", "TC_") == {"TC_1", "TC_2", "TC_3"}
+
+
+def test_archived_orders_are_read_only(archiver):
+    _insert(archiver, "TD_1", "2015-04-01")
+    shards.archive(archiver, "2015")
+
+    text = _call("update_order_status", {"order_id": "TD_1", "new_status": "已取消"})
+    assert text.startswith("订单已归档")
+    assert "已完成" in _call("get_order_detail", {"order_id": "TD_1"})
+
+
+def test_legacy_shard_is_converted(archiver):
+    # 紧凑编码之前归档的分片：orders 为文本表，全文索引以它的 rowid 为键
+    legacy = shards.shard_path("2011")
+    legacy.parent.mkdir(parents=True, exist_ok=True)
+    shard = sqlite3.connect(legacy)
+    (ddl,) = sqlite3.connect(BASE_DIR / "orders.db").execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'orders'"
+    ).fetchone()
+    with shard:
+        shard.execute(ddl)
+        shard.execute("CREATE VIRTUAL TABLE orders_fts USING fts5("
+                      "order_id UNINDEXED, customer_name, product_name, shipping_address, notes, tokenize = 'trigram')")
+        shard.executemany(
+            "INSERT INTO orders (rowid, order_id, customer_id, product_id, quantity, unit_price, total_amount,"
+            " order_date, status, shipping_address, notes) VALUES (?, ?, 'C001', 'P001', 2, 50.0, 100.25, ?, ?, NULL, ?)",
+            [(7, "TH_1", "2011-02-03", "已完成", "旧分片甲"), (9, "TH_2", "2011-12-31", "已退货", "旧分片乙")],
+        )
+        shard.execute("INSERT INTO orders_fts (rowid, order_id, notes) SELECT rowid, order_id, notes FROM orders")
+    shard.close()
+    archiver.execute(
+        "INSERT INTO order_shards (period, start_date, end_date, path, orders, state)"
+        " VALUES ('2011', '2011-01-01', '2012-01-01', ?, 2, 'archived')", [legacy.name]
+    )
+
+    assert shards.migrate(archiver) == 1
+    assert not legacy.exists()
+    assert _shard_ids(archiver, "2011", "order_facts", "TH_") == {"TH_1", "TH_2"}
+    assert shards.migrate(archiver) == 0
+
+    from orders_mcp.db import get_db_connection
+
+    conn = get_db_connection()
+    shards.sync(conn)
+    rows = conn.execute(
+        "SELECT order_id, total_amount, order_date, status FROM orders WHERE order_id LIKE 'TH_%' ORDER BY order_id"
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [("TH_1", 100.25, "2011-02-03", "已完成"),
+                                            ("TH_2", 100.25, "2011-12-31", "已退货")]
+    assert "TH_2" in _call("search_orders", {"query": "旧分片乙"})
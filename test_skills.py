@@ -0,0 +1,38 @@
+"""
+测试 SQL 模板工具执行时只读：执行连接上同样装着 authorizer，写语句在编译阶段被拒绝，执行后连接恢复正常
+"""
+
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from orders_mcp import skills, tools
+from orders_mcp.config import DB_PATH
+from orders_mcp.db import get_db_connection
+
+
+def test_skill_runs_through_views(conn):
+    skills.reload_skills(DB_PATH, tools.BUILTIN_TOOL_NAMES)
+    text = asyncio.run(tools.call_tool("get_orders_by_status", {}, client="test"))[0].text
+    rows = json.loads(text)
+    assert sum(row["订单数"] for row in rows) == conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+
+def test_writes_are_denied_while_a_skill_runs(conn):
+    # 没有经过加载校验的模板
+    skill = {
+        "sql": "UPDATE main.orders SET status = '已取消'",
+        "inputSchema": {"properties": {}, "required": []},
+        "defaults": {},
+        "max_rows": 10,
+    }
+    with pytest.raises(sqlite3.DatabaseError, match="not authorized"):
+        asyncio.run(skills.call_skill(skill, {}, get_db_connection))
+    cancelled, total = conn.execute("SELECT SUM(status = '已取消'), COUNT(*) FROM orders").fetchone()
+    assert cancelled < total
+
+    # authorizer 已卸下：同一连接上的普通语句（含 TEMP 对象）照常执行
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS skill_probe (x)")
+    conn.execute("DROP TABLE temp.skill_probe")
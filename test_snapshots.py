@@ -0,0 +1,56 @@
+"""
+测试月度快照：读路径不写数据库，快照之后改动过的已冻结月份改为实时扫描，结果始终与全表扫描一致；
+快照更新在单写线程上执行
+"""
+
+from orders_mcp import changes, snapshots, writer
+
+EXACT = "SELECT round(SUM(total_amount), 2), COUNT(*), MAX(total_amount) FROM orders"
+
+
+def _summary(conn):
+    return (
+        snapshots.order_summary(conn, "sum", "total_amount"),
+        snapshots.order_summary(conn, "count", "quantity"),
+        snapshots.order_summary(conn, "max", "total_amount"),
+    )
+
+
+def _insert(conn, order_id, order_date, amount):
+    conn.execute(
+        "INSERT INTO main.orders VALUES (?, 'C001', 'P001', 1, ?, ?, ?, '待付款', NULL, NULL)",
+        [order_id, amount, amount, order_date],
+    )
+
+
+def test_reads_never_write_and_stay_exact(conn):
+    snapshots.request_refresh().result()
+    assert snapshots._view(conn) == (snapshots.frozen_through(conn), "[]")
+
+    # 改动一个已冻结的月份：快照已过期，读路径实时扫描该月，不在读连接上重算
+    writer.submit(_insert, "TSN_1", "2023-02-03", 98765.43).result()
+    before = conn.total_changes
+    frozen, months = snapshots._view(conn)
+    assert months == '["2023-02"]'
+    assert _summary(conn) == tuple(conn.execute(EXACT).fetchone())
+    assert conn.total_changes == before
+
+    # 写线程上的更新重算该月并推进游标
+    snapshots.request_refresh().result()
+    assert snapshots._view(conn) == (frozen, "[]")
+    assert snapshots._change_cursor(conn) == changes.head(conn)
+    assert _summary(conn) == tuple(conn.execute(EXACT).fetchone())
+
+    writer.submit(lambda w: w.execute("DELETE FROM main.orders WHERE order_id = 'TSN_1'")).result()
+    assert _summary(conn) == tuple(conn.execute(EXACT).fetchone())
+    snapshots.request_refresh().result()
+
+
+def test_missing_snapshot_scans_live(conn):
+    snapshots.request_refresh().result()
+    writer.submit(lambda w: w.execute("DELETE FROM snapshot_meta")).result()
+    assert snapshots._view(conn) == (snapshots.EARLIEST, "[]")
+    assert _summary(conn) == tuple(conn.execute(EXACT).fetchone())
+    snapshots.request_refresh().result()
+    assert snapshots.frozen_through(conn) is not None
+    assert _summary(conn) == tuple(conn.execute(EXACT).fetchone())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+测试 stdio 模式冷启动耗时：从启动进程到第一次工具调用返回
+
+stdio MCP 客户端每次会话都会重新拉起进程，这段时间直接影响首个回答的延迟。
+预算可用 STARTUP_BUDGET_SECONDS 调整。
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "5"))
+
+
+def _send(proc, message):
+    proc.stdin.write(json.dumps(message) + "\n")
+    proc.stdin.flush()
+
+
+def _read_response(proc, request_id):
+    while True:
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError(f"server exited: {proc.stderr.read()[:500]}")
+        message = json.loads(line)
+        if message.get("id") == request_id:
+            return message
+
+
+def measure_cold_start():
+    """返回 (首次工具调用耗时秒, 工具返回文本)"""
+    # 启动时会补建索引等，使用数据库副本，不改动仓库中的 orders.db；追踪等日志也写到临时目录
+    workdir = Path(tempfile.mkdtemp())
+    shutil.copy(BASE_DIR / "orders.db", workdir / "orders.db")
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, str(BASE_DIR / "mcp_server.py")],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        cwd=str(BASE_DIR),
+        env={**os.environ, "DB_PATH": str(workdir / "orders.db"), "LOG_DIR": str(workdir / "logs")},
+    )
+    try:
+        _send(proc, {
+            "jsonrpc": "2.0", "id": 1, "method": "initialize",
+            "params": {"protocolVersion": "2025-06-18", "capabilities": {},
+                       "clientInfo": {"name": "startup-test", "version": "1.0"}},
+        })
+        _read_response(proc, 1)
+        _send(proc, {"jsonrpc": "2.0", "method": "notifications/initialized"})
+        _send(proc, {
+            "jsonrpc": "2.0", "id": 2, "method": "tools/call",
+            "params": {"name": "get_order_summary", "arguments": {"aggregate": "count", "field": "quantity"}},
+        })
+        response = _read_response(proc, 2)
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.stdin.close()
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return elapsed, response["result"]["content"][0]["text"]
+
+
+def test_stdio_cold_start_within_budget():
+    elapsed, text = measure_cold_start()
+    print(f"⏱  cold start → first tool call: {elapsed:.3f}s ({text})")
+    assert text.startswith("COUNT(quantity)")
+    assert elapsed < STARTUP_BUDGET_SECONDS
+
+
+def test_core_does_not_load_http_or_chart_modules():
+    """stdio 用到的模块不应导入 FastAPI 或图表渲染"""
+    code = (
+        "import sys, mcp_server; "
+        "print(','.join(m for m in ('fastapi', 'orders_mcp.charts') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=str(BASE_DIR))
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == ""
+
+
+if __name__ == "__main__":
+    test_core_does_not_load_http_or_chart_modules()
+    test_stdio_cold_start_within_budget()
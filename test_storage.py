@@ -0,0 +1,66 @@
+"""
+测试订单存储的紧凑编码：旧格式的 orders 表原地转换后，orders 视图读出的行与原表相同，
+全文索引的键（rowid）不变；经视图的写入编码后落到 order_facts，只接受 YYYY-MM-DD 日期
+"""
+
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from orders_mcp import db
+
+BASE_DIR = Path(__file__).resolve().parent
+
+
+def test_migration_keeps_rows_and_rowids(tmp_path):
+    path = tmp_path / "orders.db"
+    shutil.copy(BASE_DIR / "orders.db", path)
+    conn = sqlite3.connect(path)
+    before = conn.execute("SELECT rowid, * FROM orders ORDER BY order_id").fetchall()
+
+    assert db.migrate_orders(conn)
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'orders'").fetchone() == ("view",)
+    assert conn.execute("PRAGMA user_version").fetchone() == (db.ORDERS_VERSION,)
+    rows = conn.execute("SELECT * FROM orders ORDER BY order_id").fetchall()
+    assert rows == [row[1:] for row in before]
+    rowids = conn.execute("SELECT rowid, order_id FROM order_facts ORDER BY order_id").fetchall()
+    assert rowids == [row[:2] for row in before]
+    assert not db.migrate_orders(conn)
+    conn.close()
+
+
+def test_migration_rejects_unparseable_dates(tmp_path):
+    path = tmp_path / "orders.db"
+    shutil.copy(BASE_DIR / "orders.db", path)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE orders SET order_date = '2025/01/02' WHERE rowid = 1")
+
+    with pytest.raises(ValueError, match="1 条订单"):
+        db.migrate_orders(conn)
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'orders'").fetchone() == ("table",)
+    conn.close()
+
+
+def test_writes_through_the_view_are_encoded(conn):
+    conn.execute(
+        "INSERT INTO main.orders VALUES ('TS_E1', 'C001', 'P001', 3, 19.99, 59.97, '2025-02-03', '已付款', NULL, NULL)"
+    )
+    conn.execute("UPDATE main.orders SET status = '已发货', total_amount = 60.1 WHERE order_id = 'TS_E1'")
+    row = conn.execute(
+        "SELECT unit_price_cents, amount_cents, date(order_day + 2440587.5), s.name"
+        " FROM main.order_facts f JOIN statuses s ON s.code = f.status_code WHERE order_id = 'TS_E1'"
+    ).fetchone()
+    assert tuple(row) == (1999, 6010, "2025-02-03", "已发货")
+    assert tuple(conn.execute("SELECT total_amount, status FROM main.orders WHERE order_id = 'TS_E1'").fetchone()) \
+        == (60.1, "已发货")
+
+    with pytest.raises(sqlite3.IntegrityError, match="YYYY-MM-DD"):
+        conn.execute(
+            "INSERT INTO main.orders VALUES ('TS_E2', 'C001', 'P001', 1, 1.0, 1.0, '2025-2-3', '已付款', NULL, NULL)"
+        )
+    conn.execute("DELETE FROM main.orders WHERE order_id = 'TS_E1'")
+    conn.commit()
+    assert conn.execute("SELECT 1 FROM main.order_facts WHERE order_id LIKE 'TS_E%'").fetchone() is None
@@ -0,0 +1,54 @@
+"""
+测试请求追踪的导出：写文件在后台线程完成，调用方不等磁盘；flush() 后追踪与慢请求都已落盘，队列满时丢弃并计数
+"""
+
+import json
+import threading
+
+from orders_mcp import metrics, tracing
+
+
+def _traces(trace_id):
+    if not tracing.TRACE_LOG_PATH.exists():
+        return []
+    lines = tracing.TRACE_LOG_PATH.read_text(encoding="utf-8").splitlines()
+    return [line for line in lines if trace_id in line]
+
+
+def test_export_happens_off_the_calling_thread(monkeypatch):
+    writers, release = [], threading.Event()
+    write = tracing._write
+
+    def slow_write(root):
+        writers.append(threading.current_thread().name)
+        release.wait(5)
+        write(root)
+
+    monkeypatch.setattr(tracing, "_write", slow_write)
+    monkeypatch.setattr(tracing, "SLOW_REQUEST_MS", 0)
+    with tracing.start_trace("test.export", tool="test_export") as root:
+        with tracing.span("stage"):
+            pass
+    # 导出线程还卡在写文件上，调用方已经返回
+    trace_id = root.trace.trace_id
+    assert _traces(trace_id) == []
+    release.set()
+    tracing.flush()
+    assert writers == ["trace-export"]
+    spans = json.loads(_traces(trace_id)[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert {s["name"] for s in spans} == {"test.export", "stage"}
+    assert tracing.read_slow_requests(1, "test_export")[0]["trace_id"] == trace_id
+
+
+def test_full_queue_drops_traces(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(tracing, "_write", lambda root: release.wait(5))
+    before = metrics.snapshot()["counters"].get("traces_dropped", 0)
+    try:
+        for _ in range(tracing.TRACE_EXPORT_QUEUE + 2):
+            with tracing.start_trace("test.drop"):
+                pass
+        assert metrics.snapshot()["counters"].get("traces_dropped", 0) >= before + 1
+    finally:
+        release.set()
+        tracing.flush()
@@ -0,0 +1,33 @@
+"""
+测试趋势缓存有界：状态筛选只接受订单状态，缓存按 LRU 保留最近用到的桶，淘汰后结果不变
+"""
+
+import asyncio
+from datetime import date
+
+from orders_mcp import tools, trend
+
+TODAY = date(2026, 3, 1)
+
+
+def test_unknown_status_is_rejected(database):
+    text = asyncio.run(tools.call_tool("get_order_trend", {"status": "no-such-status"}, client="test"))[0].text
+    assert text.startswith("无效状态")
+
+
+def test_cache_keeps_recent_buckets(conn, monkeypatch):
+    monkeypatch.setattr(trend, "CACHE_MAX_BUCKETS", 10)
+    trend.clear_cache()
+    start, end = date(2025, 3, 1), date(2025, 3, 31)
+    first = trend.bucket_values(conn, "day", start, end, "已完成", today=TODAY)
+    assert len(trend._cache) == 10
+    assert {key[2] for key in trend._cache} == {date(2025, 3, day) for day in range(22, 32)}
+
+    # 命中的桶移到末尾，新桶挤掉最久未用的
+    trend.bucket_values(conn, "day", date(2025, 3, 22), date(2025, 3, 22), "已完成", today=TODAY)
+    trend.bucket_values(conn, "month", date(2025, 1, 1), date(2025, 2, 28), today=TODAY)
+    assert len(trend._cache) == 10
+    assert ("day", "已完成", date(2025, 3, 22)) in trend._cache
+    assert ("day", "已完成", date(2025, 3, 23)) not in trend._cache
+    assert trend.bucket_values(conn, "day", start, end, "已完成", today=TODAY) == first
+    trend.clear_cache()
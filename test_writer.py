@@ -0,0 +1,117 @@
+"""
+测试单写线程的组提交：并发写入合并成一次提交，批内出错的写入只回滚自己，异常交给各自的调用方，
+未结束的读事务不挡提交
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from orders_mcp import metrics, writer
+
+
+def _insert(conn, order_id):
+    conn.execute(
+        "INSERT INTO main.orders VALUES (?, 'C001', 'P001', 1, 1.0, 1.0, '2025-06-01', '待付款', NULL, NULL)",
+        [order_id],
+    )
+    return order_id
+
+
+def _insert_then_fail(conn, order_id):
+    _insert(conn, order_id)
+    raise ValueError("job failed")
+
+
+def _committed(database, order_ids):
+    """用独立连接读取已提交的订单号"""
+    conn = sqlite3.connect(database)
+    try:
+        marks = ",".join("?" * len(order_ids))
+        return {row[0] for row in conn.execute(f"SELECT order_id FROM orders WHERE order_id IN ({marks})", order_ids)}
+    finally:
+        conn.close()
+
+
+def _group_commits():
+    return metrics.snapshot()["counters"].get("group_commits", 0)
+
+
+def _blocked_writer():
+    """让写线程停在一个写入里，返回 (放行事件, 该写入的 Future)；期间提交的写入会凑成下一批"""
+    started, release = threading.Event(), threading.Event()
+
+    def block(conn):
+        started.set()
+        release.wait(10)
+
+    future = writer.submit(block)
+    assert started.wait(10)
+    return release, future
+
+
+def test_concurrent_writes_share_one_commit(database):
+    order_ids = [f"TW_G{i}" for i in range(20)]
+    before = _group_commits()
+
+    async def main():
+        release, blocker = _blocked_writer()
+        pending = [asyncio.ensure_future(writer.write(_insert, order_id)) for order_id in order_ids]
+        await asyncio.sleep(0.05)  # 让所有写入进入队列
+        release.set()
+        blocker.result(10)
+        return await asyncio.gather(*pending)
+
+    assert asyncio.run(main()) == order_ids
+    assert _group_commits() - before == 2  # 阻塞的写入一批，其余 20 个一批
+    assert _committed(database, order_ids) == set(order_ids)
+
+
+def test_failed_job_rolls_back_only_itself(database):
+    release, blocker = _blocked_writer()
+    ok_first = writer.submit(_insert, "TW_S1")
+    failing = writer.submit(_insert_then_fail, "TW_S2")
+    ok_last = writer.submit(_insert, "TW_S3")
+    release.set()
+    blocker.result(10)
+
+    assert ok_first.result(10) == "TW_S1"
+    assert ok_last.result(10) == "TW_S3"
+    with pytest.raises(ValueError, match="job failed"):
+        failing.result(10)
+    assert _committed(database, ["TW_S1", "TW_S2", "TW_S3"]) == {"TW_S1", "TW_S3"}
+
+
+def test_errors_reach_the_caller(database):
+    with pytest.raises(ValueError, match="job failed"):
+        writer.submit(_insert_then_fail, "TW_E1").result(10)
+    assert _committed(database, ["TW_E1"]) == set()
+
+    writer.submit(_insert, "TW_E2").result(10)
+
+    async def duplicate():
+        await writer.write(_insert, "TW_E2")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        asyncio.run(duplicate())
+
+
+def test_commit_while_long_read_is_open(database):
+    reader = sqlite3.connect(database, isolation_level=None)
+    try:
+        reader.execute("BEGIN")
+        cursor = reader.execute("SELECT order_id FROM orders")
+        cursor.fetchmany(10)  # 读事务停在扫描中途
+        started = time.perf_counter()
+        assert writer.submit(_insert, "TW_READ").result(5) == "TW_READ"
+        assert time.perf_counter() - started < 1
+        assert _committed(database, ["TW_READ"]) == {"TW_READ"}
+        # 读者仍看到自己的快照
+        assert reader.execute("SELECT COUNT(*) FROM orders WHERE order_id = 'TW_READ'").fetchone()[0] == 0
+    finally:
+        reader.execute("ROLLBACK")
+        reader.close()
+